@@ -5,15 +5,17 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 from django.urls import path
 
-from realtime.routing import websocket_urlpatterns
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 django_asgi_app = get_asgi_application()
 
+# Imported once the app registry is ready: the dashboard consumer pulls in DRF views.
+from dashboards.routing import websocket_urlpatterns as dashboard_websocket_urlpatterns  # noqa: E402
+from realtime.routing import websocket_urlpatterns  # noqa: E402
+
 application = ProtocolTypeRouter(
     {
         'http': django_asgi_app,
-        'websocket': AuthMiddlewareStack(URLRouter(websocket_urlpatterns)),
+        'websocket': AuthMiddlewareStack(URLRouter(websocket_urlpatterns + dashboard_websocket_urlpatterns)),
     }
 )
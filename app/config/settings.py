@@ -122,10 +122,34 @@ SPECTACULAR_SETTINGS = {
 
 MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
 MONGO_DB = os.environ.get('MONGO_DB', 'abdb')
+MONGO_TRANSACTIONS = os.environ.get('MONGO_TRANSACTIONS', '0') == '1'
 
 NEO4J_URI = os.environ.get('NEO4J_URI', 'bolt://localhost:7687')
 NEO4J_USER = os.environ.get('NEO4J_USER', 'neo4j')
 NEO4J_PASSWORD = os.environ.get('NEO4J_PASSWORD', 'neo4jpass')
+NEO4J_MAX_POOL_SIZE = int(os.environ.get('NEO4J_MAX_POOL_SIZE', '50'))
+NEO4J_ACQUISITION_TIMEOUT = float(os.environ.get('NEO4J_ACQUISITION_TIMEOUT', '10'))
+NEO4J_CONNECTION_TIMEOUT = float(os.environ.get('NEO4J_CONNECTION_TIMEOUT', '5'))
+NEO4J_MAX_CONNECTION_LIFETIME = int(os.environ.get('NEO4J_MAX_CONNECTION_LIFETIME', '3600'))
+NEO4J_MAX_RETRY_TIME = float(os.environ.get('NEO4J_MAX_RETRY_TIME', '15'))
+NEO4J_FETCH_SIZE = int(os.environ.get('NEO4J_FETCH_SIZE', '1000'))
+NEO4J_QUERY_TIMEOUT = float(os.environ.get('NEO4J_QUERY_TIMEOUT', '10'))
+NEO4J_GDS_TIMEOUT = float(os.environ.get('NEO4J_GDS_TIMEOUT', '300'))
+RECO_LISTEN_BATCH_CHUNK_SIZE = int(os.environ.get('RECO_LISTEN_BATCH_CHUNK_SIZE', '500'))
+RECO_LISTEN_WRITE_BEHIND = os.environ.get('RECO_LISTEN_WRITE_BEHIND', '0') == '1'
+RECO_LISTEN_FLUSH_SIZE = int(os.environ.get('RECO_LISTEN_FLUSH_SIZE', '500'))
+RECO_LISTEN_FLUSH_INTERVAL = float(os.environ.get('RECO_LISTEN_FLUSH_INTERVAL', '1.0'))
+RECO_LISTEN_CLAIM_IDLE_MS = int(os.environ.get('RECO_LISTEN_CLAIM_IDLE_MS', '60000'))
+RECO_HYBRID_DEADLINE_MS = int(os.environ.get('RECO_HYBRID_DEADLINE_MS', '2000'))
+RECO_MATERIALIZED_TTL = int(os.environ.get('RECO_MATERIALIZED_TTL', '172800'))
+RECO_ACTIVE_DAYS = int(os.environ.get('RECO_ACTIVE_DAYS', '30'))
+RECO_GENERATION_GRACE = int(os.environ.get('RECO_GENERATION_GRACE', '60'))
+RECO_COMMUNITY_GRAPH = os.environ.get('RECO_COMMUNITY_GRAPH', 'abdb_listens')
+RECO_COMMUNITY_INTERVAL = float(os.environ.get('RECO_COMMUNITY_INTERVAL', '300'))
+# Empty disables the in-memory engine.
+RECO_ENGINE_PATH = os.environ.get('RECO_ENGINE_PATH', '')
+RECO_ENGINE_TOP_K = int(os.environ.get('RECO_ENGINE_TOP_K', '50'))
+RECO_ENGINE_RELOAD_INTERVAL = float(os.environ.get('RECO_ENGINE_RELOAD_INTERVAL', '5'))
 
 OTP_TTL_SECONDS = int(os.environ.get('OTP_TTL_SECONDS', '120'))
 OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', '3'))
@@ -138,4 +162,25 @@ RATE_LIMIT_OTP_REQUEST = int(os.environ.get('RATE_LIMIT_OTP_REQUEST', '3'))
 CACHE_PING_TTL = int(os.environ.get('CACHE_PING_TTL', '30'))
 
 DASHBOARD_DAYS = int(os.environ.get('DASHBOARD_DAYS', '14'))
-
+DASHBOARD_SOURCE = os.environ.get('DASHBOARD_SOURCE', 'rollups')
+DASHBOARD_MAX_TIME_MS = int(os.environ.get('DASHBOARD_MAX_TIME_MS', '5000'))
+DASHBOARD_PUSH_INTERVAL = float(os.environ.get('DASHBOARD_PUSH_INTERVAL', '1.0'))
+DASHBOARD_CACHE_SOFT_TTL = int(os.environ.get('DASHBOARD_CACHE_SOFT_TTL', '15'))
+DASHBOARD_CACHE_HARD_TTL = int(os.environ.get('DASHBOARD_CACHE_HARD_TTL', '300'))
+DASHBOARD_CACHE_LOCK_TTL = int(os.environ.get('DASHBOARD_CACHE_LOCK_TTL', '30'))
+
+TRANSCRIPTIONS_PAGE_SIZE = int(os.environ.get('TRANSCRIPTIONS_PAGE_SIZE', '50'))
+TRANSCRIPTIONS_MAX_PAGE_SIZE = int(os.environ.get('TRANSCRIPTIONS_MAX_PAGE_SIZE', '200'))
+TRANSCRIPTIONS_BULK_CHUNK_SIZE = int(os.environ.get('TRANSCRIPTIONS_BULK_CHUNK_SIZE', '500'))
+TRANSCRIPTIONS_EXPORT_BATCH_SIZE = int(os.environ.get('TRANSCRIPTIONS_EXPORT_BATCH_SIZE', '1000'))
+TRANSCRIPTIONS_SEARCH_BACKEND = os.environ.get('TRANSCRIPTIONS_SEARCH_BACKEND', 'mongo')
+TRANSCRIPTIONS_TEXT_STORAGE = os.environ.get('TRANSCRIPTIONS_TEXT_STORAGE', 'inline')
+TRANSCRIPTIONS_TEXT_THRESHOLD = int(os.environ.get('TRANSCRIPTIONS_TEXT_THRESHOLD', '16384'))
+TRANSCRIPTIONS_TEXT_ZLIB_LEVEL = int(os.environ.get('TRANSCRIPTIONS_TEXT_ZLIB_LEVEL', '6'))
+TRANSCRIPTIONS_TEXT_SEARCH_CHARS = int(os.environ.get('TRANSCRIPTIONS_TEXT_SEARCH_CHARS', '8192'))
+TRANSCRIPTIONS_AUTOCOMPLETE_MAX_LIMIT = int(os.environ.get('TRANSCRIPTIONS_AUTOCOMPLETE_MAX_LIMIT', '20'))
+TRANSCRIPTIONS_ASYNC_VIEWS = os.environ.get('TRANSCRIPTIONS_ASYNC_VIEWS', '0') == '1'
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '200'))
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '1.0'))
+OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', '60'))
+OUTBOX_RETENTION_SECONDS = int(os.environ.get('OUTBOX_RETENTION_SECONDS', '86400'))
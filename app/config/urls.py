@@ -3,7 +3,12 @@ from django.urls import include, path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
 from core.views import CachePingView
-from realtime.views import RealtimeCounterView
+from realtime.views import (
+    RealtimeCounterView,
+    RealtimeListenersView,
+    RealtimeSpeakersView,
+    RealtimeTrendingTopicsView,
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -12,6 +17,9 @@ urlpatterns = [
     path('auth/', include('users.urls')),
     path('cache/ping', CachePingView.as_view(), name='cache-ping'),
     path('realtime/counter', RealtimeCounterView.as_view(), name='realtime-counter'),
+    path('realtime/speakers', RealtimeSpeakersView.as_view(), name='realtime-speakers'),
+    path('realtime/listeners/<str:transcription_id>', RealtimeListenersView.as_view(), name='realtime-listeners'),
+    path('realtime/topics/trending', RealtimeTrendingTopicsView.as_view(), name='realtime-trending-topics'),
     path('transcriptions/', include('transcripts.urls')),
     path('reco/', include('recommender.urls')),
     path('dash/', include('dashboards.urls')),
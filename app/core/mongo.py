@@ -1,6 +1,8 @@
+from contextlib import asynccontextmanager, contextmanager
 from functools import lru_cache
 
 from django.conf import settings
+from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
 
 
@@ -11,3 +13,44 @@ def get_mongo_client() -> MongoClient:
 
 def get_mongo_db():
     return get_mongo_client()[settings.MONGO_DB]
+
+
+@lru_cache(maxsize=1)
+def get_async_mongo_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(settings.MONGO_URI)
+
+
+def get_async_mongo_db():
+    return get_async_mongo_client()[settings.MONGO_DB]
+
+
+@contextmanager
+def mongo_transaction():
+    # Multi-document transactions need a replica set; a standalone server gets no session.
+    if not settings.MONGO_TRANSACTIONS:
+        yield None
+        return
+    with get_mongo_client().start_session() as session:
+        with session.start_transaction():
+            yield session
+
+
+# Reads in the session all see one point in time. Snapshot reads need a replica set too;
+# a standalone server reads without a session.
+@contextmanager
+def mongo_snapshot():
+    if not settings.MONGO_TRANSACTIONS:
+        yield None
+        return
+    with get_mongo_client().start_session(snapshot=True) as session:
+        yield session
+
+
+@asynccontextmanager
+async def amongo_transaction():
+    if not settings.MONGO_TRANSACTIONS:
+        yield None
+        return
+    async with await get_async_mongo_client().start_session() as session:
+        async with session.start_transaction():
+            yield session
@@ -1,8 +1,10 @@
+import threading
+import time
 from functools import lru_cache
-from typing import Any, Dict, Iterable
+from typing import Any, Dict, List
 
 from django.conf import settings
-from neo4j import GraphDatabase
+from neo4j import READ_ACCESS, WRITE_ACCESS, GraphDatabase, ManagedTransaction, unit_of_work
 
 
 @lru_cache(maxsize=1)
@@ -10,11 +12,95 @@ def get_driver():
     return GraphDatabase.driver(
         settings.NEO4J_URI,
         auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
+        max_connection_pool_size=settings.NEO4J_MAX_POOL_SIZE,
+        connection_acquisition_timeout=settings.NEO4J_ACQUISITION_TIMEOUT,
+        connection_timeout=settings.NEO4J_CONNECTION_TIMEOUT,
+        max_connection_lifetime=settings.NEO4J_MAX_CONNECTION_LIFETIME,
+        max_transaction_retry_time=settings.NEO4J_MAX_RETRY_TIME,
     )
 
 
-def run_query(query: str, parameters: Dict[str, Any] | None = None) -> Iterable[Dict[str, Any]]:
-    with get_driver().session() as session:
-        result = session.run(query, parameters or {})
-        for record in result:
-            yield record.data()
+# The driver keeps its pool private, so utilisation is tracked around our own calls:
+# every read()/write() holds one pooled connection while it runs.
+class _PoolStats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.in_use = self.peak_in_use = 0
+        self.reads = self.writes = self.retries = self.errors = 0
+        self.total_ms = 0.0
+
+    def acquire(self, access_mode: str) -> None:
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            if access_mode == READ_ACCESS:
+                self.reads += 1
+            else:
+                self.writes += 1
+
+    def release(self, elapsed_ms: float, attempts: int, failed: bool) -> None:
+        with self._lock:
+            self.in_use -= 1
+            self.retries += max(attempts - 1, 0)
+            self.errors += int(failed)
+            self.total_ms += elapsed_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            queries = self.reads + self.writes
+            return {
+                'max_pool_size': settings.NEO4J_MAX_POOL_SIZE,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'utilisation': round(self.in_use / settings.NEO4J_MAX_POOL_SIZE, 3),
+                'reads': self.reads,
+                'writes': self.writes,
+                'retries': self.retries,
+                'errors': self.errors,
+                'avg_ms': round(self.total_ms / queries, 3) if queries else 0.0,
+            }
+
+
+_stats = _PoolStats()
+
+
+def pool_stats() -> Dict[str, Any]:
+    return _stats.snapshot()
+
+
+def _execute(access_mode: str, query: str, parameters: Dict[str, Any] | None, timeout: float | None) -> List[Dict[str, Any]]:
+    attempts = 0
+
+    # Transient failures (leader switch, deadlock, dropped connection) make the driver call
+    # this again until NEO4J_MAX_RETRY_TIME runs out, so it must only read its arguments.
+    @unit_of_work(timeout=timeout if timeout is not None else settings.NEO4J_QUERY_TIMEOUT)
+    def work(tx: ManagedTransaction) -> List[Dict[str, Any]]:
+        nonlocal attempts
+        attempts += 1
+        return [record.data() for record in tx.run(query, parameters or {})]
+
+    _stats.acquire(access_mode)
+    started = time.perf_counter()
+    failed = True
+    try:
+        with get_driver().session(default_access_mode=access_mode, fetch_size=settings.NEO4J_FETCH_SIZE) as session:
+            if access_mode == READ_ACCESS:
+                records = session.execute_read(work)
+            else:
+                records = session.execute_write(work)
+        failed = False
+        return records
+    finally:
+        _stats.release((time.perf_counter() - started) * 1000, attempts, failed)
+
+
+# Records are materialized inside the transaction, which is what makes retries safe.
+def read(query: str, parameters: Dict[str, Any] | None = None, timeout: float | None = None) -> List[Dict[str, Any]]:
+    return _execute(READ_ACCESS, query, parameters, timeout)
+
+
+def write(query: str, parameters: Dict[str, Any] | None = None, timeout: float | None = None) -> List[Dict[str, Any]]:
+    return _execute(WRITE_ACCESS, query, parameters, timeout)
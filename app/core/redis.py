@@ -2,6 +2,7 @@ from functools import lru_cache
 from typing import Any
 
 import redis
+import redis.asyncio
 from django.conf import settings
 
 
@@ -13,3 +14,13 @@ def get_redis_connection() -> redis.Redis:
 def publish(channel: str, message: Any) -> None:
     client = get_redis_connection()
     client.publish(channel, message)
+
+
+@lru_cache(maxsize=1)
+def get_async_redis_connection() -> redis.asyncio.Redis:
+    return redis.asyncio.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+
+async def apublish(channel: str, message: Any) -> None:
+    client = get_async_redis_connection()
+    await client.publish(channel, message)
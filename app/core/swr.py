@@ -0,0 +1,112 @@
+import json
+import logging
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import redis
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .redis import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+# Background refreshes; each key has at most one in flight thanks to the lock.
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='swr-refresh')
+
+
+@dataclass
+class CacheResult:
+    value: Any
+    age: float
+    status: str  # 'hit', 'stale' or 'miss'
+
+
+# Serves stale values past `soft_ttl` while a single lock holder recomputes in the
+# background; entries expire from Redis at `hard_ttl`, which bounds staleness.
+class StaleWhileRevalidateCache:
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, prefix: str, soft_ttl: int, hard_ttl: int, lock_ttl: int, client=None):
+        self.prefix = prefix
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = max(hard_ttl, soft_ttl)
+        self.lock_ttl = lock_ttl
+        self.client = client if client is not None else get_redis_connection()
+
+    def _key(self, key: str) -> str:
+        return f'swr:{self.prefix}:{key}'
+
+    def _lock_key(self, key: str) -> str:
+        return f'swr:{self.prefix}:{key}:lock'
+
+    def _read(self, key: str) -> tuple[Any, float] | None:
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry['value'], max(time.time() - entry['computed_at'], 0.0)
+
+    def _store(self, key: str, value: Any) -> None:
+        entry = json.dumps({'value': value, 'computed_at': time.time()}, cls=DjangoJSONEncoder)
+        self.client.set(self._key(key), entry, ex=self.hard_ttl)
+
+    def _acquire(self, key: str) -> str | None:
+        token = secrets.token_hex(8)
+        if self.client.set(self._lock_key(key), token, nx=True, ex=self.lock_ttl):
+            return token
+        return None
+
+    def _release(self, key: str, token: str) -> None:
+        lock_key = self._lock_key(key)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(lock_key)
+                if pipe.get(lock_key) == token:
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    pipe.execute()
+                else:
+                    pipe.unwatch()
+            except redis.WatchError:
+                pass
+
+    def _recompute(self, key: str, compute: Callable[[], Any], token: str) -> Any:
+        try:
+            value = compute()
+            self._store(key, value)
+            return value
+        finally:
+            self._release(key, token)
+
+    def _refresh(self, key: str, compute: Callable[[], Any], token: str) -> None:
+        try:
+            self._recompute(key, compute, token)
+        except Exception:  # noqa: BLE001
+            logger.exception('Background refresh of %s failed; stale value kept.', self._key(key))
+
+    def get(self, key: str, compute: Callable[[], Any]) -> CacheResult:
+        cached = self._read(key)
+        if cached is not None:
+            value, age = cached
+            if age < self.soft_ttl:
+                return CacheResult(value, age, 'hit')
+            token = self._acquire(key)
+            if token:
+                _refresh_executor.submit(self._refresh, key, compute, token)
+            return CacheResult(value, age, 'stale')
+
+        # Cold or past the hard TTL: only the lock holder computes, the rest wait for it.
+        token = self._acquire(key)
+        if token:
+            return CacheResult(self._recompute(key, compute, token), 0.0, 'miss')
+        deadline = time.monotonic() + self.lock_ttl
+        while time.monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL)
+            cached = self._read(key)
+            if cached is not None:
+                return CacheResult(cached[0], cached[1], 'hit')
+        return CacheResult(compute(), 0.0, 'miss')
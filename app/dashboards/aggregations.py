@@ -0,0 +1,48 @@
+from datetime import datetime
+from typing import Any, Dict, List
+
+
+# Bucket labels match dashboards.rollups so both sources produce the same series.
+BUCKET_FORMATS = {
+    'hour': '%Y-%m-%dT%H:00',
+    'day': '%Y-%m-%d',
+    'week': '%G-W%V',
+}
+
+
+def per_day_pipeline(since: datetime, granularity: str = 'day') -> List[Dict[str, Any]]:
+    return [
+        {'$match': {'created_at': {'$gte': since}}},
+        {
+            '$group': {
+                '_id': {
+                    '$dateToString': {'format': BUCKET_FORMATS[granularity], 'date': '$created_at'}
+                },
+                'count': {'$sum': 1},
+            }
+        },
+        {'$sort': {'_id': 1}},
+    ]
+
+
+def summary_pipeline(since: datetime, granularity: str = 'day', topics_limit: int = 10) -> List[Dict[str, Any]]:
+    # One pass over the collection; distinct speakers are counted server-side instead of
+    # shipping every speaker array to Python inside a single (16MB-capped) group document.
+    facets: Dict[str, List[Dict[str, Any]]] = {
+        'per_day': per_day_pipeline(since),
+        'top_topics': [
+            {'$unwind': '$topics'},
+            {'$group': {'_id': '$topics', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1, '_id': 1}},
+            {'$limit': topics_limit},
+        ],
+        'average_duration': [{'$group': {'_id': None, 'value': {'$avg': '$length_sec'}}}],
+        'distinct_speakers': [
+            {'$unwind': '$speakers'},
+            {'$group': {'_id': '$speakers'}},
+            {'$count': 'value'},
+        ],
+    }
+    if granularity != 'day':
+        facets['series'] = per_day_pipeline(since, granularity)
+    return [{'$facet': facets}]
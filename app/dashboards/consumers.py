@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from core.redis import get_redis_connection
+from .live import DASHBOARD_GROUP, LIVE_SEEDED_KEY, live_snapshot, seed_live_state
+from .rollups import get_rollup_collection, load_rollups
+from .views import cached_summary
+
+
+# `per_day`, `topics` and `seq` come from the live state, not from the cached summary,
+# which can be DASHBOARD_CACHE_HARD_TTL old; the summary only fills the other charts.
+def dashboard_snapshot():
+    client = get_redis_connection()
+    since = datetime.utcnow() - timedelta(days=settings.DASHBOARD_DAYS)
+    if not client.exists(LIVE_SEEDED_KEY):
+        # First dashboard after a deploy: changes landing during the seed may be off by
+        # one until the next `rebuild_dashboard_rollups`.
+        seed_live_state(client, load_rollups(get_rollup_collection(), since))
+    result = cached_summary('day')
+    return {'summary': result.value, 'age': int(result.age), **live_snapshot(client, since)}
+
+
+class DashboardConsumer(AsyncJsonWebsocketConsumer):
+    group_name = DASHBOARD_GROUP
+
+    async def connect(self):
+        # Join before reading the snapshot so no delta pushed in between is lost; the
+        # client drops the deltas whose `seq` the snapshot already includes.
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send_json({'type': 'snapshot', **await sync_to_async(dashboard_snapshot)()})
+
+    async def disconnect(self, close_code):  # noqa: D401, ANN001
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def dashboard_delta(self, event):
+        await self.send_json({'type': 'delta', **event['data']})
@@ -0,0 +1,31 @@
+from typing import Any, Dict, List
+
+from core.redis import get_redis_connection
+from transcripts.outbox import handles
+from .live import buffer_deltas
+from .rollups import Change, apply_rollups, get_rollup_collection
+
+
+def _changes(events: List[Dict[str, Any]]) -> List[Change]:
+    changes = []
+    for event in events:
+        payload = event['payload']
+        if event['type'] == 'transcriptions.created':
+            changes.extend((item['created_at'], None, item) for item in payload['items'])
+        else:
+            changes.append((payload['created_at'], payload['before'], payload.get('after')))
+    return changes
+
+
+@handles('transcriptions.created')
+@handles('transcriptions.updated')
+@handles('transcriptions.deleted')
+def update_rollups(events: List[Dict[str, Any]]) -> None:
+    apply_rollups(get_rollup_collection(), _changes(events))
+
+
+@handles('transcriptions.created')
+@handles('transcriptions.updated')
+@handles('transcriptions.deleted')
+def buffer_dashboard_deltas(events: List[Dict[str, Any]]) -> None:
+    buffer_deltas(get_redis_connection(), _changes(events))
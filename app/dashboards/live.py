@@ -0,0 +1,121 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+from .rollups import Change, _unescape, accumulate
+
+
+DASHBOARD_GROUP = 'dashboard'
+# Pending per-day and per-topic increments, merged by the outbox and drained by one pusher.
+DELTA_BUFFER_KEY = 'dashboard:deltas'
+# Per-day count and topic totals, kept in the same transactions as the buffer so a
+# snapshot can be read consistently with it. The rollups seed them once.
+LIVE_DAY_KEY = 'dashboard:live:{day}'
+LIVE_SEEDED_KEY = 'dashboard:live:seeded'
+# Bumped by every drain: a delta carries the value of its drain, a snapshot the last one.
+DELTA_SEQ_KEY = 'dashboard:seq'
+
+
+def _live_ttl() -> int:
+    return (settings.DASHBOARD_DAYS + 2) * 86400
+
+
+# Buffer fields are `day:<day>` and `topic:<day>:<topic>`; `days` keeps only those days.
+def _totals(pending: Dict[str, str], days: Iterable[str] | None = None) -> Dict[str, Dict[str, int]]:
+    days = set(days) if days is not None else None
+    totals: Dict[str, Dict[str, int]] = {'per_day': defaultdict(int), 'topics': defaultdict(int)}
+    for field, value in pending.items():
+        kind, name = field.split(':', 1)
+        day = name
+        if kind == 'topic':
+            day, name = name.split(':', 1)
+        if days is None or day in days:
+            totals['per_day' if kind == 'day' else 'topics'][name] += int(value)
+    return totals
+
+
+def buffer_deltas(client, changes: Iterable[Change]) -> None:
+    pipe = client.pipeline(transaction=True)
+    for day, bucket in accumulate(changes).items():
+        live_key = LIVE_DAY_KEY.format(day=day)
+        if bucket['count']:
+            pipe.hincrby(DELTA_BUFFER_KEY, f'day:{day}', bucket['count'])
+            pipe.hincrby(live_key, 'count', bucket['count'])
+        for topic, value in bucket['topics'].items():
+            if value:
+                pipe.hincrby(DELTA_BUFFER_KEY, f'topic:{day}:{_unescape(topic)}', value)
+                pipe.hincrby(live_key, f'topic:{_unescape(topic)}', value)
+        pipe.expire(live_key, _live_ttl())
+    pipe.execute()
+
+
+def seed_live_state(client, rollups: List[Dict[str, Any]]) -> None:
+    pipe = client.pipeline(transaction=True)
+    for rollup in rollups:
+        live_key = LIVE_DAY_KEY.format(day=rollup['_id'])
+        fields = {f'topic:{_unescape(topic)}': value for topic, value in rollup.get('topics', {}).items() if value}
+        fields['count'] = rollup.get('count', 0)
+        pipe.delete(live_key)
+        pipe.hset(live_key, mapping=fields)
+        pipe.expire(live_key, _live_ttl())
+    pipe.set(LIVE_SEEDED_KEY, 1)
+    pipe.execute()
+
+
+# Totals as of the last drain: the live state minus what is still buffered, which the
+# next delta (seq + 1) carries. Read in one transaction so no drain lands in between.
+def live_snapshot(client, since: datetime) -> Dict[str, Any]:
+    today = datetime.utcnow().date()
+    days = [(today - timedelta(days=offset)).isoformat() for offset in range((today - since.date()).days + 1)]
+    pipe = client.pipeline(transaction=True)
+    pipe.get(DELTA_SEQ_KEY)
+    pipe.get('realtime:transcriptions_count')
+    pipe.hgetall(DELTA_BUFFER_KEY)
+    for day in days:
+        pipe.hgetall(LIVE_DAY_KEY.format(day=day))
+    seq, counter, pending, *live = pipe.execute()
+    pending = _totals(pending, days)
+    per_day: Dict[str, int] = {}
+    topics: Dict[str, int] = defaultdict(int)
+    for day, fields in zip(days, live):
+        count = int(fields.get('count', 0)) - pending['per_day'].get(day, 0)
+        if count > 0:
+            per_day[day] = count
+        for field, value in fields.items():
+            if field.startswith('topic:'):
+                topics[field[len('topic:'):]] += int(value)
+    for topic, value in pending['topics'].items():
+        topics[topic] -= value
+    return {
+        'per_day': dict(sorted(per_day.items())),
+        'topics': {topic: value for topic, value in sorted(topics.items()) if value > 0},
+        'counter': int(counter) if counter else 0,
+        'seq': int(seq) if seq else 0,
+    }
+
+
+def take_deltas(client) -> Dict[str, Any] | None:
+    pipe = client.pipeline(transaction=True)
+    pipe.hgetall(DELTA_BUFFER_KEY)
+    pipe.delete(DELTA_BUFFER_KEY)
+    pipe.incr(DELTA_SEQ_KEY)
+    pending, _, seq = pipe.execute()
+    if not pending:
+        return None
+    deltas = {name: {key: value for key, value in values.items() if value} for name, values in _totals(pending).items()}
+    return {**deltas, 'seq': seq}
+
+
+# Called on an interval by `push_dashboard_deltas`: however many dashboards are open, each
+# interval costs one HGETALL and one group_send.
+def push_deltas(client, channel_layer) -> Dict[str, Any] | None:
+    deltas = take_deltas(client)
+    if deltas is None:
+        return None
+    counter = client.get('realtime:transcriptions_count')
+    message = {**deltas, 'counter': int(counter) if counter else 0}
+    async_to_sync(channel_layer.group_send)(DASHBOARD_GROUP, {'type': 'dashboard_delta', 'data': message})
+    return message
@@ -0,0 +1,27 @@
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.redis import get_redis_connection
+from dashboards.live import push_deltas
+
+
+class Command(BaseCommand):
+    help = 'Push the coalesced dashboard deltas to the dashboard WebSocket group on an interval.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Push what is pending and exit.')
+        parser.add_argument('--interval', type=float, default=settings.DASHBOARD_PUSH_INTERVAL)
+
+    def handle(self, *args, **options):
+        client = get_redis_connection()
+        channel_layer = get_channel_layer()
+        while True:
+            message = push_deltas(client, channel_layer)
+            if message:
+                self.stdout.write(f"pushed days={len(message['per_day'])} topics={len(message['topics'])}")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
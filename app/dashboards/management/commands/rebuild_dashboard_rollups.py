@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.redis import get_redis_connection
+from dashboards.live import seed_live_state
+from dashboards.rollups import get_rollup_collection, load_rollups, rebuild_rollups
+from transcripts.mongo import get_collection
+
+
+class Command(BaseCommand):
+    help = 'Recompute the transcription_daily_stats rollups from the transcriptions collection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Only rebuild the last N days (default: all of them).',
+        )
+        parser.add_argument(
+            '--if-empty',
+            action='store_true',
+            help='Skip the rebuild when rollups already exist (backfill on first start).',
+        )
+
+    def handle(self, *args, **options):
+        target = get_rollup_collection()
+        if options['if_empty'] and target.find_one({}, {'_id': 1}):
+            self.stdout.write('Rollups already present; skipping rebuild.')
+            return
+        since = None
+        if options['days']:
+            since = datetime.combine(datetime.utcnow().date() - timedelta(days=options['days']), datetime.min.time())
+        days = rebuild_rollups(get_collection(), target, since)
+        window = datetime.utcnow() - timedelta(days=settings.DASHBOARD_DAYS)
+        seed_live_state(get_redis_connection(), load_rollups(target, window))
+        self.stdout.write(f'{days} daily rollups rebuilt')
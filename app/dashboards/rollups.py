@@ -0,0 +1,148 @@
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Tuple
+
+from pymongo import ReplaceOne, UpdateOne
+
+from core.mongo import get_mongo_db
+from .sketches import hll_estimate, hll_merge, hll_registers
+
+
+ROLLUP_COLLECTION = 'transcription_daily_stats'
+GRANULARITIES = ('hour', 'day', 'week')
+ROLLUP_SOURCE_PROJECTION = {'created_at': 1, 'length_sec': 1, 'topics': 1, 'speakers': 1}
+
+# (created_at ISO string, state before the write, state after it); None means absent.
+Change = Tuple[str, Dict[str, Any] | None, Dict[str, Any] | None]
+
+
+def get_rollup_collection():
+    return get_mongo_db()[ROLLUP_COLLECTION]
+
+
+# Topics are user input and become field names, so `.` and a leading `$` are escaped.
+def _escape(value: str) -> str:
+    return value.replace('$', '＄').replace('.', '．')
+
+
+def _unescape(value: str) -> str:
+    return value.replace('＄', '$').replace('．', '.')
+
+
+def _empty_bucket() -> Dict[str, Any]:
+    return {
+        'count': 0,
+        'length_sum': 0,
+        'hours': defaultdict(int),
+        'topics': defaultdict(int),
+        'speakers_hll': {},
+    }
+
+
+def accumulate(changes: Iterable[Change]) -> Dict[str, Dict[str, Any]]:
+    buckets: Dict[str, Dict[str, Any]] = defaultdict(_empty_bucket)
+    for created_at, before, after in changes:
+        bucket = buckets[created_at[:10]]
+        hour = created_at[11:13]
+        for state, sign in ((before, -1), (after, 1)):
+            if not state:
+                continue
+            bucket['count'] += sign
+            bucket['hours'][hour] += sign
+            bucket['length_sum'] += sign * (state.get('length_sec') or 0)
+            for topic in set(state.get('topics') or []):
+                bucket['topics'][_escape(topic)] += sign
+        if after:
+            # The sketch only grows: removed speakers stay counted until the next rebuild.
+            bucket['speakers_hll'] = hll_merge([bucket['speakers_hll'], hll_registers(after.get('speakers') or [])])
+    return buckets
+
+
+def rollup_operations(changes: Iterable[Change]) -> List[UpdateOne]:
+    operations = []
+    for day, bucket in accumulate(changes).items():
+        increments = {'count': bucket['count'], 'length_sum': bucket['length_sum']}
+        increments.update({f'hours.{hour}': value for hour, value in bucket['hours'].items()})
+        increments.update({f'topics.{topic}': value for topic, value in bucket['topics'].items()})
+        update: Dict[str, Any] = {'$set': {'updated_at': datetime.utcnow()}}
+        increments = {path: value for path, value in increments.items() if value}
+        if increments:
+            update['$inc'] = increments
+        if bucket['speakers_hll']:
+            update['$max'] = {f'speakers_hll.{index}': rank for index, rank in bucket['speakers_hll'].items()}
+        operations.append(UpdateOne({'_id': day}, update, upsert=True))
+    return operations
+
+
+def apply_rollups(collection, changes: Iterable[Change]) -> None:
+    operations = rollup_operations(changes)
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+
+
+def rebuild_rollups(source, target, since: datetime | None = None) -> int:
+    criteria = {'created_at': {'$gte': since}} if since else {}
+    documents = source.find(criteria, ROLLUP_SOURCE_PROJECTION)
+    buckets = accumulate((document['created_at'].isoformat(), None, document) for document in documents)
+    operations = [
+        ReplaceOne(
+            {'_id': day},
+            {
+                'count': bucket['count'],
+                'length_sum': bucket['length_sum'],
+                'hours': dict(bucket['hours']),
+                'topics': dict(bucket['topics']),
+                'speakers_hll': bucket['speakers_hll'],
+                'updated_at': datetime.utcnow(),
+            },
+            upsert=True,
+        )
+        for day, bucket in buckets.items()
+    ]
+    if operations:
+        target.bulk_write(operations, ordered=False)
+    stale = {'_id': {'$nin': list(buckets)}}
+    if since:
+        stale['_id']['$gte'] = since.strftime('%Y-%m-%d')
+    target.delete_many(stale)
+    return len(operations)
+
+
+def load_rollups(collection, since: datetime) -> List[Dict[str, Any]]:
+    return list(collection.find({'_id': {'$gte': since.strftime('%Y-%m-%d')}}).sort('_id', 1))
+
+
+def _bucket_key(day: str, hour: str, granularity: str) -> str:
+    if granularity == 'hour':
+        return f'{day}T{hour}:00'
+    if granularity == 'week':
+        year, week, _ = date.fromisoformat(day).isocalendar()
+        return f'{year}-W{week:02d}'
+    return day
+
+
+def rollup_series(rollups: List[Dict[str, Any]], granularity: str = 'day') -> List[Dict[str, Any]]:
+    counts: Dict[str, int] = defaultdict(int)
+    for rollup in rollups:
+        for hour, value in rollup.get('hours', {}).items():
+            counts[_bucket_key(rollup['_id'], hour, granularity)] += value
+    return [{'_id': key, 'count': counts[key]} for key in sorted(counts) if counts[key] > 0]
+
+
+def summarize_rollups(rollups: List[Dict[str, Any]], granularity: str = 'day', topics_limit: int = 10) -> Dict[str, Any]:
+    topics: Dict[str, int] = defaultdict(int)
+    count = length_sum = 0
+    for rollup in rollups:
+        count += rollup.get('count', 0)
+        length_sum += rollup.get('length_sum', 0)
+        for topic, value in rollup.get('topics', {}).items():
+            topics[_unescape(topic)] += value
+    top_topics = sorted(((topic, value) for topic, value in topics.items() if value > 0), key=lambda item: (-item[1], item[0]))
+    return {
+        'per_day': rollup_series(rollups, 'day'),
+        'series': rollup_series(rollups, granularity),
+        'top_topics': [{'_id': topic, 'count': value} for topic, value in top_topics[:topics_limit]],
+        'average_duration': length_sum / count if count else 0,
+        'distinct_speakers': hll_estimate(hll_merge(rollup.get('speakers_hll', {}) for rollup in rollups)),
+        'partial': False,
+    }
@@ -0,0 +1,45 @@
+import hashlib
+import math
+from typing import Dict, Iterable, Mapping
+
+# 2**10 registers: about 3% standard error, at most 1024 small ints per sketch.
+HLL_PRECISION = 10
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+# Sparse HyperLogLog registers keyed by register index, as strings so they work as Mongo paths.
+def hll_registers(values: Iterable[str]) -> Dict[str, int]:
+    registers: Dict[str, int] = {}
+    for value in values:
+        hashed = _hash(value)
+        index = hashed >> (64 - HLL_PRECISION)
+        remainder = hashed & ((1 << (64 - HLL_PRECISION)) - 1)
+        rank = (64 - HLL_PRECISION) - remainder.bit_length() + 1
+        key = str(index)
+        registers[key] = max(registers.get(key, 0), rank)
+    return registers
+
+
+def hll_merge(sketches: Iterable[Mapping[str, int]]) -> Dict[str, int]:
+    merged: Dict[str, int] = {}
+    for sketch in sketches:
+        for key, rank in sketch.items():
+            merged[key] = max(merged.get(key, 0), rank)
+    return merged
+
+
+def hll_estimate(registers: Mapping[str, int]) -> int:
+    if not registers:
+        return 0
+    alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+    empty = HLL_REGISTERS - len(registers)
+    harmonic = empty + sum(2.0 ** -rank for rank in registers.values())
+    estimate = alpha * HLL_REGISTERS ** 2 / harmonic
+    if estimate <= 2.5 * HLL_REGISTERS and empty:
+        # Small-range correction (linear counting).
+        estimate = HLL_REGISTERS * math.log(HLL_REGISTERS / empty)
+    return round(estimate)
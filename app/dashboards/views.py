@@ -2,75 +2,78 @@ from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.shortcuts import render
+from pymongo.errors import ExecutionTimeout
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from core.mongo import get_mongo_db
+from core.redis import get_redis_connection
+from core.swr import CacheResult, StaleWhileRevalidateCache
+from .aggregations import per_day_pipeline, summary_pipeline
+from .rollups import GRANULARITIES, get_rollup_collection, load_rollups, summarize_rollups
+
+
+def cached_summary(granularity: str = 'day') -> CacheResult:
+    cache = StaleWhileRevalidateCache(
+        'dash-summary',
+        soft_ttl=settings.DASHBOARD_CACHE_SOFT_TTL,
+        hard_ttl=settings.DASHBOARD_CACHE_HARD_TTL,
+        lock_ttl=settings.DASHBOARD_CACHE_LOCK_TTL,
+        client=get_redis_connection(),
+    )
+    return cache.get(f'{settings.DASHBOARD_SOURCE}:{granularity}', lambda: DashboardSummaryView.summary(granularity))
 
 
 class DashboardSummaryView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
-        db = get_mongo_db()
-        collection = db['transcriptions']
-        since = datetime.utcnow() - timedelta(days=settings.DASHBOARD_DAYS)
-
-        per_day = list(
-            collection.aggregate(
-                [
-                    {'$match': {'created_at': {'$gte': since}}},
-                    {
-                        '$group': {
-                            '_id': {
-                                '$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}
-                            },
-                            'count': {'$sum': 1},
-                        }
-                    },
-                    {'$sort': {'_id': 1}},
-                ]
-            )
-        )
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return Response({'detail': f"granularity must be one of: {', '.join(GRANULARITIES)}."}, status=400)
+        result = cached_summary(granularity)
+        headers = {'Age': str(int(result.age)), 'X-Cache': result.status.upper()}
+        return Response({'granularity': granularity, **result.value}, headers=headers)
 
-        top_topics = list(
-            collection.aggregate(
-                [
-                    {'$unwind': '$topics'},
-                    {'$group': {'_id': '$topics', 'count': {'$sum': 1}}},
-                    {'$sort': {'count': -1}},
-                    {'$limit': 10},
-                ]
-            )
-        )
-
-        avg_length = list(
-            collection.aggregate(
-                [
-                    {
-                        '$group': {
-                            '_id': None,
-                            'average': {'$avg': '$length_sec'},
-                            'speakers': {'$addToSet': '$speakers'},
-                        }
-                    }
-                ]
-            )
-        )
-
-        average_duration = avg_length[0]['average'] if avg_length else 0
-        speaker_sets = avg_length[0]['speakers'] if avg_length else []
-        distinct_speakers = len({speaker for speakers in speaker_sets for speaker in speakers})
+    @classmethod
+    def summary(cls, granularity: str):
+        since = datetime.utcnow() - timedelta(days=settings.DASHBOARD_DAYS)
+        if settings.DASHBOARD_SOURCE == 'rollups':
+            return summarize_rollups(load_rollups(get_rollup_collection(), since), granularity)
+        return cls.live_summary(since, granularity)
 
-        return Response(
-            {
+    @staticmethod
+    def live_summary(since: datetime, granularity: str):
+        collection = get_mongo_db()['transcriptions']
+        budget = settings.DASHBOARD_MAX_TIME_MS
+        try:
+            facets = next(collection.aggregate(summary_pipeline(since, granularity), allowDiskUse=True, maxTimeMS=budget))
+        except ExecutionTimeout:
+            # Past the budget, fall back to the indexed per-day counts only.
+            try:
+                per_day = list(collection.aggregate(per_day_pipeline(since), maxTimeMS=budget))
+            except ExecutionTimeout:
+                per_day = []
+            return {
                 'per_day': per_day,
-                'top_topics': top_topics,
-                'average_duration': average_duration,
-                'distinct_speakers': distinct_speakers,
+                'series': per_day if granularity == 'day' else [],
+                'top_topics': [],
+                'average_duration': None,
+                'distinct_speakers': None,
+                'partial': True,
             }
-        )
+
+        average_duration = facets['average_duration'][0]['value'] if facets['average_duration'] else 0
+        distinct_speakers = facets['distinct_speakers'][0]['value'] if facets['distinct_speakers'] else 0
+        return {
+            'per_day': facets['per_day'],
+            'series': facets.get('series', facets['per_day']),
+            'top_topics': facets['top_topics'],
+            'average_duration': average_duration or 0,
+            'distinct_speakers': distinct_speakers,
+            'partial': False,
+        }
 
 
 class DashboardView(APIView):
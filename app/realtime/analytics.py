@@ -0,0 +1,84 @@
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+# Native Redis HyperLogLogs: at most 12 KB each, 0.81% standard error.
+DISTINCT_SPEAKERS_KEY = 'realtime:hll:speakers'
+LISTENERS_KEY = 'realtime:hll:listeners:{transcription_id}'
+HLL_STANDARD_ERROR = 0.0081
+
+# Count-min sketch over topic mentions, one hash per UTC day (DEPTH x WIDTH counters).
+# An estimate never undercounts and overcounts by at most e/WIDTH (~0.13%) of the day's
+# mentions with probability 1 - e**-DEPTH (~98%).
+CMS_KEY = 'realtime:cms:topics:{day}'
+CMS_WIDTH = 2048
+CMS_DEPTH = 4
+# Heavy hitters by count-min estimate; trimmed to TOPK_CAPACITY members on every write.
+TOPK_KEY = 'realtime:topk:topics:{day}'
+TOPK_CAPACITY = 50
+# Yesterday's keys stay readable for a day, then expire.
+WINDOW_TTL = 2 * 24 * 3600
+
+
+def _day(now: datetime | None = None) -> str:
+    return (now or datetime.utcnow()).strftime('%Y%m%d')
+
+
+def _cms_fields(value: str) -> List[str]:
+    digest = hashlib.blake2b(value.encode(), digest_size=4 * CMS_DEPTH).digest()
+    return [
+        f'{row}:{int.from_bytes(digest[4 * row:4 * row + 4], "big") % CMS_WIDTH}'
+        for row in range(CMS_DEPTH)
+    ]
+
+
+def record_speakers(client, speakers: Iterable[str]) -> None:
+    speakers = [speaker for speaker in speakers if speaker]
+    if speakers:
+        client.pfadd(DISTINCT_SPEAKERS_KEY, *speakers)
+
+
+def record_listen(client, transcription_id: str, user_id: str) -> None:
+    client.pfadd(LISTENERS_KEY.format(transcription_id=transcription_id), user_id)
+
+
+def record_topics(client, mentions: Dict[str, int], now: datetime | None = None) -> None:
+    mentions = {topic: count for topic, count in mentions.items() if topic and count > 0}
+    if not mentions:
+        return
+    day = _day(now)
+    cms_key, topk_key = CMS_KEY.format(day=day), TOPK_KEY.format(day=day)
+    pipe = client.pipeline(transaction=True)
+    for topic, count in mentions.items():
+        for field in _cms_fields(topic):
+            pipe.hincrby(cms_key, field, count)
+    pipe.expire(cms_key, WINDOW_TTL)
+    counters = pipe.execute()
+    # HINCRBY returns the new counters, so each topic's estimate comes back in the same round trip.
+    estimates = {
+        topic: min(counters[index * CMS_DEPTH:(index + 1) * CMS_DEPTH])
+        for index, topic in enumerate(mentions)
+    }
+    pipe = client.pipeline(transaction=True)
+    pipe.zadd(topk_key, estimates, gt=True)
+    pipe.zremrangebyrank(topk_key, 0, -(TOPK_CAPACITY + 1))
+    pipe.expire(topk_key, WINDOW_TTL)
+    pipe.execute()
+
+
+def distinct_speakers(client) -> int:
+    return client.pfcount(DISTINCT_SPEAKERS_KEY)
+
+
+def distinct_listeners(client, transcription_id: str) -> int:
+    return client.pfcount(LISTENERS_KEY.format(transcription_id=transcription_id))
+
+
+def topic_estimate(client, topic: str, now: datetime | None = None) -> int:
+    counters = client.hmget(CMS_KEY.format(day=_day(now)), _cms_fields(topic))
+    return min(int(counter or 0) for counter in counters)
+
+
+def trending_topics(client, limit: int = 10, now: datetime | None = None) -> List[Dict[str, Any]]:
+    members = client.zrevrange(TOPK_KEY.format(day=_day(now)), 0, limit - 1, withscores=True)
+    return [{'topic': topic, 'count': int(score)} for topic, score in members]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RealtimeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'realtime'
+
+    def ready(self):
+        from . import handlers  # noqa: F401
@@ -13,3 +13,6 @@ class NotificationsConsumer(AsyncJsonWebsocketConsumer):
 
     async def transcription_created(self, event):
         await self.send_json(event['data'])
+
+    async def transcriptions_created(self, event):
+        await self.send_json(event['data'])
@@ -0,0 +1,16 @@
+from collections import Counter
+from typing import Any, Dict, List
+
+from core.redis import get_redis_connection
+from transcripts.outbox import handles
+from .analytics import record_speakers, record_topics
+
+
+# Sketches only grow, so edits and deletes are not subtracted; a redelivered batch
+# leaves the HyperLogLog unchanged but counts its topics again.
+@handles('transcriptions.created')
+def update_realtime_analytics(events: List[Dict[str, Any]]) -> None:
+    items = [item for event in events for item in event['payload']['items']]
+    client = get_redis_connection()
+    record_speakers(client, {speaker for item in items for speaker in item.get('speakers') or []})
+    record_topics(client, Counter(topic for item in items for topic in set(item.get('topics') or [])))
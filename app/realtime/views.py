@@ -3,6 +3,14 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from core.redis import get_redis_connection
+from .analytics import (
+    HLL_STANDARD_ERROR,
+    TOPK_CAPACITY,
+    distinct_listeners,
+    distinct_speakers,
+    topic_estimate,
+    trending_topics,
+)
 
 
 class RealtimeCounterView(APIView):
@@ -12,3 +20,40 @@ class RealtimeCounterView(APIView):
         client = get_redis_connection()
         value = client.get('realtime:transcriptions_count')
         return Response({'count': int(value) if value else 0})
+
+
+class RealtimeSpeakersView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response({'distinct_speakers': distinct_speakers(get_redis_connection()), 'standard_error': HLL_STANDARD_ERROR})
+
+
+class RealtimeListenersView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, transcription_id: str):
+        client = get_redis_connection()
+        return Response(
+            {
+                'transcription_id': transcription_id,
+                'distinct_listeners': distinct_listeners(client, transcription_id),
+                'standard_error': HLL_STANDARD_ERROR,
+            }
+        )
+
+
+class RealtimeTrendingTopicsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), TOPK_CAPACITY)
+        except ValueError:
+            return Response({'detail': 'limit must be an integer.'}, status=400)
+        client = get_redis_connection()
+        body = {'topics': trending_topics(client, limit)}
+        topic = request.query_params.get('topic')
+        if topic:
+            body['estimate'] = {'topic': topic, 'count': topic_estimate(client, topic)}
+        return Response(body)
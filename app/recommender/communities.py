@@ -0,0 +1,213 @@
+import logging
+import secrets
+import time
+from typing import Any, Callable, Dict, List
+
+import redis
+from django.conf import settings
+
+from core.neo4j import read, write
+
+
+logger = logging.getLogger(__name__)
+
+# Latest result: user id -> community id, plus what it was computed from.
+COMMUNITIES_KEY = 'reco:communities'
+COMMUNITIES_META_KEY = 'reco:communities:meta'
+# State of the last or running job, read by /reco/communities/status.
+COMMUNITY_JOB_KEY = 'reco:communities:job'
+COMMUNITY_REQUEST_KEY = 'reco:communities:requested'
+COMMUNITY_LOCK_KEY = 'reco:communities:lock'
+STORE_CHUNK_SIZE = 1000
+# Slack on top of the GDS calls' own timeouts for the Redis and fingerprint steps.
+LOCK_MARGIN_SECONDS = 60
+
+# Every listen write stamps rel.ts, so count plus newest ts changes whenever the graph does.
+LISTEN_FINGERPRINT_QUERY = """
+MATCH (:User)-[rel:LISTENED_TO]->(:Transcription)
+RETURN count(rel) AS listens, coalesce(max(rel.ts), 0) AS last_ts
+"""
+
+PROJECTION_EXISTS_QUERY = """
+CALL gds.graph.exists($graph_name) YIELD exists
+RETURN exists
+"""
+
+DROP_PROJECTION_QUERY = """
+CALL gds.graph.drop($graph_name, false) YIELD graphName
+RETURN graphName
+"""
+
+# Users only connect through the transcriptions they listened to, so both labels are projected.
+PROJECT_QUERY = """
+CALL gds.graph.project(
+    $graph_name,
+    ['User', 'Transcription'],
+    {
+        LISTENED_TO: {
+            orientation: 'UNDIRECTED',
+            properties: {weight: {defaultValue: 1.0}}
+        }
+    }
+)
+YIELD nodeCount, relationshipCount
+RETURN nodeCount, relationshipCount
+"""
+
+LOUVAIN_QUERY = """
+CALL gds.louvain.stream($graph_name, {relationshipWeightProperty: 'weight'})
+YIELD nodeId, communityId
+WITH gds.util.asNode(nodeId) AS node, communityId
+WHERE node:User
+RETURN node.id AS user_id, communityId
+"""
+
+
+def listen_fingerprint() -> str:
+    record = read(LISTEN_FINGERPRINT_QUERY)[0]
+    return f"{record['listens']}:{record['last_ts']}"
+
+
+def request_community_job(client) -> Dict[str, Any]:
+    client.set(COMMUNITY_REQUEST_KEY, time.time())
+    if client.hget(COMMUNITY_JOB_KEY, 'state') != 'running':
+        client.hset(COMMUNITY_JOB_KEY, 'state', 'queued')
+    return community_job_status(client)
+
+
+def take_community_request(client) -> bool:
+    pipe = client.pipeline(transaction=True)
+    pipe.get(COMMUNITY_REQUEST_KEY)
+    pipe.delete(COMMUNITY_REQUEST_KEY)
+    requested, _ = pipe.execute()
+    return requested is not None
+
+
+def community_job_status(client) -> Dict[str, Any]:
+    job = client.hgetall(COMMUNITY_JOB_KEY)
+    meta = client.hgetall(COMMUNITIES_META_KEY)
+    return {
+        'state': job.get('state', 'idle'),
+        'started_at': float(job['started_at']) if job.get('started_at') else None,
+        'finished_at': float(job['finished_at']) if job.get('finished_at') else None,
+        'duration_ms': float(job['duration_ms']) if job.get('duration_ms') else None,
+        'reprojected': job.get('reprojected') == '1',
+        'error': job.get('error') or None,
+        'fingerprint': meta.get('fingerprint'),
+        'computed_at': float(meta['computed_at']) if meta.get('computed_at') else None,
+        'users': int(meta.get('users', 0)),
+        'communities': int(meta.get('communities', 0)),
+    }
+
+
+def stored_communities(client) -> List[Dict[str, Any]] | None:
+    members = client.hgetall(COMMUNITIES_KEY)
+    if not members and not client.exists(COMMUNITIES_META_KEY):
+        return None
+    communities = [{'user_id': user_id, 'communityId': int(community)} for user_id, community in members.items()]
+    communities.sort(key=lambda item: (item['communityId'], item['user_id']))
+    return communities
+
+
+def _store_communities(client, rows: List[Dict[str, Any]], fingerprint: str) -> None:
+    scratch_key = f'{COMMUNITIES_KEY}:rebuild'
+    client.delete(scratch_key)
+    for start in range(0, len(rows), STORE_CHUNK_SIZE):
+        chunk = rows[start:start + STORE_CHUNK_SIZE]
+        client.hset(scratch_key, mapping={row['user_id']: row['communityId'] for row in chunk})
+    swap = client.pipeline(transaction=True)
+    if rows:
+        swap.rename(scratch_key, COMMUNITIES_KEY)
+    else:
+        swap.delete(COMMUNITIES_KEY)
+    swap.delete(COMMUNITIES_META_KEY)
+    swap.hset(
+        COMMUNITIES_META_KEY,
+        mapping={
+            'fingerprint': fingerprint,
+            'computed_at': time.time(),
+            'users': len(rows),
+            'communities': len({row['communityId'] for row in rows}),
+        },
+    )
+    swap.execute()
+
+
+# Drop, project and Louvain can each take up to NEO4J_GDS_TIMEOUT, so the lock outlives
+# all three; it is also renewed before each of them in case one overran.
+def _lock_ttl() -> int:
+    return int(settings.NEO4J_GDS_TIMEOUT * 3 + LOCK_MARGIN_SECONDS)
+
+
+def _if_owner(client, token: str, action: Callable[[Any], None]) -> bool:
+    with client.pipeline() as pipe:
+        try:
+            pipe.watch(COMMUNITY_LOCK_KEY)
+            if pipe.get(COMMUNITY_LOCK_KEY) != token:
+                pipe.unwatch()
+                return False
+            pipe.multi()
+            action(pipe)
+            pipe.execute()
+            return True
+        except redis.WatchError:
+            return False
+
+
+def _renew(client, token: str) -> None:
+    if not _if_owner(client, token, lambda pipe: pipe.expire(COMMUNITY_LOCK_KEY, _lock_ttl())):
+        raise RuntimeError('Lost the community detection lock.')
+
+
+def _release(client, token: str) -> None:
+    _if_owner(client, token, lambda pipe: pipe.delete(COMMUNITY_LOCK_KEY))
+
+
+# Runs as the `detect_communities` worker. The projection has a fixed name and is kept
+# between runs; it is only dropped and projected again when the listen graph changed
+# since it was built (or the server lost it on restart), and Louvain only reruns then
+# too, unless `force`. GDS cannot patch a projection in place, so a change always means
+# a full re-projection; what the fingerprint saves is the runs where nothing changed. A Redis lock keeps concurrent workers off the same projection.
+# GDS keeps projections in the memory of the member that built them, so every call
+# goes through write() and lands on the same (leader) member.
+def run_community_job(client, force: bool = False) -> Dict[str, Any] | None:
+    token = secrets.token_hex(8)
+    if not client.set(COMMUNITY_LOCK_KEY, token, nx=True, ex=_lock_ttl()):
+        return None
+    started = time.time()
+    client.hset(COMMUNITY_JOB_KEY, mapping={'state': 'running', 'started_at': started, 'error': ''})
+    try:
+        graph_name = settings.RECO_COMMUNITY_GRAPH
+        timeout = settings.NEO4J_GDS_TIMEOUT
+        fingerprint = listen_fingerprint()
+        projected_from = client.hget(COMMUNITY_JOB_KEY, 'projected_from')
+        exists = write(PROJECTION_EXISTS_QUERY, {'graph_name': graph_name})[0]['exists']
+        reproject = not exists or projected_from != fingerprint
+        if reproject:
+            if exists:
+                write(DROP_PROJECTION_QUERY, {'graph_name': graph_name}, timeout=timeout)
+                _renew(client, token)
+            write(PROJECT_QUERY, {'graph_name': graph_name}, timeout=timeout)
+            _renew(client, token)
+            client.hset(COMMUNITY_JOB_KEY, 'projected_from', fingerprint)
+        if reproject or force or client.hget(COMMUNITIES_META_KEY, 'fingerprint') != fingerprint:
+            rows = write(LOUVAIN_QUERY, {'graph_name': graph_name}, timeout=timeout)
+            # A worker whose lock expired mid-run must not overwrite a newer result.
+            _renew(client, token)
+            _store_communities(client, rows, fingerprint)
+        finished = time.time()
+        client.hset(
+            COMMUNITY_JOB_KEY,
+            mapping={
+                'state': 'done',
+                'finished_at': finished,
+                'duration_ms': round((finished - started) * 1000, 3),
+                'reprojected': int(reproject),
+            },
+        )
+    except Exception as exc:  # noqa: BLE001
+        logger.exception('Community detection failed.')
+        client.hset(COMMUNITY_JOB_KEY, mapping={'state': 'failed', 'finished_at': time.time(), 'error': str(exc)})
+    finally:
+        _release(client, token)
+    return community_job_status(client)
@@ -0,0 +1,277 @@
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import scipy.sparse as sp
+from django.conf import settings
+
+
+SNAPSHOT_QUERY = """
+MATCH (u:User)-[rel:LISTENED_TO]->(t:Transcription)
+RETURN u.id AS user_id, t.id AS item_id, t.title AS title, coalesce(rel.weight, 1) AS weight
+"""
+
+# Cells of one dense similarity block (float32), so building never holds more than ~64 MB.
+BLOCK_CELLS = 2 ** 24
+
+
+def _top(ids: np.ndarray, indices: np.ndarray, scores: np.ndarray, limit: int) -> np.ndarray:
+    candidates = np.arange(len(scores))
+    if len(scores) > limit:
+        # Only scores tied with or above the limit-th best need the (string) tie-break sort.
+        threshold = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+        candidates = np.flatnonzero(scores >= threshold)
+    # Highest score first, ties by id, like the Cypher queries' ORDER BY plus our tie-break.
+    order = np.lexsort((ids[indices[candidates]], -scores[candidates]))
+    return candidates[order[:limit]]
+
+
+# Weighted sum of a few CSR rows, read straight from indptr: a scipy row slice costs more
+# than the arithmetic at this size.
+def _sum_rows(matrix: sp.csr_matrix, rows: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    if not len(rows):
+        return np.empty(0, dtype=matrix.indices.dtype), np.empty(0, dtype=np.float64)
+    starts, ends = matrix.indptr[rows], matrix.indptr[rows + 1]
+    cols = np.concatenate([matrix.indices[start:end] for start, end in zip(starts, ends)])
+    values = np.concatenate(
+        [matrix.data[start:end] * weight for start, end, weight in zip(starts, ends, weights)]
+    ).astype(np.float64)
+    indices, inverse = np.unique(cols, return_inverse=True)
+    return indices, np.bincount(inverse, weights=values, minlength=len(indices))
+
+
+def item_similarity(ratings: sp.csr_matrix, top_k: int) -> sp.csr_matrix:
+    items = ratings.T.tocsr().astype(np.float32)
+    count = items.shape[0]
+    k = min(top_k, count - 1)
+    if k <= 0:
+        return sp.csr_matrix((count, count), dtype=np.float32)
+    norms = np.sqrt(np.asarray(items.multiply(items).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    normalized = sp.diags(1 / norms).dot(items).tocsr()
+    normalized_t = normalized.T.tocsr()
+    batch = max(1, BLOCK_CELLS // count)
+    rows, cols, values = [], [], []
+    for start in range(0, count, batch):
+        # Cosine of a batch of items against all of them in one sparse product.
+        block = normalized[start:start + batch].dot(normalized_t).toarray()
+        local = np.arange(block.shape[0])
+        block[local, start + local] = 0
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(block, top, axis=1)
+        keep = scores > 0
+        rows.append(np.broadcast_to((start + local)[:, None], top.shape)[keep])
+        cols.append(top[keep])
+        values.append(scores[keep])
+    return sp.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), shape=(count, count), dtype=np.float32
+    )
+
+
+@dataclass
+class EngineSnapshot:
+    user_ids: np.ndarray
+    item_ids: np.ndarray
+    titles: np.ndarray
+    # users × items, LISTENED_TO weights.
+    ratings: sp.csr_matrix
+    # items × items, the `top_k` best cosine similarities of each item.
+    similarity: sp.csr_matrix
+    top_k: int
+    built_at: float
+    # items × users with every listen as 1, for co-listener counts.
+    item_users: sp.csr_matrix = field(init=False)
+    user_index: Dict[str, int] = field(init=False)
+
+    def __post_init__(self) -> None:
+        listened = self.ratings.copy()
+        listened.data[:] = 1
+        self.item_users = listened.T.tocsr()
+        self.user_index = {user_id: index for index, user_id in enumerate(self.user_ids.tolist())}
+
+    @classmethod
+    def build(cls, rows: Iterable[Dict[str, Any]], top_k: int) -> 'EngineSnapshot':
+        user_index: Dict[str, int] = {}
+        item_index: Dict[str, int] = {}
+        titles: Dict[str, str] = {}
+        user_col, item_col, weights = [], [], []
+        for row in rows:
+            user_col.append(user_index.setdefault(row['user_id'], len(user_index)))
+            item_col.append(item_index.setdefault(row['item_id'], len(item_index)))
+            titles[row['item_id']] = row.get('title') or ''
+            weights.append(row['weight'])
+        ratings = sp.csr_matrix(
+            (np.asarray(weights, dtype=np.float32), (np.asarray(user_col), np.asarray(item_col))),
+            shape=(len(user_index), len(item_index)),
+        )
+        return cls(
+            user_ids=np.asarray(list(user_index), dtype=str),
+            item_ids=np.asarray(list(item_index), dtype=str),
+            titles=np.asarray([titles[item_id] for item_id in item_index], dtype=str),
+            ratings=ratings,
+            similarity=item_similarity(ratings, top_k),
+            top_k=top_k,
+            built_at=time.time(),
+        )
+
+    def has_user(self, user_id: str) -> bool:
+        return user_id in self.user_index
+
+    def _listened(self, index: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.ratings.indptr[index], self.ratings.indptr[index + 1]
+        return self.ratings.indices[start:end], self.ratings.data[start:end]
+
+    # Item-based collaborative filtering: listened items' similarity rows, weighted by the
+    # user's own weights, minus what was already listened to.
+    def collab(self, user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+        items, weights = self._listened(self.user_index[user_id])
+        indices, values = _sum_rows(self.similarity, items, weights)
+        candidates = ~np.isin(indices, items)
+        indices, values = indices[candidates], values[candidates]
+        return [
+            {
+                'id': str(self.item_ids[indices[i]]),
+                'title': str(self.titles[indices[i]]),
+                'score': round(float(values[i]), 3),
+            }
+            for i in _top(self.item_ids, indices, values, limit)
+        ]
+
+    # Same answer as SIMILAR_USERS_QUERY: users ranked by shared transcriptions.
+    def similar_users(self, user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+        index = self.user_index[user_id]
+        items, _ = self._listened(index)
+        indices, values = _sum_rows(self.item_users, items, np.ones(len(items), dtype=np.float32))
+        others = indices != index
+        indices, values = indices[others], values[others]
+        return [
+            {'id': str(self.user_ids[indices[i]]), 'weight': int(values[i])}
+            for i in _top(self.user_ids, indices, values, limit)
+        ]
+
+    def memory_bytes(self) -> Dict[str, int]:
+        def matrix(m: sp.csr_matrix) -> int:
+            return m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+
+        usage = {
+            'ratings': matrix(self.ratings),
+            'item_users': matrix(self.item_users),
+            'similarity': matrix(self.similarity),
+            'ids': self.user_ids.nbytes + self.item_ids.nbytes + self.titles.nbytes,
+        }
+        usage['total'] = sum(usage.values())
+        return usage
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'users': len(self.user_ids),
+            'items': len(self.item_ids),
+            'listens': int(self.ratings.nnz),
+            'similarities': int(self.similarity.nnz),
+            'top_k': self.top_k,
+            'built_at': self.built_at,
+            'memory_bytes': self.memory_bytes(),
+        }
+
+    # Written to a temporary file next to `path` and renamed over it, so a reader never
+    # opens a half-written snapshot.
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                np.savez_compressed(
+                    fh,
+                    user_ids=self.user_ids,
+                    item_ids=self.item_ids,
+                    titles=self.titles,
+                    ratings_data=self.ratings.data,
+                    ratings_indices=self.ratings.indices,
+                    ratings_indptr=self.ratings.indptr,
+                    similarity_data=self.similarity.data,
+                    similarity_indices=self.similarity.indices,
+                    similarity_indptr=self.similarity.indptr,
+                    meta=np.asarray([self.top_k, self.built_at], dtype=np.float64),
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> 'EngineSnapshot':
+        with np.load(path, allow_pickle=False) as data:
+            users, items = len(data['user_ids']), len(data['item_ids'])
+            top_k, built_at = data['meta']
+            return cls(
+                user_ids=data['user_ids'],
+                item_ids=data['item_ids'],
+                titles=data['titles'],
+                ratings=sp.csr_matrix(
+                    (data['ratings_data'], data['ratings_indices'], data['ratings_indptr']), shape=(users, items)
+                ),
+                similarity=sp.csr_matrix(
+                    (data['similarity_data'], data['similarity_indices'], data['similarity_indptr']),
+                    shape=(items, items),
+                ),
+                top_k=int(top_k),
+                built_at=float(built_at),
+            )
+
+
+# One snapshot per process. Requests keep using the one they got while a newer file
+# is loaded next to it. The lock only guards claiming a check and swapping the
+# reference; the file is read outside it, so nobody waits on np.load.
+class _EngineCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.snapshot: EngineSnapshot | None = None
+        self.path: str | None = None
+        self.mtime: float | None = None
+        self.checking: str | None = None
+        self.checked_at = float('-inf')
+        # A slow load must not swap in over the result of a later check.
+        self.claims = self.swapped = 0
+
+    def _due(self, path: str, now: float) -> bool:
+        return path != self.checking or now - self.checked_at >= settings.RECO_ENGINE_RELOAD_INTERVAL
+
+    def get(self) -> EngineSnapshot | None:
+        path = settings.RECO_ENGINE_PATH
+        if not path:
+            return None
+        now = time.monotonic()
+        if not self._due(path, now):
+            return self.snapshot
+        with self._lock:
+            if not self._due(path, now):
+                return self.snapshot
+            self.checking, self.checked_at = path, now
+            self.claims += 1
+            claim, current = self.claims, (self.path, self.mtime)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if (path, mtime) == current:
+            return self.snapshot
+        snapshot = EngineSnapshot.load(path) if mtime is not None else None
+        with self._lock:
+            if claim > self.swapped:
+                self.snapshot, self.path, self.mtime, self.swapped = snapshot, path, mtime, claim
+        return self.snapshot
+
+
+_engine = _EngineCache()
+
+
+def recommendation_engine() -> EngineSnapshot | None:
+    return _engine.get()
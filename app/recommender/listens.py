@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import redis
+from django.conf import settings
+from neo4j.exceptions import DriverError, Neo4jError
+
+from core.neo4j import write
+from core.redis import get_redis_connection
+from realtime.analytics import record_listen
+from .minhash import record_listen_signatures
+
+
+logger = logging.getLogger(__name__)
+
+LISTEN_STREAM_KEY = 'reco:listens'
+LISTEN_GROUP = 'reco-listen-writers'
+LISTEN_METRICS_KEY = 'reco:listens:metrics'
+
+# Rows whose transcription does not exist write nothing (not even the user) and come
+# back with found = false, so the caller can report them.
+LISTEN_BATCH_QUERY = """
+UNWIND $rows AS row
+OPTIONAL MATCH (t:Transcription {id: row.transcription_id})
+FOREACH (_ IN CASE WHEN t IS NULL THEN [] ELSE [1] END |
+    MERGE (u:User {id: row.user_id})
+    ON CREATE SET u.name = coalesce(row.user_name, row.user_id)
+    MERGE (u)-[rel:LISTENED_TO]->(t)
+    ON CREATE SET rel.weight = coalesce(row.weight, 1), rel.ts = timestamp()
+    ON MATCH SET rel.weight = coalesce(row.weight, rel.weight), rel.ts = timestamp()
+)
+RETURN row.index AS index, t IS NOT NULL AS found
+"""
+
+
+def chunked(rows: List[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+# One UNWIND statement, so one transaction, per chunk.
+def store_listen_chunk(rows: List[Dict[str, Any]]) -> Dict[int, bool]:
+    return {record['index']: record['found'] for record in write(LISTEN_BATCH_QUERY, {'rows': rows})}
+
+
+def enqueue_listen(client, user_id: str, transcription_id: str, weight: Any = 1, user_name: str | None = None) -> str:
+    fields = {
+        'user_id': user_id,
+        'transcription_id': transcription_id,
+        'weight': json.dumps(weight),
+        'user_name': user_name or '',
+    }
+    return client.xadd(LISTEN_STREAM_KEY, fields)
+
+
+def ensure_listen_group(client) -> None:
+    try:
+        client.xgroup_create(LISTEN_STREAM_KEY, LISTEN_GROUP, id='0', mkstream=True)
+    except redis.ResponseError as exc:
+        if 'BUSYGROUP' not in str(exc):
+            raise
+
+
+# Repeated user/transcription pairs collapse to the newest entry, which is what the
+# MERGE would have left behind after writing them one by one.
+def coalesce(entries: Iterable[Tuple[str, Dict[str, str]]]) -> List[Dict[str, Any]]:
+    rows: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for _, fields in entries:
+        key = (fields['user_id'], fields['transcription_id'])
+        rows.pop(key, None)
+        rows[key] = {
+            'user_id': fields['user_id'],
+            'user_name': fields.get('user_name') or None,
+            'transcription_id': fields['transcription_id'],
+            'weight': json.loads(fields.get('weight') or 'null'),
+        }
+    return [{'index': index, **row} for index, row in enumerate(rows.values())]
+
+
+def _entry_age(entry_id: str) -> float:
+    return max(time.time() - int(entry_id.split('-')[0]) / 1000, 0.0)
+
+
+def listen_stream_metrics(client=None) -> Dict[str, Any]:
+    client = client if client is not None else get_redis_connection()
+    length = client.xlen(LISTEN_STREAM_KEY)
+    pending = 0
+    if length and any(group['name'] == LISTEN_GROUP for group in client.xinfo_groups(LISTEN_STREAM_KEY)):
+        pending = client.xpending(LISTEN_STREAM_KEY, LISTEN_GROUP)['pending']
+    oldest = client.xrange(LISTEN_STREAM_KEY, '-', '+', count=1)
+    metrics = client.hgetall(LISTEN_METRICS_KEY)
+    flushes = int(metrics.get('flushes', 0))
+    return {
+        # Flushed entries are deleted, so whatever is left is either pending or undelivered.
+        'length': length,
+        'pending': pending,
+        'undelivered': max(length - pending, 0),
+        'oldest_seconds': round(_entry_age(oldest[0][0]), 3) if oldest else 0.0,
+        'flushes': flushes,
+        'events_flushed': int(metrics.get('events', 0)),
+        'rows_written': int(metrics.get('rows', 0)),
+        'not_found': int(metrics.get('not_found', 0)),
+        'last_flush_ms': float(metrics.get('last_flush_ms', 0)),
+        'last_flush_rows': int(metrics.get('last_flush_rows', 0)),
+        'avg_flush_ms': round(float(metrics.get('total_flush_ms', 0)) / flushes, 3) if flushes else 0.0,
+    }
+
+
+# Reads the listen stream as one consumer of LISTEN_GROUP and flushes to Neo4j once
+# `batch_size` entries are buffered or the oldest has waited `interval` seconds. Entries
+# are acknowledged (and deleted) only after their flush succeeds; ones left pending by a
+# crashed worker are claimed back after `claim_idle_ms`.
+class ListenStreamWriter:
+    def __init__(
+        self,
+        client=None,
+        consumer: str | None = None,
+        batch_size: int | None = None,
+        interval: float | None = None,
+        claim_idle_ms: int | None = None,
+    ) -> None:
+        self.client = client if client is not None else get_redis_connection()
+        self.consumer = consumer or f'{socket.gethostname()}-{os.getpid()}'
+        self.batch_size = batch_size or settings.RECO_LISTEN_FLUSH_SIZE
+        self.interval = interval if interval is not None else settings.RECO_LISTEN_FLUSH_INTERVAL
+        self.claim_idle_ms = claim_idle_ms or settings.RECO_LISTEN_CLAIM_IDLE_MS
+        self.buffer: Dict[str, Dict[str, str]] = {}
+        self.buffered_since: float | None = None
+        ensure_listen_group(self.client)
+
+    def _remaining(self) -> float:
+        if self.buffered_since is None:
+            return self.interval
+        return max(self.buffered_since + self.interval - time.monotonic(), 0.0)
+
+    def read(self) -> None:
+        _, claimed, *_ = self.client.xautoclaim(
+            LISTEN_STREAM_KEY, LISTEN_GROUP, self.consumer, self.claim_idle_ms, start_id='0-0', count=self.batch_size
+        )
+        entries = list(claimed)
+        room = self.batch_size - len(self.buffer) - len(entries)
+        if room > 0:
+            # BLOCK 0 would wait forever; with nothing left of the interval, just poll.
+            block = int(self._remaining() * 1000) or None
+            for _, stream_entries in self.client.xreadgroup(
+                LISTEN_GROUP, self.consumer, {LISTEN_STREAM_KEY: '>'}, count=room, block=block
+            ) or []:
+                entries.extend(stream_entries)
+        for entry_id, fields in entries:
+            # A claimed entry may already be buffered here, waiting for a retried flush.
+            if fields and entry_id not in self.buffer:
+                self.buffer[entry_id] = fields
+        if self.buffer and self.buffered_since is None:
+            self.buffered_since = time.monotonic()
+
+    def flush(self) -> int:
+        entry_ids = list(self.buffer)
+        rows = coalesce(self.buffer.items())
+        started = time.perf_counter()
+        try:
+            found: Dict[int, bool] = {}
+            for chunk in chunked(rows, settings.RECO_LISTEN_BATCH_CHUNK_SIZE):
+                found.update(store_listen_chunk(chunk))
+        except (DriverError, Neo4jError):
+            logger.exception('Flushing %d listen events failed; retrying in %.1fs.', len(entry_ids), self.interval)
+            self.buffered_since = time.monotonic()
+            return 0
+        duration_ms = (time.perf_counter() - started) * 1000
+        written = [row for row in rows if found.get(row['index'])]
+
+        pipe = self.client.pipeline(transaction=False)
+        for row in written:
+            record_listen(pipe, row['transcription_id'], row['user_id'])
+        pipe.xack(LISTEN_STREAM_KEY, LISTEN_GROUP, *entry_ids)
+        pipe.xdel(LISTEN_STREAM_KEY, *entry_ids)
+        pipe.hincrby(LISTEN_METRICS_KEY, 'flushes', 1)
+        pipe.hincrby(LISTEN_METRICS_KEY, 'events', len(entry_ids))
+        pipe.hincrby(LISTEN_METRICS_KEY, 'rows', len(written))
+        pipe.hincrby(LISTEN_METRICS_KEY, 'not_found', len(rows) - len(written))
+        pipe.hincrbyfloat(LISTEN_METRICS_KEY, 'total_flush_ms', duration_ms)
+        pipe.hset(LISTEN_METRICS_KEY, mapping={'last_flush_ms': round(duration_ms, 3), 'last_flush_rows': len(rows)})
+        pipe.execute()
+        record_listen_signatures(self.client, [(row['user_id'], row['transcription_id']) for row in written])
+
+        self.buffer = {}
+        self.buffered_since = None
+        return len(entry_ids)
+
+    def run_once(self) -> int:
+        self.read()
+        if self.buffer and (len(self.buffer) >= self.batch_size or self._remaining() <= 0):
+            return self.flush()
+        return 0
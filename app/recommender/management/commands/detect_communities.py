@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.redis import get_redis_connection
+from recommender.communities import run_community_job, take_community_request
+
+
+class Command(BaseCommand):
+    help = 'Run Louvain community detection over the persistent GDS projection when requested or on an interval.'
+
+    POLL_INTERVAL = 1.0
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run one job and exit.')
+        parser.add_argument('--force', action='store_true', help='Rerun Louvain even if the listen graph is unchanged.')
+        parser.add_argument('--interval', type=float, default=settings.RECO_COMMUNITY_INTERVAL)
+
+    def handle(self, *args, **options):
+        client = get_redis_connection()
+        last_run = None
+        while True:
+            # POST /reco/communities asks for a run now; otherwise one runs every interval.
+            requested = take_community_request(client)
+            if options['once'] or requested or last_run is None or time.monotonic() - last_run >= options['interval']:
+                status = run_community_job(client, force=options['force'])
+                last_run = time.monotonic()
+                if status is None:
+                    self.stdout.write('another worker holds the community lock')
+                else:
+                    self.stdout.write(
+                        f"state={status['state']} reprojected={status['reprojected']} "
+                        f"users={status['users']} communities={status['communities']}"
+                    )
+            if options['once']:
+                break
+            time.sleep(self.POLL_INTERVAL)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from recommender.listens import ListenStreamWriter, listen_stream_metrics
+
+
+class Command(BaseCommand):
+    help = 'Flush queued listen events from the Redis stream to Neo4j in UNWIND batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Flush what is queued and exit.')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--interval', type=float, default=None)
+        parser.add_argument('--consumer', default=None, help='Consumer name in the group (default: host-pid).')
+
+    def handle(self, *args, **options):
+        # With --once nothing waits for the time threshold: each read is flushed straight away.
+        interval = 0 if options['once'] else options['interval']
+        writer = ListenStreamWriter(consumer=options['consumer'], batch_size=options['batch_size'], interval=interval)
+        while True:
+            flushed = writer.run_once()
+            if flushed:
+                metrics = listen_stream_metrics(writer.client)
+                self.stdout.write(
+                    f"flushed={flushed} took={metrics['last_flush_ms']}ms "
+                    f"pending={metrics['pending']} undelivered={metrics['undelivered']}"
+                )
+            if options['once'] and not flushed:
+                break
@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.neo4j import read
+from core.redis import get_redis_connection
+from recommender.materialized import (
+    prune_listened_at,
+    publish_generation,
+    start_generation,
+    store_user_recommendations,
+)
+from recommender.views import COLLAB_QUERY, CONTENT_QUERY, HybridRecommendationView
+
+
+ACTIVE_USERS_QUERY = """
+MATCH (u:User)-[rel:LISTENED_TO]->(:Transcription)
+WHERE rel.ts >= $since
+RETURN DISTINCT u.id AS user_id
+"""
+
+
+class Command(BaseCommand):
+    help = 'Precompute content, collab and hybrid recommendations for active users into Redis.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.RECO_ACTIVE_DAYS,
+            help='Users with a listen in the last N days are materialized.',
+        )
+
+    def handle(self, *args, **options):
+        client = get_redis_connection()
+        window_start = time.time() - options['days'] * 86400
+        since = int(window_start * 1000)
+        # The generation is stamped before reading Neo4j: listens after this point make
+        # the stored results stale for their user.
+        generation = start_generation(client)
+        user_ids = [record['user_id'] for record in read(ACTIVE_USERS_QUERY, {'since': since})]
+        for user_id in user_ids:
+            content = read(CONTENT_QUERY, {'user_id': user_id})
+            collab = read(COLLAB_QUERY, {'user_id': user_id})
+            results = {
+                'content': content,
+                'collab': collab,
+                'hybrid': HybridRecommendationView.combine(content, collab),
+            }
+            store_user_recommendations(client, generation, user_id, results)
+        publish_generation(client, generation, len(user_ids))
+        pruned = prune_listened_at(client, window_start)
+        self.stdout.write(f'generation {generation}: {len(user_ids)} users materialized, {pruned} old listens pruned')
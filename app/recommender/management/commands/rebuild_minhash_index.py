@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.neo4j import read
+from core.redis import get_redis_connection
+from recommender.minhash import update_signature
+
+
+LISTEN_SETS_QUERY = """
+MATCH (u:User)-[:LISTENED_TO]->(t:Transcription)
+RETURN u.id AS user_id, collect(t.id) AS transcription_ids
+"""
+
+
+class Command(BaseCommand):
+    help = 'Recompute every MinHash signature and LSH bucket from the Neo4j listen graph.'
+
+    def handle(self, *args, **options):
+        client = get_redis_connection()
+        users = 0
+        # Listens keep the index current; this is for the first deployment, after changing
+        # the MinHash parameters, or to drop listens that were removed from the graph.
+        for record in read(LISTEN_SETS_QUERY, timeout=settings.NEO4J_GDS_TIMEOUT):
+            update_signature(client, record['user_id'], record['transcription_ids'], replace=True)
+            users += 1
+        self.stdout.write(f'{users} signatures rebuilt')
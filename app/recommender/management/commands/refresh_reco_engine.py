@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.neo4j import read
+from recommender.engine import SNAPSHOT_QUERY, EngineSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Snapshot the LISTENED_TO graph into the sparse item-item engine and write it to RECO_ENGINE_PATH.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.RECO_ENGINE_PATH)
+        parser.add_argument('--top-k', type=int, default=settings.RECO_ENGINE_TOP_K)
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            raise CommandError('Set RECO_ENGINE_PATH or pass --path.')
+        # One full export of the listen graph, so it gets the long GDS timeout.
+        snapshot = EngineSnapshot.build(read(SNAPSHOT_QUERY, timeout=settings.NEO4J_GDS_TIMEOUT), options['top_k'])
+        snapshot.save(options['path'])
+        stats = snapshot.stats()
+        self.stdout.write(
+            f"users={stats['users']} items={stats['items']} listens={stats['listens']} "
+            f"similarities={stats['similarities']} memory={stats['memory_bytes']['total']}B -> {options['path']}"
+        )
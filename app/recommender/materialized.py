@@ -0,0 +1,114 @@
+import time
+from typing import Any, Dict, Iterable, List
+
+from django.conf import settings
+
+
+RECOMMENDATION_KINDS = ('content', 'collab', 'hybrid')
+# Generation the views read from; bumped only once a whole run has been written.
+GENERATION_KEY = 'reco:generation'
+GENERATION_COUNTER_KEY = 'reco:generation:next'
+GENERATION_META_KEY = 'reco:generation:{generation}'
+USERS_KEY = 'reco:{generation}:users'
+RECOMMENDATIONS_KEY = 'reco:{generation}:{kind}:{user_id}'
+# Last listen per user; a generation started before it is stale for that user.
+LISTENED_AT_KEY = 'reco:listened_at'
+
+RETIRE_CHUNK_SIZE = 500
+
+# Members carry the title so a read is a single ZRANGE: `<id>\0<title>`.
+_SEPARATOR = '\x00'
+
+
+def _member(item: Dict[str, Any]) -> str:
+    return f"{item['id']}{_SEPARATOR}{item.get('title') or ''}"
+
+
+def start_generation(client) -> int:
+    generation = client.incr(GENERATION_COUNTER_KEY)
+    client.hset(GENERATION_META_KEY.format(generation=generation), mapping={'started_at': time.time()})
+    client.expire(GENERATION_META_KEY.format(generation=generation), settings.RECO_MATERIALIZED_TTL)
+    return generation
+
+
+def store_user_recommendations(client, generation: int, user_id: str, results: Dict[str, List[Dict[str, Any]]]) -> None:
+    ttl = settings.RECO_MATERIALIZED_TTL
+    pipe = client.pipeline(transaction=True)
+    for kind, items in results.items():
+        key = RECOMMENDATIONS_KEY.format(generation=generation, kind=kind, user_id=user_id)
+        pipe.delete(key)
+        if items:
+            pipe.zadd(key, {_member(item): item['score'] for item in items})
+            pipe.expire(key, ttl)
+    users_key = USERS_KEY.format(generation=generation)
+    pipe.sadd(users_key, user_id)
+    pipe.expire(users_key, ttl)
+    pipe.execute()
+
+
+# The previous generation is not deleted outright: a request that read the old pointer
+# just before the swap may still be reading it, so its keys expire after a grace period.
+def publish_generation(client, generation: int, users: int) -> None:
+    previous = client.get(GENERATION_KEY)
+    pipe = client.pipeline(transaction=True)
+    pipe.hset(GENERATION_META_KEY.format(generation=generation), mapping={'finished_at': time.time(), 'users': users})
+    pipe.set(GENERATION_KEY, generation)
+    pipe.execute()
+    if previous is not None and int(previous) != generation:
+        retire_generation(client, int(previous), settings.RECO_GENERATION_GRACE)
+
+
+def retire_generation(client, generation: int, grace: int) -> None:
+    users_key = USERS_KEY.format(generation=generation)
+    pipe = client.pipeline(transaction=False)
+    for count, user_id in enumerate(client.sscan_iter(users_key, count=RETIRE_CHUNK_SIZE), 1):
+        for kind in RECOMMENDATION_KINDS:
+            pipe.expire(RECOMMENDATIONS_KEY.format(generation=generation, kind=kind, user_id=user_id), grace)
+        if count % RETIRE_CHUNK_SIZE == 0:
+            pipe.execute()
+    pipe.expire(users_key, grace)
+    pipe.expire(GENERATION_META_KEY.format(generation=generation), grace)
+    pipe.execute()
+
+
+# Drops listens before `before` (the start of the materialization window). Generations and
+# engine snapshots are rebuilt well within that window, so such a listen no longer makes
+# anything served stale.
+def prune_listened_at(client, before: float) -> int:
+    stale = [
+        user_id
+        for user_id, listened_at in client.hscan_iter(LISTENED_AT_KEY, count=RETIRE_CHUNK_SIZE)
+        if float(listened_at) < before
+    ]
+    for start in range(0, len(stale), RETIRE_CHUNK_SIZE):
+        client.hdel(LISTENED_AT_KEY, *stale[start:start + RETIRE_CHUNK_SIZE])
+    return len(stale)
+
+
+def invalidate_users(client, user_ids: Iterable[str]) -> None:
+    now = time.time()
+    mapping = {user_id: now for user_id in user_ids}
+    if mapping:
+        client.hset(LISTENED_AT_KEY, mapping=mapping)
+
+
+# None means "not materialized": unknown user, no published generation, or a listen
+# newer than the generation. The caller then runs the live query.
+def materialized_recommendations(client, kind: str, user_id: str) -> List[Dict[str, Any]] | None:
+    generation = client.get(GENERATION_KEY)
+    if generation is None:
+        return None
+    pipe = client.pipeline(transaction=False)
+    pipe.hget(GENERATION_META_KEY.format(generation=generation), 'started_at')
+    pipe.hget(LISTENED_AT_KEY, user_id)
+    pipe.sismember(USERS_KEY.format(generation=generation), user_id)
+    pipe.zrange(RECOMMENDATIONS_KEY.format(generation=generation, kind=kind, user_id=user_id), 0, -1, withscores=True)
+    started_at, listened_at, known, members = pipe.execute()
+    if not known or started_at is None or (listened_at and float(listened_at) >= float(started_at)):
+        return None
+    results = []
+    for member, score in members:
+        item_id, title = member.split(_SEPARATOR, 1)
+        results.append({'id': item_id, 'title': title, 'score': score if kind == 'hybrid' else int(score)})
+    results.sort(key=lambda item: (-item['score'], item['id']))
+    return results
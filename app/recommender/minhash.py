@@ -0,0 +1,118 @@
+import hashlib
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+import redis
+
+
+# Changing any of these invalidates every stored signature: run `rebuild_minhash_index`.
+MINHASH_PERMUTATIONS = 128
+# 32 bands of 4 rows: pairs above a Jaccard of about (1/32) ** (1/4) = 0.42 are likely to
+# share a bucket, pairs well below it rarely do.
+MINHASH_BANDS = 32
+MINHASH_ROWS = MINHASH_PERMUTATIONS // MINHASH_BANDS
+MINHASH_SEED = 20240601
+_PRIME = (1 << 31) - 1
+
+SIGNATURE_KEY = 'reco:minhash:sig:{user_id}'
+BUCKET_KEY = 'reco:minhash:band:{band}:{bucket}'
+WATCH_RETRIES = 5
+
+_rng = np.random.default_rng(MINHASH_SEED)
+# h_i(x) = (a_i * x + b_i) mod p; with p < 2 ** 31 the products fit in uint64.
+_A = _rng.integers(1, _PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_EMPTY = np.full(MINHASH_PERMUTATIONS, _PRIME, dtype=np.uint32)
+
+
+def _item_hashes(item_ids: Iterable[str]) -> np.ndarray:
+    items = np.asarray(
+        [int.from_bytes(hashlib.blake2b(item_id.encode(), digest_size=4).digest(), 'big') for item_id in item_ids],
+        dtype=np.uint64,
+    ) % _PRIME
+    return ((items[:, None] * _A + _B) % _PRIME).astype(np.uint32)
+
+
+# A signature only ever goes down, so adding listens is an elementwise min; removals
+# would need a rebuild.
+def signature(item_ids: Iterable[str], base: np.ndarray | None = None) -> np.ndarray:
+    hashes = _item_hashes(list(item_ids))
+    start = _EMPTY if base is None else base
+    return np.minimum(start, hashes.min(axis=0)) if len(hashes) else start.copy()
+
+
+def _encode(sig: np.ndarray) -> str:
+    return sig.astype('>u4').tobytes().hex()
+
+
+def _decode(value: str) -> np.ndarray:
+    return np.frombuffer(bytes.fromhex(value), dtype='>u4').astype(np.uint32)
+
+
+def _buckets(sig: np.ndarray) -> List[str]:
+    bands = sig.reshape(MINHASH_BANDS, MINHASH_ROWS)
+    return [
+        BUCKET_KEY.format(band=band, bucket=hashlib.blake2b(rows.tobytes(), digest_size=8).hexdigest())
+        for band, rows in enumerate(bands)
+    ]
+
+
+# Folds `item_ids` into the user's signature and moves the user between LSH buckets for
+# the bands that changed. WATCH retries the read-modify-write if another listen for the
+# same user lands in between. `replace` starts from an empty signature (rebuilds).
+def update_signature(client, user_id: str, item_ids: Iterable[str], replace: bool = False) -> np.ndarray:
+    item_ids = list(item_ids)
+    key = SIGNATURE_KEY.format(user_id=user_id)
+    with client.pipeline() as pipe:
+        for _ in range(WATCH_RETRIES):
+            try:
+                pipe.watch(key)
+                stored = pipe.get(key)
+                old = _decode(stored) if stored else None
+                new = signature(item_ids, None if replace else old)
+                pipe.multi()
+                pipe.set(key, _encode(new))
+                old_buckets = _buckets(old) if old is not None else [None] * MINHASH_BANDS
+                for old_bucket, new_bucket in zip(old_buckets, _buckets(new)):
+                    if old_bucket != new_bucket:
+                        if old_bucket:
+                            pipe.srem(old_bucket, user_id)
+                        pipe.sadd(new_bucket, user_id)
+                pipe.execute()
+                return new
+            except redis.WatchError:
+                continue
+    raise RuntimeError(f'MinHash signature of {user_id} kept changing; gave up after {WATCH_RETRIES} tries.')
+
+
+def record_listen_signatures(client, listens: Iterable[Tuple[str, str]]) -> None:
+    items_by_user: Dict[str, List[str]] = defaultdict(list)
+    for user_id, transcription_id in listens:
+        items_by_user[user_id].append(transcription_id)
+    for user_id, item_ids in items_by_user.items():
+        update_signature(client, user_id, item_ids)
+
+
+# Candidates are the users sharing at least one band bucket; each is scored by the share
+# of equal signature positions, an unbiased estimate of the Jaccard index of the two
+# listen sets.
+def approximate_similar_users(client, user_id: str, limit: int = 5) -> List[Dict[str, Any]] | None:
+    stored = client.get(SIGNATURE_KEY.format(user_id=user_id))
+    if stored is None:
+        return None
+    sig = _decode(stored)
+    pipe = client.pipeline(transaction=False)
+    for bucket in _buckets(sig):
+        pipe.smembers(bucket)
+    candidates = sorted(set().union(*pipe.execute()) - {user_id})
+    if not candidates:
+        return []
+    signatures = client.mget([SIGNATURE_KEY.format(user_id=candidate) for candidate in candidates])
+    scored = [
+        (candidate, float(np.mean(_decode(value) == sig)))
+        for candidate, value in zip(candidates, signatures)
+        if value is not None
+    ]
+    scored.sort(key=lambda item: (-item[1], item[0]))
+    return [{'id': candidate, 'jaccard': round(score, 3)} for candidate, score in scored[:limit]]
@@ -4,16 +4,26 @@ from .views import (
     CollaborativeRecommendationView,
     ContentRecommendationView,
     HybridRecommendationView,
+    ListenBatchView,
     ListenEventView,
+    ListenStreamMetricsView,
+    Neo4jPoolStatsView,
+    RecommendationEngineStatsView,
     SimilarUsersView,
     CommunityDetectionView,
+    CommunityJobStatusView,
 )
 
 urlpatterns = [
     path('listen', ListenEventView.as_view(), name='reco-listen'),
+    path('listen/batch', ListenBatchView.as_view(), name='reco-listen-batch'),
+    path('listen/metrics', ListenStreamMetricsView.as_view(), name='reco-listen-metrics'),
     path('content/<str:user_id>', ContentRecommendationView.as_view(), name='reco-content'),
     path('collab/<str:user_id>', CollaborativeRecommendationView.as_view(), name='reco-collab'),
     path('hybrid/<str:user_id>', HybridRecommendationView.as_view(), name='reco-hybrid'),
     path('similar/<str:user_id>', SimilarUsersView.as_view(), name='reco-similar'),
     path('communities', CommunityDetectionView.as_view(), name='reco-communities'),
+    path('communities/status', CommunityJobStatusView.as_view(), name='reco-communities-status'),
+    path('neo4j/stats', Neo4jPoolStatsView.as_view(), name='reco-neo4j-stats'),
+    path('engine/stats', RecommendationEngineStatsView.as_view(), name='reco-engine-stats'),
 ]
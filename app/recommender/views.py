@@ -1,18 +1,46 @@
-from typing import Dict, List
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Tuple
 
+from django.conf import settings
 from neo4j.exceptions import Neo4jError
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from core.neo4j import run_query
+from core.neo4j import pool_stats, read, write
+from core.redis import get_redis_connection
+from realtime.analytics import record_listen
+from .communities import community_job_status, request_community_job, stored_communities
+from .engine import EngineSnapshot, recommendation_engine
+from .listens import chunked, enqueue_listen, listen_stream_metrics, store_listen_chunk
+from .materialized import LISTENED_AT_KEY, invalidate_users, materialized_recommendations
+from .minhash import approximate_similar_users, record_listen_signatures
 
 
+logger = logging.getLogger(__name__)
+
+# Shared by every hybrid request; each one submits one task per source. As many threads
+# as driver connections, so tasks wait for Neo4j rather than for a thread.
+_fanout_executor = ThreadPoolExecutor(max_workers=settings.NEO4J_MAX_POOL_SIZE, thread_name_prefix='reco-fanout')
+
+
+# Runs on the fan-out pool. Time spent queued comes off the budget, so the transaction
+# timeout is what is left of the request's deadline when the query actually starts.
+def _read_before(deadline: float, query: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError('Deadline passed while queued.')
+    return read(query, params, timeout=remaining)
+
+
+# No row comes back, and nothing is written (not even the user), when the transcription
+# does not exist.
 LISTEN_QUERY = """
+MATCH (t:Transcription {id: $transcription_id})
 MERGE (u:User {id: $user_id})
 ON CREATE SET u.name = coalesce($user_name, $user_id)
-WITH u
-MATCH (t:Transcription {id: $transcription_id})
 MERGE (u)-[rel:LISTENED_TO]->(t)
 ON CREATE SET rel.weight = coalesce($weight, 1), rel.ts = timestamp()
 ON MATCH SET rel.weight = coalesce($weight, rel.weight), rel.ts = timestamp()
@@ -44,33 +72,6 @@ RETURN candidate.id AS id, count(*) AS weight
 ORDER BY weight DESC LIMIT 5
 """
 
-COMMUNITY_QUERY = """
-CALL {
-    WITH $graph_name AS graph_name
-    CALL gds.graph.exists(graph_name) YIELD exists
-    WITH graph_name, exists
-    CALL apoc.do.when(exists,
-        'CALL gds.graph.drop($graph_name) YIELD graphName RETURN graphName',
-        'RETURN null as graphName',
-        {graph_name: graph_name}) YIELD value
-    RETURN 1
-}
-CALL gds.graph.project(
-    $graph_name,
-    'User',
-    {
-        LISTENED_TO: {
-            orientation: 'UNDIRECTED'
-        }
-    }
-)
-YIELD graphName
-CALL gds.louvain.stream(graphName)
-YIELD nodeId, communityId
-RETURN gds.util.asNode(nodeId).id AS user_id, communityId
-ORDER BY communityId
-"""
-
 
 class ListenEventView(APIView):
     permission_classes = [AllowAny]
@@ -81,47 +82,190 @@ class ListenEventView(APIView):
         weight = request.data.get('weight', 1)
         if not user_id or not transcription_id:
             return Response({'detail': 'user_id and transcription_id are required.'}, status=400)
+        invalidate_users(get_redis_connection(), [str(user_id)])
+        if settings.RECO_LISTEN_WRITE_BEHIND:
+            # Flushed to Neo4j by `flush_listen_events`; a missing transcription is only counted there.
+            enqueue_listen(
+                get_redis_connection(), str(user_id), str(transcription_id), weight, request.data.get('user_name')
+            )
+            return Response({'message': 'Listen event queued.'}, status=202)
         try:
-            list(
-                run_query(
-                    LISTEN_QUERY,
-                    {
-                        'user_id': str(user_id),
-                        'user_name': request.data.get('user_name'),
-                        'transcription_id': str(transcription_id),
-                        'weight': weight,
-                    },
-                )
+            stored = write(
+                LISTEN_QUERY,
+                {
+                    'user_id': str(user_id),
+                    'user_name': request.data.get('user_name'),
+                    'transcription_id': str(transcription_id),
+                    'weight': weight,
+                },
             )
         except Neo4jError as exc:
             return Response({'detail': str(exc)}, status=500)
+        if not stored:
+            return Response({'detail': 'Transcription not found.'}, status=404)
+        record_listen(get_redis_connection(), str(transcription_id), str(user_id))
+        record_listen_signatures(get_redis_connection(), [(str(user_id), str(transcription_id))])
         return Response({'message': 'Listen relationship stored.'})
 
 
+class ListenBatchView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a JSON array of listen events.'}, status=400)
+        results: List[Dict[str, Any]] = []
+        rows = []
+        for index, item in enumerate(request.data):
+            row, error = self._parse_row(index, item)
+            if error:
+                results.append({'index': index, 'status': 400, 'detail': error})
+            else:
+                rows.append(row)
+
+        client = get_redis_connection().pipeline(transaction=False)
+        stored_pairs = []
+        for chunk in chunked(rows, settings.RECO_LISTEN_BATCH_CHUNK_SIZE):
+            try:
+                found = store_listen_chunk(chunk)
+            except Neo4jError as exc:
+                results.extend({'index': row['index'], 'status': 500, 'detail': str(exc)} for row in chunk)
+                continue
+            for row in chunk:
+                if found.get(row['index']):
+                    results.append({'index': row['index'], 'status': 200})
+                    record_listen(client, row['transcription_id'], row['user_id'])
+                    stored_pairs.append((row['user_id'], row['transcription_id']))
+                else:
+                    results.append({'index': row['index'], 'status': 404, 'detail': 'Transcription not found.'})
+        invalidate_users(client, {user_id for user_id, _ in stored_pairs})
+        client.execute()
+        record_listen_signatures(get_redis_connection(), stored_pairs)
+
+        results.sort(key=lambda result: result['index'])
+        stored = sum(1 for result in results if result['status'] == 200)
+        status = 200 if stored == len(results) else 207
+        return Response({'stored': stored, 'results': results}, status=status)
+
+    @staticmethod
+    def _parse_row(index: int, item: Any) -> Tuple[Dict[str, Any] | None, str | None]:
+        if not isinstance(item, dict):
+            return None, 'Invalid JSON object.'
+        user_id = item.get('user_id')
+        transcription_id = item.get('transcription_id')
+        if not user_id or not transcription_id:
+            return None, 'user_id and transcription_id are required.'
+        weight = item.get('weight', 1)
+        if weight is not None and (isinstance(weight, bool) or not isinstance(weight, (int, float))):
+            return None, 'weight must be a number.'
+        row = {
+            'index': index,
+            'user_id': str(user_id),
+            'user_name': item.get('user_name'),
+            'transcription_id': str(transcription_id),
+            'weight': weight,
+        }
+        return row, None
+
+
+class ListenStreamMetricsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response(listen_stream_metrics())
+
+
+# The in-memory engine stands in for Neo4j when its snapshot knows the user and was built
+# after the user's last listen, the same staleness rule as the materialized store.
+def fresh_engine(user_id: str) -> EngineSnapshot | None:
+    engine = recommendation_engine()
+    if engine is None or not engine.has_user(user_id):
+        return None
+    listened_at = get_redis_connection().hget(LISTENED_AT_KEY, user_id)
+    if listened_at and float(listened_at) >= engine.built_at:
+        return None
+    return engine
+
+
+def materialized_or_live(
+    kind: str,
+    user_id: str,
+    live: Callable[[], List[Dict[str, Any]]],
+    from_engine: Callable[[EngineSnapshot], List[Dict[str, Any]]] | None = None,
+) -> Response:
+    recommendations = materialized_recommendations(get_redis_connection(), kind, user_id)
+    if recommendations is not None:
+        return Response(recommendations, headers={'X-Recommendations-Source': 'materialized'})
+    engine = fresh_engine(user_id) if from_engine else None
+    if engine is not None:
+        return Response(from_engine(engine), headers={'X-Recommendations-Source': 'engine'})
+    return Response(live(), headers={'X-Recommendations-Source': 'live'})
+
+
 class ContentRecommendationView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, user_id: str):
-        recommendations = list(run_query(CONTENT_QUERY, {'user_id': user_id}))
-        return Response(recommendations)
+        return materialized_or_live('content', user_id, lambda: read(CONTENT_QUERY, {'user_id': user_id}))
 
 
 class CollaborativeRecommendationView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, user_id: str):
-        recommendations = list(run_query(COLLAB_QUERY, {'user_id': user_id}))
-        return Response(recommendations)
+        return materialized_or_live(
+            'collab',
+            user_id,
+            lambda: read(COLLAB_QUERY, {'user_id': user_id}),
+            from_engine=lambda engine: engine.collab(user_id),
+        )
 
 
 class HybridRecommendationView(APIView):
     permission_classes = [AllowAny]
+    SOURCES = {'content': CONTENT_QUERY, 'collab': COLLAB_QUERY}
 
     def get(self, request, user_id: str):
-        content = list(run_query(CONTENT_QUERY, {'user_id': user_id}))
-        collab = list(run_query(COLLAB_QUERY, {'user_id': user_id}))
+        recommendations = materialized_recommendations(get_redis_connection(), 'hybrid', user_id)
+        if recommendations is not None:
+            return Response(recommendations, headers={'X-Recommendations-Source': 'materialized'})
+        recommendations, missing = self.live(user_id)
+        if len(missing) == len(self.SOURCES):
+            return Response({'detail': 'No recommendation source answered in time.'}, status=504)
+        headers = {'X-Recommendations-Source': 'live'}
+        if missing:
+            headers['X-Partial-Results'] = ','.join(missing)
+        return Response(recommendations, headers=headers)
 
-        def normalise(items: List[Dict[str, float]]) -> Dict[str, float]:
+    # Both sources run at once, so latency is about the slower one, capped by the deadline.
+    # A source that times out or fails is left out and reported in `missing`. Its query
+    # carries the same deadline as a transaction timeout, so the server aborts it instead
+    # of finishing work nobody is waiting for.
+    @classmethod
+    def live(cls, user_id: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        budget = settings.RECO_HYBRID_DEADLINE_MS / 1000
+        deadline = time.monotonic() + budget
+        futures = {
+            name: _fanout_executor.submit(_read_before, deadline, query, {'user_id': user_id})
+            for name, query in cls.SOURCES.items()
+        }
+        wait(futures.values(), timeout=budget)
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        missing = []
+        for name, future in futures.items():
+            if future.done() and future.exception() is None:
+                results[name] = future.result()
+                continue
+            if future.done():
+                logger.warning('Hybrid source %s failed for user %s: %s', name, user_id, future.exception())
+            else:
+                future.cancel()
+            missing.append(name)
+        return cls.combine(results.get('content', []), results.get('collab', [])), missing
+
+    @staticmethod
+    def combine(content: List[Dict[str, Any]], collab: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        def normalise(items: List[Dict[str, Any]]) -> Dict[str, float]:
             if not items:
                 return {}
             max_score = max(item['score'] for item in items)
@@ -131,33 +275,74 @@ class HybridRecommendationView(APIView):
 
         content_scores = normalise(content)
         collab_scores = normalise(collab)
-        ids = set(content_scores) | set(collab_scores)
-        output = []
-        for item_id in ids:
-            combined_score = content_scores.get(item_id, 0) + collab_scores.get(item_id, 0)
-            title = next((item['title'] for item in content if item['id'] == item_id), None)
-            if not title:
-                title = next((item['title'] for item in collab if item['id'] == item_id), '')
-            output.append({'id': item_id, 'title': title, 'score': round(combined_score, 3)})
-        output.sort(key=lambda item: item['score'], reverse=True)
-        return Response(output)
+        # Content titles win over collab ones for the same id.
+        titles = {item['id']: item['title'] for item in collab if item.get('title')}
+        titles.update({item['id']: item['title'] for item in content if item.get('title')})
+        output = [
+            {
+                'id': item_id,
+                'title': titles.get(item_id, ''),
+                'score': round(content_scores.get(item_id, 0) + collab_scores.get(item_id, 0), 3),
+            }
+            for item_id in content_scores.keys() | collab_scores.keys()
+        ]
+        # Ties are broken by id so equal scores always come back in the same order.
+        output.sort(key=lambda item: (-item['score'], item['id']))
+        return output
 
 
 class SimilarUsersView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, user_id: str):
-        users = list(run_query(SIMILAR_USERS_QUERY, {'user_id': user_id}))
-        return Response(users)
+        mode = request.query_params.get('mode', 'exact')
+        if mode == 'approx':
+            users = approximate_similar_users(get_redis_connection(), user_id)
+            if users is None:
+                return Response({'detail': 'No MinHash signature for this user.'}, status=404)
+            return Response(users, headers={'X-Recommendations-Source': 'minhash'})
+        if mode != 'exact':
+            return Response({'detail': 'mode must be exact or approx.'}, status=400)
+        engine = fresh_engine(user_id)
+        if engine is not None:
+            return Response(engine.similar_users(user_id), headers={'X-Recommendations-Source': 'engine'})
+        users = read(SIMILAR_USERS_QUERY, {'user_id': user_id})
+        return Response(users, headers={'X-Recommendations-Source': 'live'})
 
 
 class CommunityDetectionView(APIView):
     permission_classes = [AllowAny]
 
+    # Served from the last `detect_communities` run; POST asks the worker for a new one.
     def get(self, request):
-        graph_name = request.query_params.get('graph_name', 'abdb_communities')
-        try:
-            result = list(run_query(COMMUNITY_QUERY, {'graph_name': graph_name}))
-        except Neo4jError as exc:
-            return Response({'detail': str(exc)}, status=500)
-        return Response(result)
+        communities = stored_communities(get_redis_connection())
+        if communities is None:
+            return Response({'detail': 'Communities have not been computed yet.'}, status=404)
+        return Response(communities)
+
+    def post(self, request):
+        return Response(request_community_job(get_redis_connection()), status=202)
+
+
+class CommunityJobStatusView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response(community_job_status(get_redis_connection()))
+
+
+class Neo4jPoolStatsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response(pool_stats())
+
+
+class RecommendationEngineStatsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        engine = recommendation_engine()
+        if engine is None:
+            return Response({'detail': 'No engine snapshot is loaded.'}, status=404)
+        return Response({**engine.stats(), 'path': settings.RECO_ENGINE_PATH})
@@ -0,0 +1,212 @@
+import asyncio
+import json
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import mongomock
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.asgi import ASGIHandler
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from fakeredis import FakeAsyncRedis
+
+from transcripts.async_views import AsyncTranscriptionDetailView, AsyncTranscriptionListCreateView
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, value):
+        self.cursor = self.cursor.limit(value)
+        return self
+
+    async def to_list(self, length):
+        return list(self.cursor)[:length]
+
+    async def __aiter__(self):
+        for document in self.cursor:
+            self.pulled = getattr(self, 'pulled', 0) + 1
+            yield document
+
+
+# Motor-shaped wrapper over a mongomock collection.
+class AsyncCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+class AsyncTranscriptionViewTests(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.user = get_user_model().objects.create_user(username='async', password='pass1234')
+        self.collection = mongomock.MongoClient().db.collection
+        self.redis = FakeAsyncRedis(decode_responses=True)
+        self.outbox = mongomock.MongoClient().db.outbox
+        self.patches = [
+            patch('transcripts.async_views.get_async_collection', return_value=AsyncCollection(self.collection)),
+            patch('transcripts.async_views.get_async_redis_connection', return_value=self.redis),
+            patch('transcripts.outbox.get_async_outbox_collection', return_value=AsyncCollection(self.outbox)),
+        ]
+        for p in self.patches:
+            p.start()
+        self.addCleanup(lambda: [p.stop() for p in self.patches])
+
+    def _request(self, method, path, data=None, **extra):
+        if data is not None:
+            extra.update(data=json.dumps(data), content_type='application/json')
+        request = getattr(self.factory, method)(path, **extra)
+        request.user = self.user
+        request._dont_enforce_csrf_checks = True
+        return request
+
+    async def test_crud_flow(self):
+        list_view = AsyncTranscriptionListCreateView.as_view()
+        detail_view = AsyncTranscriptionDetailView.as_view()
+        payload = {
+            'title': 'Async',
+            'text': 'Lorem ipsum',
+            'folder': 'docs',
+            'topics': ['ai'],
+            'length_sec': 60,
+            'speakers': ['Alice'],
+        }
+        response = await list_view(self._request('post', '/transcriptions/', payload))
+        self.assertEqual(response.status_code, 201)
+        created = json.loads(response.content)
+        event = self.outbox.find_one()
+        self.assertEqual(event['payload']['items'][0]['id'], created['id'])
+
+        response = await list_view(self._request('get', '/transcriptions/'))
+        self.assertEqual(len(json.loads(response.content)['results']), 1)
+
+        response = await detail_view(
+            self._request('get', f"/transcriptions/{created['id']}", headers={'If-None-Match': response['ETag']}),
+            pk=created['id'],
+        )
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = await detail_view(
+            self._request('get', f"/transcriptions/{created['id']}", headers={'If-None-Match': etag}), pk=created['id']
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = await detail_view(
+            self._request(
+                'put', f"/transcriptions/{created['id']}", {**payload, 'title': 'Updated'}, headers={'If-Match': etag}
+            ),
+            pk=created['id'],
+        )
+        self.assertEqual(json.loads(response.content)['title'], 'Updated')
+
+        response = await detail_view(self._request('delete', f"/transcriptions/{created['id']}"), pk=created['id'])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.collection.count_documents({}), 0)
+        # One collection version bump per write.
+        self.assertEqual(await self.redis.hget('transcriptions:version', 'version'), '3')
+
+    async def test_rejects_anonymous_requests(self):
+        request = self.factory.get('/transcriptions/')
+        request.user = AnonymousUser()
+        response = await AsyncTranscriptionListCreateView.as_view()(request)
+        self.assertEqual(response.status_code, 403)
+
+    async def test_accepts_form_bodies_like_the_sync_views(self):
+        request = self.factory.post(
+            '/transcriptions/',
+            {'title': 'Form', 'text': 'Lorem', 'folder': 'docs', 'topics': ['ai', 'ml'], 'length_sec': 60, 'speakers': 'Al'},
+        )
+        request.user = self.user
+        request._dont_enforce_csrf_checks = True
+        response = await AsyncTranscriptionListCreateView.as_view()(request)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.collection.find_one()['topics'], ['ai', 'ml'])
+
+        request = self.factory.post('/transcriptions/', data='{"title": ', content_type='application/json')
+        request.user = self.user
+        request._dont_enforce_csrf_checks = True
+        response = await AsyncTranscriptionListCreateView.as_view()(request)
+        response.render()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', json.loads(response.content)['detail'])
+
+
+# Sessions normally live in the Redis cache; signed cookies keep this test off the network.
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+class AsyncExportTests(TestCase):
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.collection
+        for index in range(5):
+            self.collection.insert_one({'title': f'E{index}', 'created_at': datetime(2024, 1, 1, index)})
+        user = get_user_model().objects.create_user(username='exporter', password='pass1234')
+        self.client.force_login(user)
+        self.session_id = self.client.cookies['sessionid'].value
+
+    async def _asgi_get(self, path: str, query: str) -> list:
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'cookie', f'sessionid={self.session_id}'.encode())],
+            'client': ('127.0.0.1', 50000),
+            'server': ('testserver', 80),
+        }
+        requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        disconnected = asyncio.Event()
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        messages = []
+
+        async def send(message):
+            if message['type'] == 'http.response.body':
+                message = {**message, 'pulled': self.cursor.pulled}
+            messages.append(message)
+
+        await ASGIHandler()(scope, receive, send)
+        disconnected.set()
+        return messages
+
+    async def test_export_streams_from_an_async_cursor_under_asgi(self):
+        collection = AsyncCollection(self.collection)
+
+        def find(*args, **kwargs):
+            self.cursor = collection.find(*args, **kwargs)
+            return self.cursor
+
+        with patch('transcripts.views.get_async_collection', return_value=MagicMock(find=find)), patch(
+            'transcripts.views.get_collection', side_effect=AssertionError('sync cursor used under ASGI')
+        ), patch('transcripts.export.EXPORT_CHUNK_BYTES', 1):
+            messages = await self._asgi_get('/transcriptions/export.ndjson', 'fields=title')
+
+        self.assertEqual(messages[0]['status'], 200)
+        bodies = [message for message in messages[1:] if message.get('body')]
+        # The first row goes out before the cursor is exhausted: nothing is buffered whole.
+        self.assertEqual(bodies[0]['pulled'], 1)
+        rows = [json.loads(line) for line in b''.join(message['body'] for message in bodies).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['E4', 'E3', 'E2', 'E1', 'E0'])
@@ -1,8 +1,12 @@
 import time
+from unittest.mock import MagicMock, patch
 
 from django.test import TestCase, override_settings
+from fakeredis import FakeRedis
 from rest_framework.test import APIClient
 
+from core.swr import StaleWhileRevalidateCache
+
 
 @override_settings(
     CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
@@ -20,3 +24,45 @@ class CachePingTests(TestCase):
         self.assertEqual(response2.status_code, 200)
         self.assertLess(elapsed, 50)
         self.assertEqual(response2.data['message'], 'Cache hit')
+
+
+class StaleWhileRevalidateTests(TestCase):
+    def setUp(self):
+        self.redis = FakeRedis(decode_responses=True)
+        self.cache = StaleWhileRevalidateCache('test', soft_ttl=10, hard_ttl=60, lock_ttl=5, client=self.redis)
+        self.compute = MagicMock(side_effect=[{'n': 1}, {'n': 2}, {'n': 3}])
+
+    def test_miss_then_hit(self):
+        first = self.cache.get('k', self.compute)
+        second = self.cache.get('k', self.compute)
+        self.assertEqual((first.status, first.value), ('miss', {'n': 1}))
+        self.assertEqual((second.status, second.value), ('hit', {'n': 1}))
+        self.assertEqual(self.compute.call_count, 1)
+        self.assertLessEqual(self.redis.ttl('swr:test:k'), 60)
+
+    def test_stale_value_is_served_while_one_caller_refreshes(self):
+        self.cache.get('k', self.compute)
+        executor = MagicMock()
+        with patch('core.swr.time.time', return_value=time.time() + 30), patch('core.swr._refresh_executor', executor):
+            stale = self.cache.get('k', self.compute)
+            again = self.cache.get('k', self.compute)
+        self.assertEqual((stale.status, stale.value), ('stale', {'n': 1}))
+        self.assertGreaterEqual(stale.age, 29)
+        self.assertEqual(again.status, 'stale')
+        # The second caller found the lock taken and did not schedule another refresh.
+        executor.submit.assert_called_once()
+        executor.submit.call_args.args[0](*executor.submit.call_args.args[1:])
+        refreshed = self.cache.get('k', self.compute)
+        self.assertEqual((refreshed.status, refreshed.value), ('hit', {'n': 2}))
+        self.assertIsNone(self.redis.get('swr:test:k:lock'))
+
+    def test_waiter_uses_value_computed_by_lock_holder(self):
+        self.redis.set('swr:test:k:lock', 'other', ex=5)
+
+        def holder_finishes(seconds):
+            self.cache._store('k', {'n': 42})
+
+        with patch('core.swr.time.sleep', side_effect=holder_finishes):
+            result = self.cache.get('k', self.compute)
+        self.assertEqual(result.value, {'n': 42})
+        self.compute.assert_not_called()
@@ -0,0 +1,260 @@
+import io
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import mongomock
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from fakeredis import FakeRedis
+from pymongo.errors import ExecutionTimeout
+from rest_framework.test import APIClient
+
+from dashboards.consumers import DashboardConsumer, dashboard_snapshot
+from dashboards.handlers import buffer_dashboard_deltas
+from dashboards.live import push_deltas
+from dashboards.rollups import accumulate, apply_rollups, rebuild_rollups, rollup_series
+from dashboards.sketches import hll_estimate, hll_merge, hll_registers
+
+
+class SketchTests(TestCase):
+    def test_hll_estimate_is_close_and_mergeable(self):
+        first = hll_registers(f'speaker-{index}' for index in range(3000))
+        second = hll_registers(f'speaker-{index}' for index in range(2000, 5000))
+        self.assertAlmostEqual(hll_estimate(first), 3000, delta=300)
+        self.assertAlmostEqual(hll_estimate(hll_merge([first, second])), 5000, delta=500)
+        self.assertEqual(hll_estimate(hll_registers(['a', 'b', 'a'])), 2)
+
+
+@override_settings(DASHBOARD_SOURCE='rollups', DASHBOARD_DAYS=14)
+class DashboardRollupTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        db = mongomock.MongoClient().db
+        self.transcriptions = db.transcriptions
+        self.rollups = db.transcription_daily_stats
+        self.redis = FakeRedis(decode_responses=True)
+        self.patches = [
+            patch('dashboards.views.get_rollup_collection', return_value=self.rollups),
+            patch('dashboards.views.get_redis_connection', return_value=self.redis),
+        ]
+        for p in self.patches:
+            p.start()
+        self.addCleanup(lambda: [p.stop() for p in self.patches])
+
+    def _state(self, **overrides):
+        state = {'folder': 'docs', 'topics': ['ai'], 'length_sec': 60, 'speakers': ['Alice']}
+        state.update(overrides)
+        return state
+
+    def test_accumulate_applies_create_update_and_delete(self):
+        changes = [
+            ('2024-05-06T09:15:00', None, self._state(topics=['ai', 'ai', 'ml'])),
+            ('2024-05-06T10:00:00', None, self._state(length_sec=120)),
+            ('2024-05-06T10:00:00', self._state(length_sec=120), self._state(length_sec=30, topics=['web.dev'])),
+            ('2024-05-06T09:15:00', self._state(topics=['ai', 'ml']), None),
+        ]
+        bucket = accumulate(changes)['2024-05-06']
+        self.assertEqual(bucket['count'], 1)
+        self.assertEqual(bucket['length_sum'], 30)
+        self.assertEqual(dict(bucket['hours']), {'09': 0, '10': 1})
+        self.assertEqual(bucket['topics']['ai'], 0)
+        self.assertEqual(bucket['topics']['web．dev'], 1)
+
+    def test_summary_reads_rollups_at_each_granularity(self):
+        today = datetime.utcnow().replace(hour=8, minute=0, second=0, microsecond=0)
+        yesterday = today - timedelta(days=1)
+        apply_rollups(
+            self.rollups,
+            [
+                (today.isoformat(), None, self._state(speakers=['Alice', 'Bob'])),
+                (today.replace(hour=9).isoformat(), None, self._state(topics=['ml'], length_sec=120)),
+                (yesterday.isoformat(), None, self._state(speakers=['Carol'])),
+            ],
+        )
+        response = self.client.get('/dash/summary')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['per_day'],
+            [{'_id': yesterday.strftime('%Y-%m-%d'), 'count': 1}, {'_id': today.strftime('%Y-%m-%d'), 'count': 2}],
+        )
+        self.assertEqual(response.data['top_topics'], [{'_id': 'ai', 'count': 2}, {'_id': 'ml', 'count': 1}])
+        self.assertEqual(response.data['average_duration'], 80)
+        self.assertEqual(response.data['distinct_speakers'], 3)
+
+        hours = self.client.get('/dash/summary', {'granularity': 'hour'}).data['series']
+        self.assertEqual([bucket['count'] for bucket in hours], [1, 1, 1])
+        self.assertEqual(hours[-1]['_id'], today.strftime('%Y-%m-%dT09:00'))
+        self.assertEqual(self.client.get('/dash/summary', {'granularity': 'month'}).status_code, 400)
+
+    def test_summary_is_cached_with_age_headers(self):
+        first = self.client.get('/dash/summary')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        apply_rollups(self.rollups, [(datetime.utcnow().isoformat(), None, self._state())])
+        second = self.client.get('/dash/summary')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second['Age'], '0')
+        self.assertEqual(second.data['per_day'], [])
+
+    def test_week_buckets_follow_iso_weeks(self):
+        rollups = [
+            {'_id': '2024-01-07', 'hours': {'10': 2}},
+            {'_id': '2024-01-08', 'hours': {'10': 1, '11': 1}},
+        ]
+        self.assertEqual(
+            rollup_series(rollups, 'week'),
+            [{'_id': '2024-W01', 'count': 2}, {'_id': '2024-W02', 'count': 2}],
+        )
+
+    def test_rebuild_replaces_drifted_rollups(self):
+        created_at = datetime(2024, 5, 6, 9, 30)
+        self.transcriptions.insert_many(
+            [
+                {'created_at': created_at, 'length_sec': 60, 'topics': ['ai'], 'speakers': ['Alice']},
+                {'created_at': created_at, 'length_sec': 30, 'topics': [], 'speakers': ['Bob']},
+            ]
+        )
+        self.rollups.insert_many([{'_id': '2024-05-06', 'count': 9}, {'_id': '2024-05-01', 'count': 4}])
+        command_module = 'dashboards.management.commands.rebuild_dashboard_rollups'
+        with patch(f'{command_module}.get_collection', return_value=self.transcriptions), patch(
+            f'{command_module}.get_rollup_collection', return_value=self.rollups
+        ), patch(f'{command_module}.get_redis_connection', return_value=FakeRedis(decode_responses=True)):
+            call_command('rebuild_dashboard_rollups', stdout=io.StringIO())
+            self.assertEqual(rebuild_rollups(self.transcriptions, self.rollups), 1)
+            output = io.StringIO()
+            call_command('rebuild_dashboard_rollups', if_empty=True, stdout=output)
+        self.assertIn('skipping', output.getvalue())
+        rollup = self.rollups.find_one({'_id': '2024-05-06'})
+        self.assertEqual(rollup['count'], 2)
+        self.assertEqual(rollup['length_sum'], 90)
+        self.assertEqual(rollup['hours'], {'09': 2})
+        self.assertEqual(hll_estimate(rollup['speakers_hll']), 2)
+        self.assertIsNone(self.rollups.find_one({'_id': '2024-05-01'}))
+
+
+@override_settings(DASHBOARD_SOURCE='live', DASHBOARD_DAYS=14)
+class DashboardLiveTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.db = mongomock.MongoClient().db
+        self.patches = [
+            patch('dashboards.views.get_mongo_db', return_value=self.db),
+            patch('dashboards.views.get_redis_connection', return_value=FakeRedis(decode_responses=True)),
+        ]
+        for p in self.patches:
+            p.start()
+        self.addCleanup(lambda: [p.stop() for p in self.patches])
+
+    def test_live_summary_counts_speakers_in_one_pass(self):
+        now = datetime.utcnow()
+        self.db.transcriptions.insert_many(
+            [
+                {'created_at': now, 'length_sec': 60, 'topics': ['ai', 'ml'], 'speakers': ['Alice', 'Bob']},
+                {'created_at': now, 'length_sec': 120, 'topics': ['ai'], 'speakers': ['Bob', 'Carol']},
+                {'created_at': now, 'length_sec': 30, 'topics': []},
+            ]
+        )
+        with patch.object(self.db.transcriptions, 'aggregate', wraps=self.db.transcriptions.aggregate) as aggregate:
+            response = self.client.get('/dash/summary')
+        self.assertEqual(aggregate.call_count, 1)
+        self.assertTrue(aggregate.call_args.kwargs['allowDiskUse'])
+        self.assertEqual(response.data['per_day'], [{'_id': now.strftime('%Y-%m-%d'), 'count': 3}])
+        self.assertEqual(response.data['top_topics'], [{'_id': 'ai', 'count': 2}, {'_id': 'ml', 'count': 1}])
+        self.assertEqual(response.data['average_duration'], 70)
+        self.assertEqual(response.data['distinct_speakers'], 3)
+        self.assertFalse(response.data['partial'])
+
+    def test_live_summary_degrades_when_over_budget(self):
+        now = datetime.utcnow()
+        self.db.transcriptions.insert_one({'created_at': now, 'length_sec': 60, 'speakers': ['Alice']})
+        aggregate = self.db.transcriptions.aggregate
+
+        def facet_times_out(pipeline, **kwargs):
+            if '$facet' in pipeline[0]:
+                raise ExecutionTimeout('operation exceeded time limit')
+            return aggregate(pipeline, **kwargs)
+
+        with patch.object(self.db.transcriptions, 'aggregate', side_effect=facet_times_out):
+            response = self.client.get('/dash/summary')
+        self.assertTrue(response.data['partial'])
+        self.assertEqual(response.data['per_day'], [{'_id': now.strftime('%Y-%m-%d'), 'count': 1}])
+        self.assertIsNone(response.data['distinct_speakers'])
+
+
+@override_settings(DASHBOARD_SOURCE='rollups')
+class DashboardPushTests(TestCase):
+    def setUp(self):
+        self.redis = FakeRedis(decode_responses=True)
+        self.rollups = mongomock.MongoClient().db.transcription_daily_stats
+        self.patches = [
+            patch('dashboards.handlers.get_redis_connection', return_value=self.redis),
+            patch('dashboards.consumers.get_redis_connection', return_value=self.redis),
+            patch('dashboards.views.get_redis_connection', return_value=self.redis),
+            patch('dashboards.views.get_rollup_collection', return_value=self.rollups),
+            patch('dashboards.consumers.get_rollup_collection', return_value=self.rollups),
+        ]
+        for p in self.patches:
+            p.start()
+        self.addCleanup(lambda: [p.stop() for p in self.patches])
+
+    def _events(self, created_at='2024-05-06T09:00:00'):
+        state = {'folder': 'docs', 'topics': ['ai', 'ml'], 'length_sec': 60, 'speakers': ['Alice']}
+        return [
+            {
+                'type': 'transcriptions.created',
+                'payload': {'items': [{'created_at': created_at, **state}] * 2},
+            },
+            {
+                'type': 'transcriptions.updated',
+                'payload': {'created_at': created_at, 'before': state, 'after': {**state, 'topics': ['ai']}},
+            },
+        ]
+
+    def test_deltas_are_coalesced_into_one_message(self):
+        channel_layer = MagicMock()
+        channel_layer.group_send = AsyncMock()
+        self.redis.set('realtime:transcriptions_count', 7)
+        buffer_dashboard_deltas(self._events()[:1])
+        buffer_dashboard_deltas(self._events()[1:])
+
+        message = push_deltas(self.redis, channel_layer)
+        self.assertEqual(message, {'per_day': {'2024-05-06': 2}, 'topics': {'ai': 2, 'ml': 1}, 'seq': 1, 'counter': 7})
+        channel_layer.group_send.assert_awaited_once_with('dashboard', {'type': 'dashboard_delta', 'data': message})
+        self.assertIsNone(push_deltas(self.redis, channel_layer))
+
+    def test_consumer_sends_snapshot_then_deltas(self):
+        consumer = DashboardConsumer()
+        consumer.channel_layer = MagicMock(group_add=AsyncMock(), group_discard=AsyncMock())
+        consumer.channel_name = 'dashboard-test'
+        sent = []
+        with patch.object(DashboardConsumer, 'accept', AsyncMock()), patch.object(
+            DashboardConsumer, 'send_json', AsyncMock(side_effect=sent.append)
+        ):
+            async_to_sync(consumer.connect)()
+            consumer.channel_layer.group_add.assert_awaited_once_with('dashboard', 'dashboard-test')
+            self.assertEqual(sent[0]['type'], 'snapshot')
+            self.assertEqual(sent[0]['summary']['per_day'], [])
+
+            async_to_sync(consumer.dashboard_delta)({'type': 'dashboard_delta', 'data': {'counter': 3}})
+            self.assertEqual(sent[1], {'type': 'delta', 'counter': 3})
+
+    def test_snapshot_matches_the_last_drained_delta(self):
+        channel_layer = MagicMock()
+        channel_layer.group_send = AsyncMock()
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        self.rollups.insert_one({'_id': today, 'count': 3, 'topics': {'ai': 3, 'old': 1}, 'hours': {'08': 3}})
+        snapshot = dashboard_snapshot()
+        self.assertEqual((snapshot['per_day'], snapshot['topics'], snapshot['seq']), ({today: 3}, {'ai': 3, 'old': 1}, 0))
+
+        buffer_dashboard_deltas(self._events(f'{today}T09:00:00')[:1])
+        first = push_deltas(self.redis, channel_layer)
+        # Buffered but not drained yet: the snapshot leaves it to the next delta.
+        buffer_dashboard_deltas(self._events(f'{today}T09:00:00')[1:])
+        snapshot = dashboard_snapshot()
+        second = push_deltas(self.redis, channel_layer)
+
+        self.assertEqual(snapshot['seq'], first['seq'])
+        self.assertEqual(snapshot['per_day'], {today: 5})
+        self.assertEqual(snapshot['topics'], {'ai': 5, 'ml': 2, 'old': 1})
+        self.assertEqual(second['seq'], first['seq'] + 1)
+        self.assertEqual(second['topics'], {'ml': -1})
@@ -0,0 +1,61 @@
+import io
+from unittest.mock import patch
+
+import mongomock
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from transcripts.indexes import TRANSCRIPTION_INDEXES, ensure_indexes, winning_plan_stages
+
+
+class TranscriptionIndexTests(TestCase):
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.transcriptions
+
+    def test_ensure_indexes_is_idempotent(self):
+        report = ensure_indexes(self.collection)
+        self.assertEqual(len(report['created']), len(TRANSCRIPTION_INDEXES))
+        report = ensure_indexes(self.collection)
+        self.assertEqual(report['created'], [])
+        self.assertEqual(len(report['unchanged']), len(TRANSCRIPTION_INDEXES))
+
+    def test_ensure_indexes_replaces_changed_definition(self):
+        self.collection.create_index([('folder', 1)], name='folder_created_at')
+        self.collection.create_index([('title', 1)], name='legacy_title')
+        report = ensure_indexes(self.collection, drop_unknown=True)
+        self.assertIn('folder_created_at', report['replaced'])
+        self.assertEqual(report['dropped'], ['legacy_title'])
+        info = self.collection.index_information()
+        self.assertEqual(
+            [field for field, _ in info['folder_created_at']['key']],
+            ['folder', 'created_at', '_id'],
+        )
+
+    def test_winning_plan_stages_ignores_rejected_plans(self):
+        explain = {
+            'queryPlanner': {
+                'winningPlan': {'stage': 'LIMIT', 'inputStage': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}},
+                'rejectedPlans': [{'stage': 'COLLSCAN'}],
+            }
+        }
+        self.assertEqual(winning_plan_stages(explain), ['LIMIT', 'FETCH', 'IXSCAN'])
+
+    def test_check_reports_expected_scans_and_fails_on_others(self):
+        def explain(stage):
+            return {'queryPlanner': {'winningPlan': {'stage': stage}}}
+
+        explains = {
+            'list': explain('IXSCAN'),
+            'dashboard_summary': explain('COLLSCAN'),
+        }
+        command_module = 'transcripts.management.commands.ensure_transcription_indexes'
+        with patch(f'{command_module}.get_collection', return_value=self.collection), patch(
+            f'{command_module}.get_outbox_collection', return_value=self.collection.database.outbox
+        ), patch('transcripts.indexes.query_shape_explains', return_value=explains):
+            output = io.StringIO()
+            call_command('ensure_transcription_indexes', check=True, stdout=output)
+            self.assertIn('Expected COLLSCAN: dashboard_summary', output.getvalue())
+
+            explains['list'] = explain('COLLSCAN')
+            with self.assertRaisesMessage(CommandError, 'list'):
+                call_command('ensure_transcription_indexes', check=True, stdout=io.StringIO())
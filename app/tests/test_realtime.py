@@ -0,0 +1,61 @@
+from datetime import datetime
+from unittest.mock import patch
+
+from django.test import TestCase
+from fakeredis import FakeRedis
+from rest_framework.test import APIClient
+
+from realtime.analytics import TOPK_CAPACITY, record_topics, topic_estimate, trending_topics
+from realtime.handlers import update_realtime_analytics
+
+
+class RealtimeAnalyticsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.redis = FakeRedis(decode_responses=True)
+        self.patches = [
+            patch('realtime.views.get_redis_connection', return_value=self.redis),
+            patch('realtime.handlers.get_redis_connection', return_value=self.redis),
+            patch('recommender.views.get_redis_connection', return_value=self.redis),
+        ]
+        for p in self.patches:
+            p.start()
+        self.addCleanup(lambda: [p.stop() for p in self.patches])
+
+    def test_created_events_feed_speakers_and_trending_topics(self):
+        items = [
+            {'id': '1', 'topics': ['ai', 'ai', 'ml'], 'speakers': ['Alice', 'Bob']},
+            {'id': '2', 'topics': ['ai'], 'speakers': ['Bob']},
+        ]
+        update_realtime_analytics([{'type': 'transcriptions.created', 'payload': {'items': items}}])
+
+        response = self.client.get('/realtime/speakers')
+        self.assertEqual(response.data['distinct_speakers'], 2)
+        response = self.client.get('/realtime/topics/trending', {'topic': 'ai'})
+        self.assertEqual(response.data['topics'], [{'topic': 'ai', 'count': 2}, {'topic': 'ml', 'count': 1}])
+        self.assertEqual(response.data['estimate'], {'topic': 'ai', 'count': 2})
+        self.assertEqual(self.client.get('/realtime/topics/trending', {'limit': 'x'}).status_code, 400)
+
+    def test_top_k_keeps_fixed_capacity(self):
+        now = datetime(2024, 5, 6, 12)
+        record_topics(self.redis, {f'topic-{index}': index + 1 for index in range(TOPK_CAPACITY + 20)}, now)
+        record_topics(self.redis, {'late': 500}, now)
+        top = trending_topics(self.redis, limit=TOPK_CAPACITY + 20, now=now)
+        self.assertEqual(len(top), TOPK_CAPACITY)
+        self.assertEqual(top[0], {'topic': 'late', 'count': 500})
+        self.assertGreaterEqual(topic_estimate(self.redis, 'topic-3', now), 4)
+        self.assertEqual(topic_estimate(self.redis, 'unseen', datetime(2024, 5, 7)), 0)
+
+    @patch('recommender.views.write')
+    def test_listen_counts_distinct_listeners(self, write):
+        write.side_effect = lambda query, params: (
+            [] if params['transcription_id'] == 'missing' else [{'user_id': params['user_id']}]
+        )
+        for user_id in ('u1', 'u2', 'u1'):
+            response = self.client.post('/reco/listen', {'user_id': user_id, 'transcription_id': 't1'}, format='json')
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post('/reco/listen', {'user_id': 'u3', 'transcription_id': 'missing'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/realtime/listeners/missing').data['distinct_listeners'], 0)
+        response = self.client.get('/realtime/listeners/t1')
+        self.assertEqual(response.data['distinct_listeners'], 2)
@@ -1,35 +1,397 @@
-from unittest.mock import patch
+import io
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock, patch
 
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from fakeredis import FakeRedis
+from neo4j import READ_ACCESS, WRITE_ACCESS
+from neo4j.exceptions import ServiceUnavailable
 from rest_framework.test import APIClient
 
+from core import neo4j as neo4j_helpers
+from recommender import engine as engine_module
+from recommender.communities import COMMUNITY_LOCK_KEY, run_community_job, stored_communities
+from recommender.engine import EngineSnapshot
+from recommender.materialized import LISTENED_AT_KEY
+from recommender.views import _read_before
+
 
 class RecommendationTests(TestCase):
     def setUp(self):
         self.client = APIClient()
+        self.redis = FakeRedis(decode_responses=True)
+        self.patches = [
+            patch('recommender.views.get_redis_connection', return_value=self.redis),
+            patch('recommender.listens.get_redis_connection', return_value=self.redis),
+        ]
+        for p in self.patches:
+            p.start()
+        self.addCleanup(lambda: [p.stop() for p in self.patches])
 
-    @patch('recommender.views.run_query')
-    def test_content_recommendations(self, run_query):
-        run_query.return_value = iter([
+    @patch('recommender.views.read')
+    def test_content_recommendations(self, read):
+        read.return_value = [
             {'id': 't2', 'title': 'Second', 'score': 3},
             {'id': 't3', 'title': 'Third', 'score': 1},
-        ])
+        ]
         response = self.client.get('/reco/content/u1')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 2)
 
-    @patch('recommender.views.run_query')
-    def test_hybrid_combines_scores(self, run_query):
-        def side_effect(query, params):
+    @patch('recommender.views.read')
+    def test_hybrid_combines_scores(self, read):
+        def side_effect(query, params, timeout=None):
             if 'count(tp)' in query.lower():
-                return iter([
+                return [
                     {'id': 't2', 'title': 'Second', 'score': 4},
-                ])
-            return iter([
+                ]
+            return [
                 {'id': 't3', 'title': 'Third', 'score': 2},
-            ])
+            ]
 
-        run_query.side_effect = side_effect
+        read.side_effect = side_effect
         response = self.client.get('/reco/hybrid/u1')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data[0]['id'], 't2')
+
+    @override_settings(RECO_HYBRID_DEADLINE_MS=100)
+    @patch('recommender.views.read')
+    def test_hybrid_returns_partial_results_past_deadline(self, read):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def side_effect(query, params, timeout=None):
+            if 'count(tp)' in query.lower():
+                return [{'id': 't2', 'title': 'Second', 'score': 4}, {'id': 't1', 'title': 'First', 'score': 4}]
+            release.wait(5)
+            return [{'id': 't3', 'title': 'Third', 'score': 2}]
+
+        read.side_effect = side_effect
+        response = self.client.get('/reco/hybrid/u1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Partial-Results'], 'collab')
+        self.assertEqual([item['id'] for item in response.data], ['t1', 't2'])
+        # What is left of the deadline also goes to Neo4j as the transaction timeout.
+        self.assertTrue(all(0 < call.kwargs['timeout'] <= 0.1 for call in read.call_args_list))
+
+    @patch('recommender.views.read')
+    def test_hybrid_source_queued_past_deadline_is_not_queried(self, read):
+        with self.assertRaises(TimeoutError):
+            _read_before(time.monotonic() - 0.01, 'MATCH (n) RETURN n', {})
+        read.assert_not_called()
+
+    @override_settings(RECO_LISTEN_BATCH_CHUNK_SIZE=2)
+    @patch('recommender.listens.write')
+    def test_listen_batch_reports_missing_transcriptions(self, write):
+        def side_effect(query, params):
+            return [{'index': row['index'], 'found': row['transcription_id'] != 'missing'} for row in params['rows']]
+
+        write.side_effect = side_effect
+        rows = [
+            {'user_id': 'u1', 'transcription_id': 't1', 'weight': 2},
+            {'user_id': 'u2', 'transcription_id': 'missing'},
+            {'transcription_id': 't1'},
+            {'user_id': 'u3', 'transcription_id': 't1'},
+        ]
+        response = self.client.post('/reco/listen/batch', rows, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['stored'], 2)
+        self.assertEqual([result['status'] for result in response.data['results']], [200, 404, 400, 200])
+        self.assertEqual(write.call_count, 2)
+        self.assertEqual(self.redis.pfcount('realtime:hll:listeners:t1'), 2)
+
+    @override_settings(RECO_LISTEN_WRITE_BEHIND=True)
+    def test_write_behind_queues_and_flushes_coalesced_batches(self):
+        with patch('recommender.listens.write') as write:
+            for user_id, weight in (('u1', 1), ('u2', 1), ('u1', 5)):
+                response = self.client.post(
+                    '/reco/listen', {'user_id': user_id, 'transcription_id': 't1', 'weight': weight}, format='json'
+                )
+                self.assertEqual(response.status_code, 202)
+            write.assert_not_called()
+            self.assertEqual(self.client.get('/reco/listen/metrics').data['undelivered'], 3)
+
+            write.side_effect = ServiceUnavailable('neo4j down')
+            call_command('flush_listen_events', once=True, stdout=io.StringIO())
+            self.assertEqual(self.client.get('/reco/listen/metrics').data['pending'], 3)
+
+            write.side_effect = lambda query, params: [{'index': row['index'], 'found': True} for row in params['rows']]
+            call_command('flush_listen_events', once=True, consumer='other', stdout=io.StringIO())
+            # The failed worker's entries are still pending under its name until they go idle.
+            self.assertEqual(write.call_count, 1)
+            with self.settings(RECO_LISTEN_CLAIM_IDLE_MS=1):
+                call_command('flush_listen_events', once=True, consumer='other', stdout=io.StringIO())
+            metrics = self.client.get('/reco/listen/metrics').data
+
+        rows = write.call_args.args[1]['rows']
+        self.assertEqual([(row['user_id'], row['weight']) for row in rows], [('u2', 1), ('u1', 5)])
+        self.assertEqual((metrics['length'], metrics['pending'], metrics['flushes']), (0, 0, 1))
+        self.assertEqual((metrics['events_flushed'], metrics['rows_written']), (3, 2))
+        self.assertEqual(self.redis.pfcount('realtime:hll:listeners:t1'), 2)
+
+    def test_materialized_recommendations_with_listen_invalidation(self):
+        def side_effect(query, params):
+            if 'DISTINCT u.id' in query:
+                return [{'user_id': 'u1'}]
+            if 'count(tp)' in query:
+                return [{'id': 't2', 'title': 'Second', 'score': 4}, {'id': 't4', 'title': 'Fourth', 'score': 4}]
+            return [{'id': 't3', 'title': 'Third', 'score': 2}]
+
+        command_module = 'recommender.management.commands.materialize_recommendations'
+        with patch(f'{command_module}.read', side_effect=side_effect), patch(
+            f'{command_module}.get_redis_connection', return_value=self.redis
+        ):
+            call_command('materialize_recommendations', stdout=io.StringIO())
+
+        with patch('recommender.views.read', return_value=[]) as read, patch('recommender.views.write'):
+            response = self.client.get('/reco/content/u1')
+            self.assertEqual(response['X-Recommendations-Source'], 'materialized')
+            self.assertEqual([item['id'] for item in response.data], ['t2', 't4'])
+            self.assertEqual(response.data[0], {'id': 't2', 'title': 'Second', 'score': 4})
+            hybrid = self.client.get('/reco/hybrid/u1').data
+            self.assertEqual([(item['id'], item['score']) for item in hybrid], [('t2', 1.0), ('t3', 1.0), ('t4', 1.0)])
+            read.assert_not_called()
+
+            self.assertEqual(self.client.get('/reco/collab/u2')['X-Recommendations-Source'], 'live')
+            self.client.post('/reco/listen', {'user_id': 'u1', 'transcription_id': 't2'}, format='json')
+            self.assertEqual(self.client.get('/reco/collab/u1')['X-Recommendations-Source'], 'live')
+
+    @override_settings(RECO_GENERATION_GRACE=30)
+    def test_materialize_retires_previous_generation_and_prunes_old_listens(self):
+        def side_effect(query, params):
+            if 'DISTINCT u.id' in query:
+                return [{'user_id': 'u1'}]
+            return [{'id': 't2', 'title': 'Second', 'score': 4}]
+
+        self.redis.hset(LISTENED_AT_KEY, mapping={'old': time.time() - 90 * 86400, 'recent': time.time()})
+        command_module = 'recommender.management.commands.materialize_recommendations'
+        with patch(f'{command_module}.read', side_effect=side_effect), patch(
+            f'{command_module}.get_redis_connection', return_value=self.redis
+        ):
+            call_command('materialize_recommendations', stdout=io.StringIO())
+            first_ttl = self.redis.ttl('reco:1:content:u1')
+            call_command('materialize_recommendations', stdout=io.StringIO())
+
+        self.assertEqual(self.redis.get('reco:generation'), '2')
+        # Readers that still hold generation 1 get a grace period, then it is gone.
+        self.assertGreater(first_ttl, 30)
+        for key in ('reco:1:content:u1', 'reco:1:hybrid:u1', 'reco:1:users', 'reco:generation:1'):
+            self.assertTrue(0 < self.redis.ttl(key) <= 30, key)
+        self.assertGreater(self.redis.ttl('reco:2:content:u1'), 30)
+        self.assertEqual(list(self.redis.hgetall(LISTENED_AT_KEY)), ['recent'])
+
+
+    def test_community_job_reuses_projection_until_listens_change(self):
+        fingerprint = {'listens': 3, 'last_ts': 100}
+        projected = []
+
+        def fake_write(query, params, timeout=None):
+            if 'gds.graph.exists' in query:
+                return [{'exists': bool(projected)}]
+            if 'gds.graph.project' in query:
+                projected.append(params['graph_name'])
+                return [{'nodeCount': 4, 'relationshipCount': 3}]
+            if 'gds.louvain' in query:
+                return [
+                    {'user_id': 'u2', 'communityId': 7},
+                    {'user_id': 'u1', 'communityId': 7},
+                    {'user_id': 'u3', 'communityId': 1},
+                ]
+            return []
+
+        command_module = 'recommender.management.commands.detect_communities'
+        self.assertEqual(self.client.get('/reco/communities').status_code, 404)
+        self.assertEqual(self.client.post('/reco/communities').data['state'], 'queued')
+        with patch('recommender.communities.read', side_effect=lambda query: [fingerprint]), patch(
+            'recommender.communities.write', side_effect=fake_write
+        ) as write, patch(f'{command_module}.get_redis_connection', return_value=self.redis):
+            call_command('detect_communities', once=True, stdout=io.StringIO())
+            louvain_runs = sum('gds.louvain' in call.args[0] for call in write.call_args_list)
+            call_command('detect_communities', once=True, stdout=io.StringIO())
+            self.assertEqual(sum('gds.louvain' in call.args[0] for call in write.call_args_list), louvain_runs)
+            self.assertFalse(self.client.get('/reco/communities/status').data['reprojected'])
+
+            fingerprint['last_ts'] = 200
+            call_command('detect_communities', once=True, stdout=io.StringIO())
+
+        self.assertEqual(projected, ['abdb_listens', 'abdb_listens'])
+        self.assertTrue(any('gds.graph.drop' in call.args[0] for call in write.call_args_list))
+        status = self.client.get('/reco/communities/status').data
+        self.assertEqual((status['state'], status['reprojected']), ('done', True))
+        self.assertEqual((status['fingerprint'], status['users'], status['communities']), ('3:200', 3, 2))
+        response = self.client.get('/reco/communities')
+        self.assertEqual([(item['user_id'], item['communityId']) for item in response.data], [('u3', 1), ('u1', 7), ('u2', 7)])
+
+    @override_settings(NEO4J_GDS_TIMEOUT=100)
+    def test_community_job_that_lost_its_lock_keeps_the_previous_result(self):
+        lock_ttls = []
+
+        def fake_write(query, params, timeout=None):
+            lock_ttls.append(self.redis.ttl(COMMUNITY_LOCK_KEY))
+            if 'gds.graph.exists' in query:
+                return [{'exists': False}]
+            if 'gds.louvain' in query:
+                # Louvain overran the lock and another worker took it meanwhile.
+                self.redis.set(COMMUNITY_LOCK_KEY, 'other-worker')
+                return [{'user_id': 'u1', 'communityId': 1}]
+            return [{'nodeCount': 1, 'relationshipCount': 0}]
+
+        with patch('recommender.communities.read', return_value=[{'listens': 1, 'last_ts': 1}]), patch(
+            'recommender.communities.write', side_effect=fake_write
+        ):
+            status = run_community_job(self.redis)
+        # The lock covers drop + project + Louvain at NEO4J_GDS_TIMEOUT each.
+        self.assertTrue(all(ttl >= 300 for ttl in lock_ttls))
+        self.assertEqual((status['state'], status['error']), ('failed', 'Lost the community detection lock.'))
+        self.assertIsNone(stored_communities(self.redis))
+        self.assertEqual(self.redis.get(COMMUNITY_LOCK_KEY), 'other-worker')
+
+    def test_engine_serves_collab_and_similar_users_from_snapshot(self):
+        listens = {'u1': ['t1', 't2'], 'u2': ['t1', 't2', 't3'], 'u3': ['t2', 't4'], 'u4': ['t5']}
+        rows = [
+            {'user_id': user_id, 'item_id': item_id, 'title': item_id.upper(), 'weight': 1}
+            for user_id, items in listens.items()
+            for item_id in items
+        ]
+        path = os.path.join(tempfile.mkdtemp(), 'engine.npz')
+        EngineSnapshot.build(rows, top_k=3).save(path)
+        engine_module._engine.reset()
+        self.addCleanup(engine_module._engine.reset)
+
+        with self.settings(RECO_ENGINE_PATH=path), patch('recommender.views.read', return_value=[]) as read, patch(
+            'recommender.views.write'
+        ):
+            response = self.client.get('/reco/collab/u1')
+            self.assertEqual(response['X-Recommendations-Source'], 'engine')
+            # t3: cos(t1, t3) + cos(t2, t3) = 1/sqrt(2) + 1/sqrt(3); t4: cos(t2, t4) = 1/sqrt(3).
+            self.assertEqual(
+                [(item['id'], item['title'], item['score']) for item in response.data],
+                [('t3', 'T3', 1.284), ('t4', 'T4', 0.577)],
+            )
+            response = self.client.get('/reco/similar/u1')
+            self.assertEqual(response['X-Recommendations-Source'], 'engine')
+            self.assertEqual(response.data, [{'id': 'u2', 'weight': 2}, {'id': 'u3', 'weight': 1}])
+            read.assert_not_called()
+
+            stats = self.client.get('/reco/engine/stats').data
+            self.assertEqual((stats['users'], stats['items'], stats['listens']), (4, 5, 8))
+            self.assertGreater(stats['memory_bytes']['total'], 0)
+
+            # A listen newer than the snapshot sends the user back to Neo4j.
+            self.client.post('/reco/listen', {'user_id': 'u1', 'transcription_id': 't3'}, format='json')
+            self.assertEqual(self.client.get('/reco/collab/u1')['X-Recommendations-Source'], 'live')
+            self.assertEqual(self.client.get('/reco/similar/u9')['X-Recommendations-Source'], 'live')
+
+    @override_settings(RECO_ENGINE_RELOAD_INTERVAL=60)
+    def test_engine_reload_does_not_block_readers(self):
+        path = os.path.join(tempfile.mkdtemp(), 'engine.npz')
+        rows = [{'user_id': 'u1', 'item_id': 't1', 'title': 'T1', 'weight': 1}]
+        EngineSnapshot.build(rows, top_k=3).save(path)
+        cache = engine_module._EngineCache()
+        with self.settings(RECO_ENGINE_PATH=path):
+            first = cache.get()
+            EngineSnapshot.build(rows * 2, top_k=3).save(path)
+            os.utime(path, (time.time() + 10, time.time() + 10))
+            cache.checked_at = float('-inf')
+
+            loading, release = threading.Event(), threading.Event()
+            load = EngineSnapshot.load
+
+            def slow_load(load_path):
+                loading.set()
+                release.wait(5)
+                return load(load_path)
+
+            with patch.object(EngineSnapshot, 'load', side_effect=slow_load):
+                reloader = threading.Thread(target=cache.get)
+                reloader.start()
+                self.assertTrue(loading.wait(5))
+                # Served from the current snapshot while the new file is being read.
+                self.assertIs(cache.get(), first)
+                release.set()
+                reloader.join(5)
+            self.assertIsNot(cache.get(), first)
+
+    @patch('recommender.views.write')
+    def test_approximate_similar_users_from_minhash_lsh(self, write):
+        write.side_effect = lambda query, params: (
+            [] if params['transcription_id'] == 'missing' else [{'user_id': params['user_id']}]
+        )
+        listens = {
+            'u1': [f't{index}' for index in range(8)],
+            'u2': [f't{index}' for index in range(9)],
+            'u3': [f't{index}' for index in range(20, 28)],
+        }
+        for user_id, items in listens.items():
+            for item_id in items:
+                self.client.post('/reco/listen', {'user_id': user_id, 'transcription_id': item_id}, format='json')
+
+        response = self.client.get('/reco/similar/u1?mode=approx')
+        self.assertEqual(response['X-Recommendations-Source'], 'minhash')
+        self.assertEqual([item['id'] for item in response.data], ['u2'])
+        # True Jaccard is 8/9.
+        self.assertAlmostEqual(response.data[0]['jaccard'], 8 / 9, delta=0.1)
+        self.assertEqual(self.client.get('/reco/similar/u9?mode=approx').status_code, 404)
+        self.assertEqual(self.client.get('/reco/similar/u1?mode=fast').status_code, 400)
+
+        # A listen for a transcription that does not exist leaves the signature alone.
+        signature = self.redis.get('reco:minhash:sig:u1')
+        response = self.client.post('/reco/listen', {'user_id': 'u1', 'transcription_id': 'missing'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.redis.get('reco:minhash:sig:u1'), signature)
+        self.assertEqual(self.client.get('/reco/similar/u4?mode=approx').status_code, 404)
+
+        # A rebuild from the graph lands on the same signatures as the incremental updates.
+        signatures = {user_id: self.redis.get(f'reco:minhash:sig:{user_id}') for user_id in listens}
+        command_module = 'recommender.management.commands.rebuild_minhash_index'
+        records = [{'user_id': user_id, 'transcription_ids': items} for user_id, items in listens.items()]
+        with patch(f'{command_module}.read', return_value=records), patch(
+            f'{command_module}.get_redis_connection', return_value=self.redis
+        ):
+            call_command('rebuild_minhash_index', stdout=io.StringIO())
+        self.assertEqual({user_id: self.redis.get(f'reco:minhash:sig:{user_id}') for user_id in listens}, signatures)
+        self.assertEqual(self.client.get('/reco/similar/u2?mode=approx').data[0]['id'], 'u1')
+
+class Neo4jHelperTests(TestCase):
+    def setUp(self):
+        neo4j_helpers._stats.reset()
+        self.addCleanup(neo4j_helpers._stats.reset)
+        self.driver = MagicMock()
+        self.session = self.driver.session.return_value.__enter__.return_value
+        patcher = patch('core.neo4j.get_driver', return_value=self.driver)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_and_writes_use_managed_transactions(self):
+        tx = MagicMock()
+        tx.run.return_value = [MagicMock(data=lambda: {'id': 't1'})]
+
+        def execute_read(work):
+            # What the driver does after a transient failure: run the whole unit of work again.
+            work(tx)
+            return work(tx)
+
+        self.session.execute_read.side_effect = execute_read
+        self.session.execute_write.side_effect = lambda work: work(tx)
+
+        self.assertEqual(neo4j_helpers.read('MATCH (n) RETURN n.id AS id', {'x': 1}), [{'id': 't1'}])
+        self.assertEqual(self.driver.session.call_args_list[0].kwargs['default_access_mode'], READ_ACCESS)
+        neo4j_helpers.write('MERGE (n {id: $id})', {'id': 't1'}, timeout=2)
+        self.assertEqual(self.driver.session.call_args_list[1].kwargs['default_access_mode'], WRITE_ACCESS)
+        work = self.session.execute_write.call_args.args[0]
+        self.assertEqual(work.timeout, 2)
+
+        stats = self.client.get('/reco/neo4j/stats').data
+        self.assertEqual((stats['reads'], stats['writes'], stats['retries'], stats['errors']), (1, 1, 1, 0))
+        self.assertEqual((stats['in_use'], stats['peak_in_use']), (0, 1))
+
+    def test_failed_queries_release_their_connection(self):
+        self.session.execute_write.side_effect = ServiceUnavailable('neo4j down')
+        with self.assertRaises(ServiceUnavailable):
+            neo4j_helpers.write('MERGE (n)')
+        stats = neo4j_helpers.pool_stats()
+        self.assertEqual((stats['in_use'], stats['writes'], stats['errors']), (0, 1, 1))
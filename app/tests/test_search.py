@@ -0,0 +1,55 @@
+from unittest.mock import patch
+
+import mongomock
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from transcripts import search
+
+
+@override_settings(TRANSCRIPTIONS_SEARCH_BACKEND='bm25')
+class BM25SearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        user = get_user_model().objects.create_user(username='searcher', password='pass1234')
+        self.client.force_authenticate(user)
+        self.collection = mongomock.MongoClient().db.collection
+        self.collection.insert_many(
+            [
+                {'title': 'Budget meeting', 'text': 'We reviewed the budget and the hiring plan.', 'folder': 'meetings'},
+                {'title': 'AI webinar', 'text': 'Neural networks, budget for GPUs and more.', 'folder': 'webinars'},
+                {'title': 'Standup', 'text': 'Nothing relevant here.', 'folder': 'meetings'},
+            ]
+        )
+        patcher = patch('transcripts.search.get_collection', return_value=self.collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        search._backend.cache_clear()
+        self.addCleanup(search._backend.cache_clear)
+
+    def test_ranks_title_matches_first_with_snippets(self):
+        response = self.client.get('/transcriptions/search', {'q': 'budget'})
+        self.assertEqual(response.status_code, 200)
+        titles = [item['title'] for item in response.data['results']]
+        self.assertEqual(titles, ['Budget meeting', 'AI webinar'])
+        self.assertIn('<mark>budget</mark>', response.data['results'][1]['snippet'])
+        self.assertNotIn('text', response.data['results'][0])
+
+    def test_paginates_and_filters_by_folder(self):
+        response = self.client.get('/transcriptions/search', {'q': 'budget', 'limit': 1})
+        self.assertEqual(response.data['next_offset'], 1)
+        response = self.client.get('/transcriptions/search', {'q': 'budget', 'folder': 'webinars'})
+        self.assertEqual([item['title'] for item in response.data['results']], ['AI webinar'])
+
+    def test_index_tracks_removed_documents(self):
+        backend = search.get_search_backend()
+        backend.search('budget', limit=10)
+        document = self.collection.find_one({'title': 'AI webinar'})
+        backend.remove_document(str(document['_id']))
+        page = backend.search('budget', limit=10)
+        self.assertEqual([item['title'] for item in page.results], ['Budget meeting'])
+
+    def test_requires_query(self):
+        response = self.client.get('/transcriptions/search')
+        self.assertEqual(response.status_code, 400)
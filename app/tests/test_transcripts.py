@@ -1,12 +1,21 @@
-from unittest.mock import MagicMock, patch
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import mongomock
+from bson import ObjectId
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 
 from fakeredis import FakeRedis
 
+from transcripts.outbox import OutboxDispatcher, created_event
+from transcripts.storage import text_update
+
 
 class TranscriptionCRUDTests(TestCase):
     def setUp(self):
@@ -14,19 +23,28 @@ class TranscriptionCRUDTests(TestCase):
         user = get_user_model().objects.create_user(username='tester', password='pass1234')
         self.client.force_authenticate(user)
         self.collection = mongomock.MongoClient().db.collection
+        self.outbox = mongomock.MongoClient().db.outbox
+        self.rollups = mongomock.MongoClient().db.rollups
         self.redis = FakeRedis(decode_responses=True)
         self.channel_layer = MagicMock()
+        self.channel_layer.group_send = AsyncMock()
+        self.publish = MagicMock()
         self.patches = [
             patch('transcripts.views.get_collection', return_value=self.collection),
             patch('transcripts.views.get_redis_connection', return_value=self.redis),
-            patch('transcripts.views.publish'),
-            patch('transcripts.views.get_channel_layer', return_value=self.channel_layer),
+            patch('transcripts.outbox.get_outbox_collection', return_value=self.outbox),
+            patch('transcripts.handlers.get_redis_connection', return_value=self.redis),
+            patch('transcripts.handlers.publish', self.publish),
+            patch('transcripts.handlers.get_channel_layer', return_value=self.channel_layer),
+            patch('dashboards.handlers.get_rollup_collection', return_value=self.rollups),
+            patch('realtime.handlers.get_redis_connection', return_value=self.redis),
+            patch('dashboards.handlers.get_redis_connection', return_value=self.redis),
         ]
         for p in self.patches:
             p.start()
         self.addCleanup(lambda: [p.stop() for p in self.patches])
 
-    def test_crud_flow(self):
+    def _payload(self, **overrides):
         payload = {
             'title': 'Test',
             'text': 'Lorem ipsum',
@@ -35,13 +53,19 @@ class TranscriptionCRUDTests(TestCase):
             'length_sec': 120,
             'speakers': ['Alice'],
         }
+        payload.update(overrides)
+        return payload
+
+    def test_crud_flow(self):
+        payload = self._payload()
         response = self.client.post('/transcriptions/', payload, format='json')
         self.assertEqual(response.status_code, 201)
         transcription_id = response.data['id']
 
         response = self.client.get('/transcriptions/')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertNotIn('text', response.data['results'][0])
 
         response = self.client.get(f'/transcriptions/{transcription_id}')
         self.assertEqual(response.status_code, 200)
@@ -53,3 +77,328 @@ class TranscriptionCRUDTests(TestCase):
 
         response = self.client.delete(f'/transcriptions/{transcription_id}')
         self.assertEqual(response.status_code, 204)
+
+    def test_list_paginates_with_cursor(self):
+        for index in range(5):
+            folder = 'docs' if index % 2 == 0 else 'other'
+            self.client.post('/transcriptions/', self._payload(title=f'T{index}', folder=folder), format='json')
+
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 2, 'folder': 'docs'}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/transcriptions/', params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['title'] for item in response.data['results'])
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, ['T4', 'T2', 'T0'])
+
+    def test_list_rejects_invalid_cursor(self):
+        response = self.client.get('/transcriptions/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sparse_fieldsets(self):
+        for index in range(3):
+            self.client.post('/transcriptions/', self._payload(title=f'T{index}'), format='json')
+
+        response = self.client.get('/transcriptions/', {'fields': 'id,title', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([set(item) for item in response.data['results']], [{'id', 'title'}] * 2)
+        response = self.client.get('/transcriptions/', {'fields': 'id,title', 'cursor': response.data['next_cursor']})
+        self.assertEqual([item['title'] for item in response.data['results']], ['T0'])
+
+        transcription_id = response.data['results'][0]['id']
+        full = self.client.get(f'/transcriptions/{transcription_id}')
+        response = self.client.get(f'/transcriptions/{transcription_id}', {'fields': 'text'})
+        self.assertEqual(response.data, {'text': 'Lorem ipsum'})
+        self.assertNotEqual(response['ETag'], full['ETag'])
+
+        response = self.client.get(f'/transcriptions/{transcription_id}', {'fields': 'title,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(TRANSCRIPTIONS_BULK_CHUNK_SIZE=2)
+    def test_bulk_json_array_reports_item_errors(self):
+        items = [self._payload(title=f'Bulk {index}') for index in range(3)]
+        items.insert(1, {'title': 'Missing fields'})
+        response = self.client.post('/transcriptions/bulk', items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['inserted'], 3)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertEqual(self.collection.count_documents({}), 3)
+        # One outbox event, and later one batched notification, per chunk of two items.
+        self.assertEqual(self.outbox.count_documents({}), 2)
+        OutboxDispatcher().drain_once()
+        self.assertEqual(self.redis.get('realtime:transcriptions_count'), '3')
+        self.assertEqual(self.channel_layer.group_send.await_count, 2)
+
+    def test_bulk_ndjson_stream(self):
+        lines = [json.dumps(self._payload(title=f'Line {index}')) for index in range(2)]
+        body = '\n'.join(lines + ['{not json']) + '\n'
+        response = self.client.post('/transcriptions/bulk', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['inserted'], 2)
+        self.assertEqual(response.data['errors'][0]['index'], 2)
+
+    def test_export_streams_ndjson_with_selected_fields(self):
+        for index in range(3):
+            self.client.post('/transcriptions/', self._payload(title=f'E{index}'), format='json')
+        response = self.client.get('/transcriptions/export.ndjson', {'fields': 'id,title'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['E2', 'E1', 'E0'])
+        self.assertEqual(set(rows[0]), {'id', 'title'})
+
+    def test_export_csv_gzip(self):
+        self.client.post('/transcriptions/', self._payload(topics=['ai', 'ml']), format='json')
+        response = self.client.get(
+            '/transcriptions/export.csv', {'fields': 'title,topics'}, HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertEqual(body.splitlines(), ['title,topics', 'Test,ai;ml'])
+
+    def test_export_honours_gzip_quality_values(self):
+        self.client.post('/transcriptions/', self._payload(), format='json')
+        for header, compressed in [('gzip;q=0', False), ('br, *;q=0.5', True), ('*, gzip;q=0', False), ('identity', False)]:
+            response = self.client.get('/transcriptions/export.csv', HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(response.has_header('Content-Encoding'), compressed, header)
+            self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_export_rejects_unknown_field(self):
+        response = self.client.get('/transcriptions/export.csv', {'fields': 'title,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_get_returns_not_modified(self):
+        response = self.client.post('/transcriptions/', self._payload(), format='json')
+        transcription_id = response.data['id']
+        etag = response['ETag']
+
+        response = self.client.get(f'/transcriptions/{transcription_id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        list_response = self.client.get('/transcriptions/')
+        list_etag = list_response['ETag']
+        response = self.client.get('/transcriptions/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.put(f'/transcriptions/{transcription_id}', self._payload(title='Changed'), format='json')
+        response = self.client.get(f'/transcriptions/{transcription_id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/transcriptions/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_etag_survives_redis_reset_and_failed_bump(self):
+        self.client.post('/transcriptions/', self._payload(), format='json')
+        list_etag = self.client.get('/transcriptions/')['ETag']
+
+        self.redis.flushall()
+        response = self.client.get('/transcriptions/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+
+        list_etag = response['ETag']
+        with patch('transcripts.views.bump_list_version'):
+            self.client.post('/transcriptions/', self._payload(title='Second'), format='json')
+        self.assertEqual(self.client.get('/transcriptions/', HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        OutboxDispatcher().drain_once()
+        self.assertEqual(self.client.get('/transcriptions/', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_if_match_guards_concurrent_writes(self):
+        response = self.client.post('/transcriptions/', self._payload(), format='json')
+        transcription_id = response.data['id']
+        etag = response['ETag']
+
+        # If-Match compares strongly: the weak form and a `?fields=` variant's ETag never match.
+        partial = self.client.get(f'/transcriptions/{transcription_id}', {'fields': 'title'})['ETag']
+        for precondition in (f'W/{etag}', partial):
+            response = self.client.put(
+                f'/transcriptions/{transcription_id}', self._payload(), format='json', HTTP_IF_MATCH=precondition
+            )
+            self.assertEqual(response.status_code, 412)
+        response = self.client.put(
+            f'/transcriptions/{transcription_id}', self._payload(title='First'), format='json', HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.put(
+            f'/transcriptions/{transcription_id}', self._payload(title='Stale'), format='json', HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 412)
+        response = self.client.delete(f'/transcriptions/{transcription_id}', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.collection.find_one()['title'], 'First')
+
+    @override_settings(TRANSCRIPTIONS_TEXT_STORAGE='zlib', TRANSCRIPTIONS_TEXT_THRESHOLD=32)
+    def test_large_text_is_compressed_and_hydrated_on_read(self):
+        text = ' '.join(['long transcript body'] * 50)
+        response = self.client.post('/transcriptions/', self._payload(text=text), format='json')
+        transcription_id = response.data['id']
+        stored = self.collection.find_one()
+        self.assertNotIn('text', stored)
+        self.assertEqual(stored['text_storage'], 'zlib')
+        self.assertLess(len(stored['text_z']), len(text))
+        self.assertEqual(stored['text_search'], 'long transcript body')
+
+        response = self.client.get(f'/transcriptions/{transcription_id}')
+        self.assertEqual(response.data['text'], text)
+
+        command_module = 'transcripts.management.commands.migrate_transcription_text'
+        with patch(f'{command_module}.get_collection', return_value=self.collection):
+            call_command('migrate_transcription_text', mode='inline', stdout=io.StringIO())
+        stored = self.collection.find_one()
+        self.assertEqual(stored['text'], text)
+        self.assertNotIn('text_z', stored)
+        self.assertNotIn('text_search', stored)
+
+    @override_settings(TRANSCRIPTIONS_TEXT_THRESHOLD=32)
+    def test_migrate_discards_new_blob_when_guard_misses(self):
+        text = ' '.join(['long transcript body'] * 50)
+        for title in ('First', 'Second'):
+            self.client.post('/transcriptions/', self._payload(title=title, text=text), format='json')
+        bucket = MagicMock()
+        bucket.put.side_effect = lambda raw: ObjectId()
+        command_module = 'transcripts.management.commands.migrate_transcription_text'
+        real_text_update = text_update
+
+        def racing_text_update(value, mode):
+            update = real_text_update(value, mode)
+            if bucket.put.call_count == 1:
+                # A concurrent PUT lands between the read and the guarded write.
+                self.collection.update_one({'title': 'First'}, {'$inc': {'version': 1}})
+            return update
+
+        output = io.StringIO()
+        with patch('transcripts.storage.get_text_bucket', return_value=bucket), patch(
+            f'{command_module}.get_collection', return_value=self.collection
+        ), patch(f'{command_module}.text_update', side_effect=racing_text_update):
+            call_command('migrate_transcription_text', mode='gridfs', stdout=output)
+        self.assertIn('Converted 1 of 2', output.getvalue())
+        first = self.collection.find_one({'title': 'First'})
+        second = self.collection.find_one({'title': 'Second'})
+        self.assertEqual(first['text'], text)
+        self.assertEqual(second['text_storage'], 'gridfs')
+        bucket.delete.assert_called_once()
+        self.assertNotEqual(bucket.delete.call_args.args[0], second['text_ref'])
+
+    @override_settings(TRANSCRIPTIONS_TEXT_STORAGE='gridfs', TRANSCRIPTIONS_TEXT_THRESHOLD=32)
+    def test_failed_insert_discards_gridfs_body(self):
+        bucket = MagicMock()
+        bucket.put.return_value = ObjectId()
+        self.collection.insert_one = MagicMock(side_effect=RuntimeError('mongo down'))
+        with patch('transcripts.storage.get_text_bucket', return_value=bucket):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/transcriptions/', self._payload(text='x' * 64), format='json')
+        bucket.delete.assert_called_once_with(bucket.put.return_value)
+
+    def test_create_defers_side_effects_to_outbox(self):
+        response = self.client.post('/transcriptions/', self._payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(self.redis.get('realtime:transcriptions_count'))
+        self.channel_layer.group_send.assert_not_awaited()
+        self.assertEqual(self.client.get('/transcriptions/outbox/lag').data['pending'], 1)
+
+        self.assertEqual(OutboxDispatcher().drain_once(), 1)
+        self.assertEqual(self.redis.get('realtime:transcriptions_count'), '1')
+        self.publish.assert_called_once_with('events:transcriptions', response.data['id'])
+        message = self.channel_layer.group_send.await_args.args[1]
+        self.assertEqual(message['type'], 'transcription_created')
+        self.assertEqual(self.client.get('/transcriptions/outbox/lag').data['pending'], 0)
+        self.assertEqual(OutboxDispatcher().drain_once(), 0)
+
+    def test_facet_counts_follow_writes(self):
+        first = self.client.post('/transcriptions/', self._payload(topics=['ai', 'ml']), format='json').data
+        self.client.post('/transcriptions/', self._payload(topics=['ai']), format='json')
+        self.client.put(
+            f"/transcriptions/{first['id']}", self._payload(folder='talks', topics=['ml']), format='json'
+        )
+        OutboxDispatcher().drain_once()
+        facets = self.client.get('/transcriptions/facets').data
+        self.assertEqual(facets['folder'], [{'value': 'docs', 'count': 1}, {'value': 'talks', 'count': 1}])
+        self.assertEqual(facets['topics'], [{'value': 'ai', 'count': 1}, {'value': 'ml', 'count': 1}])
+
+        self.client.delete(f"/transcriptions/{first['id']}")
+        OutboxDispatcher().drain_once()
+        facets = self.client.get('/transcriptions/facets').data
+        self.assertEqual(facets['folder'], [{'value': 'docs', 'count': 1}])
+        self.assertEqual(facets['topics'], [{'value': 'ai', 'count': 1}])
+
+    def test_rebuild_facets_repairs_drift(self):
+        self.client.post('/transcriptions/', self._payload(topics=['ai', 'ai']), format='json')
+        self.redis.hset('transcriptions:facets:folder', mapping={'docs': 7, 'ghost': 2})
+        command_module = 'transcripts.management.commands.rebuild_transcription_facets'
+        with patch(f'{command_module}.get_collection', return_value=self.collection), patch(
+            f'{command_module}.get_redis_connection', return_value=self.redis
+        ), patch(f'{command_module}.get_outbox_collection', return_value=self.outbox):
+            call_command('rebuild_transcription_facets', stdout=io.StringIO())
+        facets = self.client.get('/transcriptions/facets').data
+        self.assertEqual(facets['folder'], [{'value': 'docs', 'count': 1}])
+        self.assertEqual(facets['topics'], [{'value': 'ai', 'count': 1}])
+
+        # The pending create is already in the rebuilt totals; only newer events apply.
+        self.client.post('/transcriptions/', self._payload(folder='talks'), format='json')
+        OutboxDispatcher().drain_once()
+        facets = self.client.get('/transcriptions/facets').data
+        self.assertEqual(facets['folder'], [{'value': 'docs', 'count': 1}, {'value': 'talks', 'count': 1}])
+        self.assertEqual(facets['topics'], [{'value': 'ai', 'count': 2}])
+
+        # Ids are not in commit order: an event committed after the rebuild with an older
+        # id is still applied.
+        late = created_event([{'_id': ObjectId(), 'title': 'Late', 'created_at': datetime(2024, 1, 1), 'folder': 'late'}])
+        self.outbox.insert_one({**late, '_id': ObjectId.from_datetime(datetime(2000, 1, 1))})
+        OutboxDispatcher().drain_once()
+        self.assertIn({'value': 'late', 'count': 1}, self.client.get('/transcriptions/facets').data['folder'])
+
+    def test_autocomplete_follows_writes_and_rebuild(self):
+        first = self.client.post(
+            '/transcriptions/', self._payload(title='Árboles y datos', topics=['ai', 'ml'], speakers=['Alba']), format='json'
+        ).data
+        self.client.post('/transcriptions/', self._payload(title='Arquitectura', topics=['ai']), format='json')
+        OutboxDispatcher().drain_once()
+        response = self.client.get('/transcriptions/autocomplete', {'q': 'ar'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['value'] for item in response.data['title']], ['Árboles y datos', 'Arquitectura'])
+        self.assertEqual(response.data['topics'], [])
+        response = self.client.get('/transcriptions/autocomplete', {'q': 'A', 'kind': 'topics'})
+        self.assertEqual(response.data, {'topics': [{'value': 'ai', 'count': 2}]})
+
+        self.client.put(f"/transcriptions/{first['id']}", self._payload(title='Otro', speakers=['Bea']), format='json')
+        self.client.delete(f"/transcriptions/{first['id']}")
+        OutboxDispatcher().drain_once()
+        response = self.client.get('/transcriptions/autocomplete', {'q': 'a'})
+        self.assertEqual([item['value'] for item in response.data['title']], ['Arquitectura'])
+        self.assertEqual(response.data['speakers'], [{'value': 'Alice', 'count': 1}])
+        self.assertEqual(self.client.get('/transcriptions/autocomplete', {'q': 'a', 'kind': 'x'}).status_code, 400)
+
+        self.redis.zadd('transcriptions:autocomplete:title', {'ghost\x00Ghost': 0})
+        command_module = 'transcripts.management.commands.rebuild_transcription_autocomplete'
+        with patch(f'{command_module}.get_collection', return_value=self.collection), patch(
+            f'{command_module}.get_redis_connection', return_value=self.redis
+        ), patch(f'{command_module}.get_outbox_collection', return_value=self.outbox):
+            call_command('rebuild_transcription_autocomplete', stdout=io.StringIO())
+        self.assertEqual(self.client.get('/transcriptions/autocomplete', {'q': 'gh'}).data['title'], [])
+        response = self.client.get('/transcriptions/autocomplete', {'q': 'ar', 'kind': 'title'})
+        self.assertEqual(response.data, {'title': [{'value': 'Arquitectura', 'count': 1}]})
+
+    def test_outbox_redelivers_after_handler_failure(self):
+        self.client.post('/transcriptions/', self._payload(), format='json')
+        self.publish.side_effect = ConnectionError('redis down')
+        self.assertEqual(OutboxDispatcher().drain_once(), 0)
+        self.publish.side_effect = None
+        # The failed batch stays leased until the lease expires.
+        self.assertEqual(OutboxDispatcher().drain_once(), 0)
+        self.outbox.update_many({}, {'$set': {'lease_until': datetime.utcnow() - timedelta(seconds=1)}})
+        self.assertEqual(OutboxDispatcher().drain_once(), 1)
+        self.assertEqual(self.outbox.find_one()['attempts'], 2)
+
+    def test_outbox_redelivery_only_reruns_failed_handlers(self):
+        self.client.post('/transcriptions/', self._payload(), format='json')
+        with patch('transcripts.handlers.apply_facet_deltas', side_effect=ConnectionError('redis down')):
+            self.assertEqual(OutboxDispatcher().drain_once(), 0)
+        self.outbox.update_many({}, {'$set': {'lease_until': datetime.utcnow() - timedelta(seconds=1)}})
+        self.assertEqual(OutboxDispatcher().drain_once(), 1)
+        self.assertEqual(self.redis.get('realtime:transcriptions_count'), '1')
+        self.publish.assert_called_once()
+        self.assertEqual(self.redis.hget('transcriptions:facets:folder', 'docs'), '1')
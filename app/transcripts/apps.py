@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TranscriptsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'transcripts'
+
+    def ready(self):
+        from . import handlers  # noqa: F401
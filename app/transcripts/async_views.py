@@ -0,0 +1,232 @@
+from datetime import datetime
+from typing import Any, Callable, Dict
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
+
+from core.mongo import amongo_transaction
+from core.redis import get_async_redis_connection
+from .etags import (
+    abump_list_version,
+    alist_version,
+    document_etag,
+    etag_matches,
+    list_etag,
+    precondition_criteria,
+)
+from .mongo import (
+    LIST_FIELDS,
+    LIST_SORT,
+    build_list_query,
+    decode_cursor,
+    detail_projection,
+    encode_cursor,
+    get_async_collection,
+    list_projection,
+    parse_fields,
+    parse_limit,
+    parse_object_id,
+    parse_topics,
+    serialize_transcription,
+)
+from .outbox import arecord_event, created_event, deleted_event, updated_event
+from .search import get_search_backend
+from .serializers import TranscriptionSerializer, TranscriptionUpdateSerializer
+from .storage import discard_text, pack_text, target_storage, text_update
+
+
+def json_response(data: Any, status: int = 200, headers: Dict[str, str] | None = None) -> HttpResponse:
+    # Rendered with DRF's renderer so payloads match the sync views byte for byte.
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json', headers=headers)
+
+
+# The blocking calls below touch Mongo, GridFS or the search index, never the ORM, so
+# they run in the default executor instead of queueing on the one thread-sensitive thread.
+async def _gridfs_aware(func: Callable, document: Dict[str, Any], *args):
+    # Only GridFS bodies involve blocking I/O; everything else stays on the event loop.
+    if document.get('text_storage') == 'gridfs':
+        return await sync_to_async(func, thread_sensitive=False)(document, *args)
+    return func(document, *args)
+
+
+async def _pack_text(text: str) -> Dict[str, Any]:
+    if target_storage(text) == 'gridfs':
+        return await sync_to_async(pack_text, thread_sensitive=False)(text)
+    return pack_text(text)
+
+
+async def _text_update(text: str) -> Dict[str, Dict[str, Any]]:
+    if target_storage(text) == 'gridfs':
+        return await sync_to_async(text_update, thread_sensitive=False)(text)
+    return text_update(text)
+
+
+async def _index_document(document: Dict[str, Any]) -> None:
+    # The bm25 backend takes a lock, and may read a GridFS body.
+    await sync_to_async(get_search_backend().index_document, thread_sensitive=False)(document)
+
+
+# DRF's APIView with async handlers: the same parsers, authentication, permissions and
+# exception handling as the sync views. Those steps are sync (session and user lookups,
+# multipart spooling), so they run together in one thread hop before the handler.
+class AsyncAPIView(APIView):
+    def _initial(self, request, *args, **kwargs) -> None:
+        self.initial(request, *args, **kwargs)
+        if request.method in ('POST', 'PUT', 'PATCH'):
+            request.data  # noqa: B018
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await sync_to_async(self._initial)(request, *args, **kwargs)
+            method = request.method.lower()
+            if method not in self.http_method_names or not hasattr(self, method):
+                self.http_method_not_allowed(request, *args, **kwargs)
+            response = await getattr(self, method)(request, *args, **kwargs)
+        except Exception as exc:  # noqa: BLE001
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def options(self, request, *args, **kwargs):
+        return await sync_to_async(super().options)(request, *args, **kwargs)
+
+
+class AsyncTranscriptionListCreateView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            limit = parse_limit(request.GET.get('limit'))
+            fields = parse_fields(request.GET.get('fields'))
+            cursor = request.GET.get('cursor')
+            query = build_list_query(
+                folder=request.GET.get('folder'),
+                topics=parse_topics(request.GET),
+                cursor=decode_cursor(cursor) if cursor else None,
+            )
+        except ValueError as exc:
+            return json_response({'detail': str(exc)}, status=400)
+        etag = list_etag(await alist_version(get_async_redis_connection()), request.GET)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return HttpResponse(status=304, headers={'ETag': etag})
+        documents = await (
+            get_async_collection().find(query, list_projection(fields)).sort(LIST_SORT).limit(limit + 1).to_list(limit + 1)
+        )
+        next_cursor = encode_cursor(documents[limit - 1]) if len(documents) > limit else None
+        return json_response(
+            {
+                'results': [serialize_transcription(doc, fields or LIST_FIELDS) for doc in documents[:limit]],
+                'next_cursor': next_cursor,
+            },
+            headers={'ETag': etag},
+        )
+
+    async def post(self, request):
+        serializer = TranscriptionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status=400)
+        payload = dict(serializer.validated_data)
+        payload.update(await _pack_text(payload.pop('text')))
+        payload['created_at'] = payload['updated_at'] = datetime.utcnow()
+        payload['version'] = 1
+        collection = get_async_collection()
+        written = False
+        try:
+            async with amongo_transaction() as session:
+                await collection.insert_one(payload, session=session)
+                # Without a transaction the insert stands even if recording the event fails.
+                written = session is None
+                await arecord_event(created_event([payload]), session=session)
+        except Exception:
+            if not written:
+                # A GridFS body written by _pack_text would otherwise be orphaned.
+                await _gridfs_aware(discard_text, payload)
+            raise
+        document = await collection.find_one({'_id': payload['_id']})
+        await _index_document(document)
+        await abump_list_version(get_async_redis_connection())
+        serialized = await _gridfs_aware(serialize_transcription, document)
+        return json_response(serialized, status=201, headers={'ETag': document_etag(document)})
+
+
+class AsyncTranscriptionDetailView(AsyncAPIView):
+    async def get_object(self, pk: str, projection=None):
+        try:
+            object_id = parse_object_id(pk)
+        except ValueError:
+            return None
+        return await get_async_collection().find_one({'_id': object_id}, projection)
+
+    async def get(self, request, pk: str):
+        try:
+            fields = parse_fields(request.GET.get('fields'))
+        except ValueError as exc:
+            return json_response({'detail': str(exc)}, status=400)
+        document = await self.get_object(pk, detail_projection(fields))
+        if not document:
+            return json_response({'detail': 'Not found.'}, status=404)
+        etag = document_etag(document, ','.join(fields or []))
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return HttpResponse(status=304, headers={'ETag': etag})
+        serialized = await _gridfs_aware(serialize_transcription, document, fields)
+        return json_response(serialized, headers={'ETag': etag})
+
+    async def put(self, request, pk: str):
+        document = await self.get_object(pk)
+        if not document:
+            return json_response({'detail': 'Not found.'}, status=404)
+        serializer = TranscriptionUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status=400)
+        criteria = precondition_criteria(request.headers.get('If-Match'), document)
+        if criteria is None:
+            return json_response({'detail': 'Precondition failed.'}, status=412)
+        data = dict(serializer.validated_data)
+        update = await _text_update(data.pop('text'))
+        update['$set'].update(data, updated_at=datetime.utcnow())
+        update['$inc'] = {'version': 1}
+        collection = get_async_collection()
+        written = False
+        try:
+            async with amongo_transaction() as session:
+                result = await collection.update_one(criteria, update, session=session)
+                written = session is None and bool(result.matched_count)
+                if result.matched_count:
+                    await arecord_event(updated_event(document, data), session=session)
+        except Exception:
+            if not written:
+                await _gridfs_aware(discard_text, update['$set'])
+            raise
+        if not result.matched_count:
+            await _gridfs_aware(discard_text, update['$set'])
+            return json_response({'detail': 'Precondition failed.'}, status=412)
+        await _gridfs_aware(discard_text, document)
+        await abump_list_version(get_async_redis_connection())
+        updated = await collection.find_one({'_id': document['_id']})
+        await _index_document(updated)
+        serialized = await _gridfs_aware(serialize_transcription, updated)
+        return json_response(serialized, headers={'ETag': document_etag(updated)})
+
+    async def delete(self, request, pk: str):
+        document = await self.get_object(pk)
+        if not document:
+            return json_response({'detail': 'Not found.'}, status=404)
+        criteria = precondition_criteria(request.headers.get('If-Match'), document)
+        if criteria is None:
+            return json_response({'detail': 'Precondition failed.'}, status=412)
+        async with amongo_transaction() as session:
+            result = await get_async_collection().delete_one(criteria, session=session)
+            if result.deleted_count:
+                await arecord_event(deleted_event(document), session=session)
+        if not result.deleted_count:
+            return json_response({'detail': 'Precondition failed.'}, status=412)
+        await _gridfs_aware(discard_text, document)
+        await abump_list_version(get_async_redis_connection())
+        # Can wait on the bm25 index lock while another thread loads it.
+        await sync_to_async(get_search_backend().remove_document, thread_sensitive=False)(str(document['_id']))
+        return HttpResponse(status=204)
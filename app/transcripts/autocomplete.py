@@ -0,0 +1,161 @@
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from bson import ObjectId
+from django.conf import settings
+
+
+AUTOCOMPLETE_KINDS = ('title', 'topics', 'speakers')
+# Per kind: a sorted set with every member at score 0, so ZRANGEBYLEX walks it in
+# lexicographic order, and a hash counting the documents behind each member.
+AUTOCOMPLETE_KEYS = {kind: f'transcriptions:autocomplete:{kind}' for kind in AUTOCOMPLETE_KINDS}
+AUTOCOMPLETE_REFS_KEYS = {kind: f'transcriptions:autocomplete:{kind}:refs' for kind in AUTOCOMPLETE_KINDS}
+# Outbox events the last rebuild already counted, as FACETS_COVERED_KEY.
+AUTOCOMPLETE_COVERED_KEY = 'transcriptions:autocomplete:covered'
+# Lexicographic matches read per lookup before ranking them by document count.
+AUTOCOMPLETE_CANDIDATES = 100
+REBUILD_CHUNK_SIZE = 1000
+
+# Members are `<normalized>\0<display>`: NUL sorts first, so a prefix range on the
+# normalized part matches and the display form rides along without a second lookup.
+_SEPARATOR = '\x00'
+_MAX_CHAR = '\U0010ffff'
+
+AUTOCOMPLETE_PIPELINES = {
+    'title': [
+        {'$match': {'title': {'$type': 'string'}}},
+        {'$group': {'_id': '$title', 'count': {'$sum': 1}}},
+    ],
+    **{
+        kind: [
+            {'$project': {kind: {'$setUnion': [{'$ifNull': [f'${kind}', []]}, []]}}},
+            {'$unwind': f'${kind}'},
+            {'$group': {'_id': f'${kind}', 'count': {'$sum': 1}}},
+        ]
+        for kind in ('topics', 'speakers')
+    },
+}
+
+AutocompleteState = Dict[str, Any] | None
+
+
+def normalize(value: str) -> str:
+    decomposed = unicodedata.normalize('NFKD', value.casefold())
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.split())
+
+
+def _member(value: str) -> str | None:
+    normalized = normalize(value)
+    return f'{normalized}{_SEPARATOR}{value.strip()}' if normalized else None
+
+
+def autocomplete_values(state: Dict[str, Any]) -> Dict[str, List[str]]:
+    title = state.get('title')
+    return {
+        'title': [title] if title else [],
+        'topics': sorted(set(state.get('topics') or [])),
+        'speakers': sorted(set(state.get('speakers') or [])),
+    }
+
+
+def autocomplete_deltas(changes: Iterable[Tuple[AutocompleteState, AutocompleteState]]) -> Dict[str, Dict[str, int]]:
+    deltas: Dict[str, Dict[str, int]] = {kind: defaultdict(int) for kind in AUTOCOMPLETE_KINDS}
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            if not state:
+                continue
+            for kind, values in autocomplete_values(state).items():
+                for value in values:
+                    member = _member(value)
+                    if member:
+                        deltas[kind][member] += sign
+    return deltas
+
+
+def apply_autocomplete_deltas(client, deltas: Dict[str, Dict[str, int]]) -> None:
+    changed = [(kind, member, delta) for kind, counts in deltas.items() for member, delta in counts.items() if delta]
+    if not changed:
+        return
+    pipe = client.pipeline(transaction=True)
+    for kind, member, delta in changed:
+        pipe.hincrby(AUTOCOMPLETE_REFS_KEYS[kind], member, delta)
+    counts = pipe.execute()
+    # A member stays completable while at least one document still references it.
+    pipe = client.pipeline(transaction=True)
+    for (kind, member, _), count in zip(changed, counts):
+        if count > 0:
+            pipe.zadd(AUTOCOMPLETE_KEYS[kind], {member: 0})
+        else:
+            pipe.zrem(AUTOCOMPLETE_KEYS[kind], member)
+            pipe.hdel(AUTOCOMPLETE_REFS_KEYS[kind], member)
+    pipe.execute()
+
+
+def complete(client, prefix: str, kinds: Iterable[str] = AUTOCOMPLETE_KINDS, limit: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+    kinds = list(kinds)
+    normalized = normalize(prefix)
+    if not normalized:
+        return {kind: [] for kind in kinds}
+    pipe = client.pipeline(transaction=False)
+    for kind in kinds:
+        pipe.zrangebylex(
+            AUTOCOMPLETE_KEYS[kind], f'[{normalized}', f'[{normalized}{_MAX_CHAR}', 0, AUTOCOMPLETE_CANDIDATES
+        )
+    candidates = pipe.execute()
+    pipe = client.pipeline(transaction=False)
+    for kind, members in zip(kinds, candidates):
+        if members:
+            pipe.hmget(AUTOCOMPLETE_REFS_KEYS[kind], members)
+    counts = iter(pipe.execute())
+    results = {}
+    for kind, members in zip(kinds, candidates):
+        ranked = [
+            (member.split(_SEPARATOR, 1)[1], int(count or 0))
+            for member, count in zip(members, next(counts) if members else [])
+        ]
+        # Most referenced first; ties keep lexicographic order.
+        ranked.sort(key=lambda item: -item[1])
+        results[kind] = [{'value': value, 'count': count} for value, count in ranked[:limit]]
+    return results
+
+
+def autocomplete_covered(client) -> Set[str]:
+    return client.smembers(AUTOCOMPLETE_COVERED_KEY)
+
+
+# Loads each index into a scratch key in chunks, then swaps them all in with one MULTI,
+# so lookups never see a half-built index. `covered` and `session` work as in rebuild_facets.
+def rebuild_autocomplete(collection, client, covered: Iterable[ObjectId] = (), session=None) -> Dict[str, int]:
+    sizes = {}
+    swap = client.pipeline(transaction=True)
+    for kind in AUTOCOMPLETE_KINDS:
+        key, refs_key = AUTOCOMPLETE_KEYS[kind], AUTOCOMPLETE_REFS_KEYS[kind]
+        scratch_key, scratch_refs_key = f'{key}:rebuild', f'{refs_key}:rebuild'
+        client.delete(scratch_key, scratch_refs_key)
+        refs: Dict[str, int] = defaultdict(int)
+        for row in collection.aggregate(AUTOCOMPLETE_PIPELINES[kind], allowDiskUse=True, session=session):
+            member = _member(row['_id']) if isinstance(row['_id'], str) else None
+            if member:
+                refs[member] += row['count']
+        members = list(refs.items())
+        for start in range(0, len(members), REBUILD_CHUNK_SIZE):
+            chunk = dict(members[start:start + REBUILD_CHUNK_SIZE])
+            pipe = client.pipeline(transaction=False)
+            pipe.zadd(scratch_key, {member: 0 for member in chunk})
+            pipe.hset(scratch_refs_key, mapping=chunk)
+            pipe.execute()
+        sizes[kind] = len(members)
+        if members:
+            swap.rename(scratch_key, key)
+            swap.rename(scratch_refs_key, refs_key)
+        else:
+            swap.delete(key, refs_key)
+    covered = [str(event_id) for event_id in covered]
+    swap.delete(AUTOCOMPLETE_COVERED_KEY)
+    if covered:
+        swap.sadd(AUTOCOMPLETE_COVERED_KEY, *covered)
+        swap.expire(AUTOCOMPLETE_COVERED_KEY, settings.OUTBOX_RETENTION_SECONDS)
+    swap.execute()
+    return sizes
@@ -0,0 +1,90 @@
+import hashlib
+import secrets
+from typing import Any, Dict
+
+from django.utils.http import parse_etags
+
+
+# A hash with `version` and `epoch`. The epoch is regenerated whenever the hash is lost
+# (restart without persistence, flush, eviction), so old list ETags can never match again.
+LIST_VERSION_KEY = 'transcriptions:version'
+
+
+def _digest(value: str) -> str:
+    return hashlib.blake2b(value.encode(), digest_size=6).hexdigest()
+
+
+def document_version(document: Dict[str, Any]) -> int:
+    # Documents written before versioning existed count as version 0.
+    return document.get('version') or 0
+
+
+# The full document gets a strong ETag, usable in If-Match. A `?fields=` variant is a
+# partial representation: its ETag is weak, so it only serves If-None-Match.
+def document_etag(document: Dict[str, Any], variant: str = '') -> str:
+    tag = f"{document['_id']}-{document_version(document)}"
+    if variant:
+        return f'W/"{tag}-{_digest(variant)}"'
+    return f'"{tag}"'
+
+
+def _format_version(epoch: str, version: str | None) -> str:
+    return f'{epoch}.{int(version or 0)}'
+
+
+def list_version(client) -> str:
+    epoch, version = client.hmget(LIST_VERSION_KEY, 'epoch', 'version')
+    if not epoch:
+        client.hsetnx(LIST_VERSION_KEY, 'epoch', secrets.token_hex(4))
+        epoch, version = client.hmget(LIST_VERSION_KEY, 'epoch', 'version')
+    return _format_version(epoch, version)
+
+
+async def alist_version(client) -> str:
+    epoch, version = await client.hmget(LIST_VERSION_KEY, 'epoch', 'version')
+    if not epoch:
+        await client.hsetnx(LIST_VERSION_KEY, 'epoch', secrets.token_hex(4))
+        epoch, version = await client.hmget(LIST_VERSION_KEY, 'epoch', 'version')
+    return _format_version(epoch, version)
+
+
+def bump_list_version(client) -> int:
+    return client.hincrby(LIST_VERSION_KEY, 'version', 1)
+
+
+async def abump_list_version(client) -> int:
+    return await client.hincrby(LIST_VERSION_KEY, 'version', 1)
+
+
+def list_etag(version: str, query_params) -> str:
+    variant = '&'.join(f'{key}={value}' for key, values in sorted(query_params.lists()) for value in values)
+    return f'W/"list-{version}-{_digest(variant)}"'
+
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+# Weak comparison, for If-None-Match.
+def etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    candidates = parse_etags(header)
+    return '*' in candidates or _opaque(etag) in {_opaque(candidate) for candidate in candidates}
+
+
+# Strong comparison, for If-Match (RFC 9110 13.1.1): a weak ETag never matches.
+def etag_matches_strongly(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    candidates = parse_etags(header)
+    return '*' in candidates or (not etag.startswith('W/') and etag in candidates)
+
+
+def precondition_criteria(if_match: str | None, document: Dict[str, Any]) -> Dict[str, Any] | None:
+    # With If-Match the write is conditional on the version that was checked.
+    if not if_match:
+        return {'_id': document['_id']}
+    if not etag_matches_strongly(if_match, document_etag(document)):
+        return None
+    return {'_id': document['_id'], 'version': document.get('version')}
@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+import zlib
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .mongo import serialize_transcription
+
+
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Rows are buffered up to this size before a chunk is handed to the server.
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def _ndjson_header(fields: List[str]) -> str:
+    return ''
+
+
+def _ndjson_row(document: Dict[str, Any], fields: List[str]) -> str:
+    return json.dumps(serialize_transcription(document, fields), cls=DjangoJSONEncoder) + '\n'
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, list):
+        return ';'.join(str(item) for item in value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _csv_line(values: List[Any]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def _csv_header(fields: List[str]) -> str:
+    return _csv_line(fields)
+
+
+def _csv_row(document: Dict[str, Any], fields: List[str]) -> str:
+    data = serialize_transcription(document, fields)
+    return _csv_line([_csv_value(data[field]) for field in fields])
+
+
+def _quality(params: List[str]) -> float:
+    for param in params:
+        name, _, value = param.strip().partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    # Honour q-values: `gzip;q=0` is an explicit refusal, `*` only applies when gzip is not listed.
+    codings: Dict[str, float] = {}
+    for entry in (accept_encoding or '').split(','):
+        coding, *params = entry.split(';')
+        coding = coding.strip().lower()
+        if coding:
+            codings[coding] = _quality(params)
+    if 'gzip' in codings:
+        return codings['gzip'] > 0
+    return codings.get('*', 0) > 0
+
+
+# Per format: the header written once, then one line per document.
+ROW_WRITERS: Dict[str, Tuple[Callable[[List[str]], str], Callable[[Dict[str, Any], List[str]], str]]] = {
+    'ndjson': (_ndjson_header, _ndjson_row),
+    'csv': (_csv_header, _csv_row),
+}
+
+
+class _Chunker:
+    def __init__(self, gzip: bool) -> None:
+        self.compressor = zlib.compressobj(wbits=31) if gzip else None
+        self.pending: List[bytes] = []
+        self.pending_size = 0
+
+    def add(self, text: str) -> bytes | None:
+        data = text.encode()
+        if self.compressor:
+            data = self.compressor.compress(data)
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size < EXPORT_CHUNK_BYTES:
+            return None
+        return self.take()
+
+    def take(self) -> bytes:
+        chunk = b''.join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        return chunk
+
+    def close(self) -> bytes:
+        if self.compressor:
+            self.pending.append(self.compressor.flush())
+        return self.take()
+
+
+def stream_export(
+    documents: Iterable[Dict[str, Any]],
+    export_format: str,
+    fields: List[str],
+    gzip: bool = False,
+) -> Iterator[bytes]:
+    header, row = ROW_WRITERS[export_format]
+    chunker = _Chunker(gzip)
+    chunker.add(header(fields))
+    for document in documents:
+        chunk = chunker.add(row(document, fields))
+        if chunk:
+            yield chunk
+    chunk = chunker.close()
+    if chunk:
+        yield chunk
+
+
+# The ASGI counterpart: Django would drain a sync iterator into a list under ASGI, so the
+# export is fed from a Motor cursor instead. Serializing a GridFS body reads the blob,
+# which runs in a worker thread rather than on the event loop.
+async def astream_export(
+    documents: AsyncIterable[Dict[str, Any]],
+    export_format: str,
+    fields: List[str],
+    gzip: bool = False,
+) -> AsyncIterator[bytes]:
+    header, row = ROW_WRITERS[export_format]
+    chunker = _Chunker(gzip)
+    chunker.add(header(fields))
+    async for document in documents:
+        if 'text' in fields and document.get('text_storage') == 'gridfs':
+            text = await sync_to_async(row, thread_sensitive=False)(document, fields)
+        else:
+            text = row(document, fields)
+        chunk = chunker.add(text)
+        if chunk:
+            yield chunk
+    chunk = chunker.close()
+    if chunk:
+        yield chunk
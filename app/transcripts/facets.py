@@ -0,0 +1,97 @@
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from bson import ObjectId
+from django.conf import settings
+
+
+FACET_KEYS = {
+    'folder': 'transcriptions:facets:folder',
+    'topics': 'transcriptions:facets:topics',
+}
+# Outbox events the last rebuild already counted; the handler skips them. Event ids are
+# not in commit order, so a set is kept rather than a high-water mark.
+FACETS_COVERED_KEY = 'transcriptions:facets:covered'
+
+# Topics are counted once per document, matching how the `topics` filter matches.
+FACET_PIPELINES = {
+    'folder': [
+        {'$match': {'folder': {'$type': 'string'}}},
+        {'$group': {'_id': '$folder', 'count': {'$sum': 1}}},
+    ],
+    'topics': [
+        {'$project': {'topics': {'$setUnion': [{'$ifNull': ['$topics', []]}, []]}}},
+        {'$unwind': '$topics'},
+        {'$group': {'_id': '$topics', 'count': {'$sum': 1}}},
+    ],
+}
+
+FacetState = Dict[str, Any] | None
+
+
+def facet_values(state: Dict[str, Any]) -> Dict[str, List[str]]:
+    folder = state.get('folder')
+    return {
+        'folder': [folder] if folder else [],
+        'topics': sorted(set(state.get('topics') or [])),
+    }
+
+
+def facet_deltas(changes: Iterable[Tuple[FacetState, FacetState]]) -> Dict[str, Dict[str, int]]:
+    deltas: Dict[str, Dict[str, int]] = {name: defaultdict(int) for name in FACET_KEYS}
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            if not state:
+                continue
+            for name, values in facet_values(state).items():
+                for value in values:
+                    deltas[name][value] += sign
+    return deltas
+
+
+def apply_facet_deltas(client, deltas: Dict[str, Dict[str, int]]) -> None:
+    pipe = client.pipeline(transaction=True)
+    for name, counts in deltas.items():
+        for value, delta in counts.items():
+            if delta:
+                pipe.hincrby(FACET_KEYS[name], value, delta)
+    pipe.execute()
+
+
+def facet_counts(client) -> Dict[str, List[Dict[str, Any]]]:
+    pipe = client.pipeline(transaction=False)
+    for key in FACET_KEYS.values():
+        pipe.hgetall(key)
+    facets = {}
+    for name, values in zip(FACET_KEYS, pipe.execute()):
+        # Values that dropped to zero are left in the hash until the next rebuild.
+        counts = [(value, int(count)) for value, count in values.items() if int(count) > 0]
+        counts.sort(key=lambda item: (-item[1], item[0]))
+        facets[name] = [{'value': value, 'count': count} for value, count in counts]
+    return facets
+
+
+def facets_covered(client) -> Set[str]:
+    return client.smembers(FACETS_COVERED_KEY)
+
+
+# `covered` are the outbox events not yet applied when the aggregation's snapshot was
+# taken (see unapplied_event_ids): their writes are in it, so the handler must not apply
+# them again. Pass the same `session` so both reads see the same snapshot.
+def rebuild_facets(collection, client, covered: Iterable[ObjectId] = (), session=None) -> Dict[str, int]:
+    sizes = {}
+    pipe = client.pipeline(transaction=True)
+    for name, key in FACET_KEYS.items():
+        counts = {row['_id']: row['count'] for row in collection.aggregate(FACET_PIPELINES[name], session=session)}
+        sizes[name] = len(counts)
+        pipe.delete(key)
+        if counts:
+            pipe.hset(key, mapping=counts)
+    covered = [str(event_id) for event_id in covered]
+    pipe.delete(FACETS_COVERED_KEY)
+    if covered:
+        pipe.sadd(FACETS_COVERED_KEY, *covered)
+        # Left-over ids go once their events are long dispatched.
+        pipe.expire(FACETS_COVERED_KEY, settings.OUTBOX_RETENTION_SECONDS)
+    pipe.execute()
+    return sizes
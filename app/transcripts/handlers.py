@@ -0,0 +1,65 @@
+import json
+from typing import Any, Dict, List, Set, Tuple
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from core.redis import get_redis_connection, publish
+from .autocomplete import apply_autocomplete_deltas, autocomplete_covered, autocomplete_deltas
+from .etags import bump_list_version
+from .facets import apply_facet_deltas, facet_deltas, facets_covered
+from .outbox import handles
+
+
+@handles('transcriptions.created')
+def notify_created(events: List[Dict[str, Any]]) -> None:
+    batches = [event['payload']['items'] for event in events]
+    channel_layer = get_channel_layer()
+    for items in batches:
+        if len(items) == 1:
+            publish('events:transcriptions', items[0]['id'])
+            message = {'type': 'transcription_created', 'data': items[0]}
+        else:
+            publish('events:transcriptions', json.dumps([item['id'] for item in items]))
+            message = {'type': 'transcriptions_created', 'data': {'count': len(items), 'items': items}}
+        async_to_sync(channel_layer.group_send)('notifications', message)
+    get_redis_connection().incr('realtime:transcriptions_count', sum(len(items) for items in batches))
+
+
+# (before, after) document states, skipping events a rebuild already covered.
+def _state_changes(events: List[Dict[str, Any]], covered: Set[str]) -> List[Tuple[Any, Any]]:
+    changes = []
+    for event in events:
+        if str(event['_id']) in covered:
+            continue
+        payload = event['payload']
+        if event['type'] == 'transcriptions.created':
+            changes.extend((None, item) for item in payload['items'])
+        else:
+            changes.append((payload['before'], payload.get('after')))
+    return changes
+
+
+@handles('transcriptions.created')
+@handles('transcriptions.updated')
+@handles('transcriptions.deleted')
+def update_facets(events: List[Dict[str, Any]]) -> None:
+    client = get_redis_connection()
+    apply_facet_deltas(client, facet_deltas(_state_changes(events, facets_covered(client))))
+
+
+@handles('transcriptions.created')
+@handles('transcriptions.updated')
+@handles('transcriptions.deleted')
+def update_autocomplete(events: List[Dict[str, Any]]) -> None:
+    client = get_redis_connection()
+    apply_autocomplete_deltas(client, autocomplete_deltas(_state_changes(events, autocomplete_covered(client))))
+
+
+# The views bump the list version right after each write; this repeats it from the outbox
+# so a Redis failure between the Mongo write and that bump cannot leave list ETags stale.
+@handles('transcriptions.created')
+@handles('transcriptions.updated')
+@handles('transcriptions.deleted')
+def bump_list_etag(events: List[Dict[str, Any]]) -> None:
+    bump_list_version(get_redis_connection())
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+from dashboards.aggregations import per_day_pipeline, summary_pipeline
+from .mongo import LIST_PROJECTION, LIST_SORT, build_list_query
+
+
+# Every index on the transcriptions collection is declared here; the
+# ensure_transcription_indexes command reconciles the live collection with it.
+# `_id` closes each key so the (created_at, _id) keyset sort is served by the index.
+TRANSCRIPTION_INDEXES = [
+    IndexModel(
+        [('folder', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+        name='folder_created_at',
+    ),
+    IndexModel(
+        [('topics', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+        name='topics_created_at',
+    ),
+    IndexModel(
+        [('created_at', DESCENDING), ('_id', DESCENDING)],
+        name='created_at',
+    ),
+    IndexModel(
+        # `text_search` holds the terms of bodies stored compressed or in GridFS.
+        [('title', TEXT), ('text', TEXT), ('text_search', TEXT)],
+        name='title_text',
+        weights={'title': 3, 'text': 1, 'text_search': 1},
+    ),
+]
+
+
+def _normalise_key(key: Iterable[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+    return [
+        (field, int(direction) if isinstance(direction, (int, float)) else direction)
+        for field, direction in key
+    ]
+
+
+def _matches(document: Dict[str, Any], info: Dict[str, Any]) -> bool:
+    key = _normalise_key(document['key'].items())
+    text_fields = {field for field, direction in key if direction == TEXT}
+    if not text_fields:
+        return _normalise_key(info['key']) == key
+    # Mongo reports text indexes as `_fts`/`_ftsx` keys and lists the fields under `weights`.
+    weights = {field: document.get('weights', {}).get(field, 1) for field in text_fields}
+    if 'weights' in info:
+        return {field: int(weight) for field, weight in info['weights'].items()} == weights
+    return {field for field, direction in _normalise_key(info['key']) if direction == TEXT} == text_fields
+
+
+def ensure_indexes(collection, indexes=None, drop_unknown: bool = False) -> Dict[str, List[str]]:
+    existing = collection.index_information()
+    report: Dict[str, List[str]] = {'created': [], 'replaced': [], 'unchanged': [], 'dropped': []}
+    managed = set()
+    to_create = []
+    for model in TRANSCRIPTION_INDEXES if indexes is None else indexes:
+        document = model.document
+        name = document['name']
+        managed.add(name)
+        current = existing.get(name)
+        if current and _matches(document, current):
+            report['unchanged'].append(name)
+            continue
+        # Same name with other keys, or same keys under another name: rebuild it under ours.
+        stale = [
+            other for other, info in existing.items()
+            if other == name or (other != '_id_' and _matches(document, info))
+        ]
+        for other in stale:
+            collection.drop_index(other)
+            existing.pop(other)
+        report['replaced' if stale else 'created'].append(name)
+        to_create.append(model)
+    if to_create:
+        collection.create_indexes(to_create)
+    if drop_unknown:
+        for name in list(existing):
+            if name != '_id_' and name not in managed:
+                collection.drop_index(name)
+                report['dropped'].append(name)
+    return report
+
+
+def winning_plan_stages(explain: Dict[str, Any]) -> List[str]:
+    stages: List[str] = []
+
+    def collect(node: Any, inside_plan: bool) -> None:
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == 'rejectedPlans':
+                    continue
+                if inside_plan and key == 'stage' and isinstance(value, str):
+                    stages.append(value)
+                collect(value, inside_plan or key == 'winningPlan')
+        elif isinstance(node, list):
+            for item in node:
+                collect(item, inside_plan)
+
+    collect(explain, False)
+    return stages
+
+
+def query_shape_explains(collection, page_size: int = 50) -> Dict[str, Dict[str, Any]]:
+    cursor = (datetime.utcnow(), ObjectId())
+    shapes = {
+        'list': build_list_query(),
+        'list_by_folder': build_list_query(folder='explain'),
+        'list_by_topics': build_list_query(topics=['explain']),
+        'list_by_folder_after_cursor': build_list_query(folder='explain', cursor=cursor),
+    }
+    explains = {
+        name: collection.find(query, LIST_PROJECTION).sort(LIST_SORT).limit(page_size + 1).explain()
+        for name, query in shapes.items()
+    }
+    since = datetime.utcnow() - timedelta(days=1)
+    pipelines = {
+        'dashboard_per_day': per_day_pipeline(since),
+        'dashboard_summary': summary_pipeline(since),
+    }
+    for name, pipeline in pipelines.items():
+        explains[name] = collection.database.command('aggregate', collection.name, pipeline=pipeline, explain=True)
+    return explains
+
+
+# Shapes that read every document by design, so no index can avoid the COLLSCAN.
+# They are still explained and reported, but do not fail the check.
+EXPECTED_COLLECTION_SCANS = {
+    'dashboard_summary': '$facet sub-pipelines cannot use indexes; one pass over every transcription (live dashboard only)',
+}
+
+
+def find_collection_scans(collection, page_size: int = 50) -> List[str]:
+    return [
+        name
+        for name, explain in query_shape_explains(collection, page_size).items()
+        if 'COLLSCAN' in winning_plan_stages(explain)
+    ]
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from transcripts.outbox import OutboxDispatcher, outbox_lag
+
+
+class Command(BaseCommand):
+    help = 'Drain the transcription outbox into the Redis counter, pub/sub and the channel layer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain what is pending and exit.')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--interval', type=float, default=settings.OUTBOX_POLL_INTERVAL)
+
+    def handle(self, *args, **options):
+        dispatcher = OutboxDispatcher(batch_size=options['batch_size'])
+        while True:
+            dispatched = dispatcher.drain_once()
+            if dispatched:
+                lag = outbox_lag(dispatcher.collection)
+                self.stdout.write(
+                    f"dispatched={dispatched} pending={lag['pending']} lag={lag['oldest_pending_seconds']}s"
+                )
+            if dispatched >= dispatcher.batch_size:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from transcripts.indexes import EXPECTED_COLLECTION_SCANS, ensure_indexes, find_collection_scans
+from transcripts.mongo import get_collection
+from transcripts.outbox import OUTBOX_INDEXES, get_outbox_collection
+
+
+class Command(BaseCommand):
+    help = 'Create or reconcile the declared indexes of the transcriptions and outbox collections.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--drop-unknown',
+            action='store_true',
+            help='Drop indexes that are not declared in transcripts.indexes.',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Explain the list and dashboard query shapes and fail on COLLSCAN.',
+        )
+
+    def handle(self, *args, **options):
+        collection = get_collection()
+        targets = [(collection, None), (get_outbox_collection(), OUTBOX_INDEXES)]
+        for target, indexes in targets:
+            report = ensure_indexes(target, indexes, drop_unknown=options['drop_unknown'])
+            for action, names in report.items():
+                for name in names:
+                    self.stdout.write(f'{action}: {target.name}.{name}')
+        if options['check']:
+            scans = find_collection_scans(collection, settings.TRANSCRIPTIONS_PAGE_SIZE)
+            for name in scans:
+                if name in EXPECTED_COLLECTION_SCANS:
+                    self.stdout.write(self.style.WARNING(f'Expected COLLSCAN: {name} ({EXPECTED_COLLECTION_SCANS[name]})'))
+            scans = [name for name in scans if name not in EXPECTED_COLLECTION_SCANS]
+            if scans:
+                raise CommandError(f"Query shapes falling back to COLLSCAN: {', '.join(scans)}")
+            self.stdout.write(self.style.SUCCESS('All other query shapes use an index.'))
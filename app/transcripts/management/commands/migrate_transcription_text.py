@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from transcripts.mongo import get_collection
+from transcripts.storage import (
+    TEXT_STORAGE_FIELDS,
+    TEXT_STORAGE_MODES,
+    discard_text,
+    load_text,
+    target_storage,
+    text_update,
+)
+
+
+class Command(BaseCommand):
+    help = 'Convert stored transcription bodies to a text storage mode in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=TEXT_STORAGE_MODES, default=None)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        mode = options['mode'] or settings.TRANSCRIPTIONS_TEXT_STORAGE
+        collection = get_collection()
+        projection = {'version': 1, **{field: 1 for field in TEXT_STORAGE_FIELDS}}
+        last_id = None
+        scanned = converted = 0
+        while True:
+            criteria = {'_id': {'$gt': last_id}} if last_id else {}
+            batch = list(collection.find(criteria, projection).sort('_id', 1).limit(options['batch_size']))
+            if not batch:
+                break
+            last_id = batch[-1]['_id']
+            scanned += len(batch)
+            operations = []
+            pending = []
+            for document in batch:
+                text = load_text(document)
+                if text is None or target_storage(text, mode) == document.get('text_storage', 'inline'):
+                    continue
+                update = text_update(text, mode)
+                # Guarded by version so a concurrent PUT is not overwritten with the old body.
+                operations.append(UpdateOne({'_id': document['_id'], 'version': document.get('version')}, update))
+                pending.append((document, update['$set']))
+            if operations:
+                result = collection.bulk_write(operations, ordered=False)
+                applied = self.applied(collection, pending, result.matched_count)
+                for document, packed in pending:
+                    # Drop whichever body lost: the old one if converted, the new one if the guard missed.
+                    discard_text(document if document['_id'] in applied else packed)
+                converted += len(applied)
+            self.stdout.write(f'scanned={scanned} converted={converted}')
+        self.stdout.write(self.style.SUCCESS(f'Converted {converted} of {scanned} transcriptions to {mode}.'))
+
+    @staticmethod
+    def applied(collection, pending, matched: int):
+        if matched == len(pending):
+            return {document['_id'] for document, _ in pending}
+        # Some guards missed: a converted document kept its version and now has the new storage.
+        current = {
+            document['_id']: document
+            for document in collection.find(
+                {'_id': {'$in': [document['_id'] for document, _ in pending]}},
+                {'version': 1, 'text_storage': 1, 'text_ref': 1},
+            )
+        }
+        applied = set()
+        for document, packed in pending:
+            stored = current.get(document['_id'])
+            if (
+                stored is not None
+                and stored.get('version') == document.get('version')
+                and stored.get('text_storage', 'inline') == packed.get('text_storage', 'inline')
+                and stored.get('text_ref') == packed.get('text_ref')
+            ):
+                applied.add(document['_id'])
+        return applied
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.mongo import mongo_snapshot
+from core.redis import get_redis_connection
+from transcripts.autocomplete import rebuild_autocomplete
+from transcripts.mongo import get_collection
+from transcripts.handlers import update_autocomplete
+from transcripts.outbox import get_outbox_collection, unapplied_event_ids
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load the title, topic and speaker autocomplete indexes from the transcriptions collection.'
+
+    def handle(self, *args, **options):
+        with mongo_snapshot() as session:
+            covered = unapplied_event_ids(update_autocomplete, get_outbox_collection(), session=session)
+            sizes = rebuild_autocomplete(get_collection(), get_redis_connection(), covered, session=session)
+        for kind, size in sizes.items():
+            self.stdout.write(f'{kind}: {size} entries')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.mongo import mongo_snapshot
+from core.redis import get_redis_connection
+from transcripts.facets import rebuild_facets
+from transcripts.mongo import get_collection
+from transcripts.handlers import update_facets
+from transcripts.outbox import get_outbox_collection, unapplied_event_ids
+
+
+class Command(BaseCommand):
+    help = 'Recompute the folder and topic facet counters from the transcriptions collection.'
+
+    def handle(self, *args, **options):
+        with mongo_snapshot() as session:
+            covered = unapplied_event_ids(update_facets, get_outbox_collection(), session=session)
+            sizes = rebuild_facets(get_collection(), get_redis_connection(), covered, session=session)
+        for name, size in sizes.items():
+            self.stdout.write(f'{name}: {size} values')
@@ -1,27 +1,46 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Tuple
+
 from bson import ObjectId
 from django.conf import settings
 
-from core.mongo import get_mongo_db
+from core.mongo import get_async_mongo_db, get_mongo_db
+from .storage import TEXT_SEARCH_FIELD, TEXT_STORAGE_FIELDS, load_text
 
 
 COLLECTION_NAME = 'transcriptions'
 
+TRANSCRIPTION_FIELDS = ('id', 'title', 'text', 'folder', 'topics', 'created_at', 'length_sec', 'speakers')
+LIST_FIELDS = tuple(field for field in TRANSCRIPTION_FIELDS if field != 'text')
+
+LIST_SORT = [('created_at', -1), ('_id', -1)]
+LIST_PROJECTION = {field: 0 for field in (*TEXT_STORAGE_FIELDS, TEXT_SEARCH_FIELD) if field != 'text_storage'}
+
+FIELD_VALUES = {
+    'id': lambda document: str(document.get('_id')),
+    'title': lambda document: document.get('title'),
+    # Compressed or GridFS bodies are only hydrated when `text` is requested.
+    'text': load_text,
+    'folder': lambda document: document.get('folder'),
+    'topics': lambda document: document.get('topics', []),
+    'created_at': lambda document: document.get('created_at'),
+    'length_sec': lambda document: document.get('length_sec'),
+    'speakers': lambda document: document.get('speakers', []),
+}
+
 
 def get_collection():
     return get_mongo_db()[COLLECTION_NAME]
 
 
-def serialize_transcription(document):
-    return {
-        'id': str(document.get('_id')),
-        'title': document.get('title'),
-        'text': document.get('text'),
-        'folder': document.get('folder'),
-        'topics': document.get('topics', []),
-        'created_at': document.get('created_at'),
-        'length_sec': document.get('length_sec'),
-        'speakers': document.get('speakers', []),
-    }
+def get_async_collection():
+    return get_async_mongo_db()[COLLECTION_NAME]
+
+
+def serialize_transcription(document, fields: Iterable[str] | None = None):
+    return {field: FIELD_VALUES[field](document) for field in (fields or TRANSCRIPTION_FIELDS)}
 
 
 def parse_object_id(value: str) -> ObjectId:
@@ -29,3 +48,95 @@ def parse_object_id(value: str) -> ObjectId:
         return ObjectId(value)
     except Exception as exc:  # noqa: BLE001
         raise ValueError('Invalid transcription id.') from exc
+
+
+def parse_topics(query_params) -> List[str]:
+    topics = []
+    for value in query_params.getlist('topics'):
+        topics.extend(t.strip() for t in value.split(',') if t.strip())
+    return topics
+
+
+def parse_fields(value: str | None) -> List[str] | None:
+    if not value:
+        return None
+    fields = []
+    for field in (f.strip() for f in value.split(',')):
+        if not field:
+            continue
+        if field not in TRANSCRIPTION_FIELDS:
+            raise ValueError(f'Unknown field: {field}.')
+        if field not in fields:
+            fields.append(field)
+    return fields or None
+
+
+def build_projection(fields: Iterable[str]) -> Dict[str, int]:
+    # `_id` is always returned by Mongo and backs the `id` field.
+    projection = {field: 1 for field in fields if field != 'id'}
+    if 'text' in projection:
+        projection.update({field: 1 for field in TEXT_STORAGE_FIELDS})
+    return projection or {'_id': 1}
+
+
+def list_projection(fields: List[str] | None) -> Dict[str, int]:
+    if fields is None:
+        return LIST_PROJECTION
+    # `created_at` is always fetched because the next cursor is built from it.
+    return {**build_projection(fields), 'created_at': 1}
+
+
+def detail_projection(fields: List[str] | None) -> Dict[str, int] | None:
+    if fields is None:
+        return None
+    # `version` backs the ETag.
+    return {**build_projection(fields), 'version': 1}
+
+
+def parse_limit(value: str | None) -> int:
+    if value in (None, ''):
+        return settings.TRANSCRIPTIONS_PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError) as exc:
+        raise ValueError('limit must be a positive integer.') from exc
+    if limit < 1:
+        raise ValueError('limit must be a positive integer.')
+    return min(limit, settings.TRANSCRIPTIONS_MAX_PAGE_SIZE)
+
+
+def encode_cursor(document) -> str:
+    payload = json.dumps(
+        {'created_at': document['created_at'].isoformat(), 'id': str(document['_id'])},
+        separators=(',', ':'),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value: str) -> Tuple[datetime, ObjectId]:
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload['created_at']), ObjectId(payload['id'])
+    except Exception as exc:  # noqa: BLE001
+        raise ValueError('Invalid cursor.') from exc
+
+
+def build_list_query(
+    folder: str | None = None,
+    topics: List[str] | None = None,
+    cursor: Tuple[datetime, ObjectId] | None = None,
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    if folder:
+        query['folder'] = folder
+    if topics:
+        query['topics'] = {'$in': topics}
+    if cursor:
+        created_at, object_id = cursor
+        # Keyset continuation for the (created_at desc, _id desc) sort order.
+        query['$or'] = [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, '_id': {'$lt': object_id}},
+        ]
+    return query
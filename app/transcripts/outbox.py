@@ -0,0 +1,189 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo import ASCENDING, IndexModel
+
+from core.mongo import get_async_mongo_db, get_mongo_db
+
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = 'transcription_outbox'
+
+OUTBOX_INDEXES = [
+    # Pending events have `dispatched_at: null`; TTL only expires dispatched ones.
+    IndexModel(
+        [('dispatched_at', ASCENDING)],
+        name='dispatched_at_ttl',
+        expireAfterSeconds=settings.OUTBOX_RETENTION_SECONDS,
+    ),
+    IndexModel([('lease_token', ASCENDING)], name='lease_token', sparse=True),
+]
+
+Handler = Callable[[List[Dict[str, Any]]], None]
+HANDLERS: Dict[str, List[Handler]] = defaultdict(list)
+
+
+def get_outbox_collection():
+    return get_mongo_db()[OUTBOX_COLLECTION]
+
+
+def get_async_outbox_collection():
+    return get_async_mongo_db()[OUTBOX_COLLECTION]
+
+
+def handles(event_type: str) -> Callable[[Handler], Handler]:
+    def decorator(func: Handler) -> Handler:
+        HANDLERS[event_type].append(func)
+        return func
+
+    return decorator
+
+
+def handler_name(handler: Handler) -> str:
+    return f'{handler.__module__}.{handler.__qualname__}'
+
+
+# Events `handler` has not applied yet. A rebuild reads them in the same snapshot as its
+# aggregation, which therefore already includes their writes.
+def unapplied_event_ids(handler: Handler, collection=None, session=None) -> List[ObjectId]:
+    collection = collection if collection is not None else get_outbox_collection()
+    criteria = {'dispatched_at': None, 'done_handlers': {'$ne': handler_name(handler)}}
+    return [event['_id'] for event in collection.find(criteria, {'_id': 1}, session=session)]
+
+
+def build_event(event_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'type': event_type,
+        'payload': payload,
+        'created_at': datetime.utcnow(),
+        'dispatched_at': None,
+        'attempts': 0,
+    }
+
+
+# The fields downstream counters (facets, dashboard rollups, autocomplete) are derived from.
+def _state(document: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'title': document.get('title'),
+        'folder': document.get('folder'),
+        'topics': document.get('topics') or [],
+        'length_sec': document.get('length_sec') or 0,
+        'speakers': document.get('speakers') or [],
+    }
+
+
+def created_event(documents: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    items = [
+        {
+            'id': str(document['_id']),
+            'title': document['title'],
+            'created_at': document['created_at'].isoformat(),
+            **_state(document),
+        }
+        for document in documents
+    ]
+    return build_event('transcriptions.created', {'items': items})
+
+
+def updated_event(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    return build_event(
+        'transcriptions.updated',
+        {
+            'id': str(before['_id']),
+            'created_at': before['created_at'].isoformat(),
+            'before': _state(before),
+            'after': _state(after),
+        },
+    )
+
+
+def deleted_event(document: Dict[str, Any]) -> Dict[str, Any]:
+    return build_event(
+        'transcriptions.deleted',
+        {'id': str(document['_id']), 'created_at': document['created_at'].isoformat(), 'before': _state(document)},
+    )
+
+
+def record_event(event: Dict[str, Any], session=None) -> None:
+    get_outbox_collection().insert_one(event, session=session)
+
+
+async def arecord_event(event: Dict[str, Any], session=None) -> None:
+    await get_async_outbox_collection().insert_one(event, session=session)
+
+
+def outbox_lag(collection=None) -> Dict[str, Any]:
+    collection = collection if collection is not None else get_outbox_collection()
+    pending = collection.count_documents({'dispatched_at': None})
+    oldest = collection.find_one({'dispatched_at': None}, {'created_at': 1}, sort=[('_id', ASCENDING)])
+    age = (datetime.utcnow() - oldest['created_at']).total_seconds() if oldest else 0.0
+    return {'pending': pending, 'oldest_pending_seconds': round(age, 3)}
+
+
+# Events are leased before their handlers run and only marked dispatched once those
+# succeed, so a crash or handler error means redelivery: delivery is at-least-once.
+class OutboxDispatcher:
+    def __init__(self, collection=None, batch_size: int | None = None, lease_seconds: int | None = None) -> None:
+        self.collection = collection if collection is not None else get_outbox_collection()
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.lease_seconds = lease_seconds or settings.OUTBOX_LEASE_SECONDS
+
+    def claim(self) -> List[Dict[str, Any]]:
+        now = datetime.utcnow()
+        claimable = {
+            'dispatched_at': None,
+            '$or': [{'lease_until': {'$exists': False}}, {'lease_until': {'$lt': now}}],
+        }
+        ids = [
+            event['_id']
+            for event in self.collection.find(claimable, {'_id': 1}).sort('_id', ASCENDING).limit(self.batch_size)
+        ]
+        if not ids:
+            return []
+        token = ObjectId()
+        self.collection.update_many(
+            {'_id': {'$in': ids}, **claimable},
+            {
+                '$set': {'lease_token': token, 'lease_until': now + timedelta(seconds=self.lease_seconds)},
+                '$inc': {'attempts': 1},
+            },
+        )
+        return list(self.collection.find({'lease_token': token}).sort('_id', ASCENDING))
+
+    def drain_once(self) -> int:
+        events = self.claim()
+        by_type: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for event in events:
+            by_type[event['type']].append(event)
+        dispatched = 0
+        for event_type, batch in by_type.items():
+            failed = False
+            for handler in HANDLERS.get(event_type, []):
+                name = handler_name(handler)
+                # Handlers are not idempotent: on redelivery only the ones that failed run again.
+                pending = [event for event in batch if name not in event.get('done_handlers', [])]
+                if not pending:
+                    continue
+                try:
+                    handler(pending)
+                except Exception:  # noqa: BLE001
+                    logger.exception('Outbox handler %s failed; %d events will be retried.', name, len(pending))
+                    failed = True
+                    continue
+                self.collection.update_many(
+                    {'_id': {'$in': [event['_id'] for event in pending]}},
+                    {'$addToSet': {'done_handlers': name}},
+                )
+            if failed:
+                continue
+            self.collection.update_many(
+                {'_id': {'$in': [event['_id'] for event in batch]}},
+                {'$set': {'dispatched_at': datetime.utcnow()}, '$unset': {'lease_token': '', 'lease_until': ''}},
+            )
+            dispatched += len(batch)
+        return dispatched
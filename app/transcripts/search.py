@@ -0,0 +1,191 @@
+import html
+import math
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+
+from .mongo import LIST_FIELDS, get_collection, parse_object_id, serialize_transcription
+from .storage import TEXT_STORAGE_FIELDS, load_text
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(value: str | None) -> List[str]:
+    return TOKEN_RE.findall((value or '').lower())
+
+
+def make_snippet(text: str | None, terms: List[str], width: int = 160) -> str:
+    text = text or ''
+    if not terms:
+        return html.escape(text[:width])
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(term) for term in terms) + r')\b', re.IGNORECASE)
+    match = pattern.search(text)
+    start = max((match.start() if match else 0) - width // 3, 0)
+    end = min(start + width, len(text))
+    window = html.escape(text[start:end])
+    window = pattern.sub(lambda m: f'<mark>{m.group(0)}</mark>', window)
+    return ('…' if start > 0 else '') + window + ('…' if end < len(text) else '')
+
+
+@dataclass
+class SearchPage:
+    results: List[Dict[str, Any]]
+    next_offset: int | None
+
+
+class SearchBackend:
+    def search(self, query: str, limit: int, offset: int = 0, folder: str | None = None) -> SearchPage:
+        raise NotImplementedError
+
+    def index_document(self, document: Dict[str, Any]) -> None:
+        pass
+
+    def remove_document(self, document_id: str) -> None:
+        pass
+
+    @staticmethod
+    def _result(document: Dict[str, Any], score: float, terms: List[str]) -> Dict[str, Any]:
+        return {
+            **serialize_transcription(document, LIST_FIELDS),
+            'score': round(score, 4),
+            'snippet': make_snippet(load_text(document), terms),
+        }
+
+
+# Ranks with the `title_text` index declared in transcripts.indexes.
+class MongoTextSearchBackend(SearchBackend):
+    def search(self, query: str, limit: int, offset: int = 0, folder: str | None = None) -> SearchPage:
+        criteria: Dict[str, Any] = {'$text': {'$search': query}}
+        if folder:
+            criteria['folder'] = folder
+        documents = list(
+            get_collection()
+            .find(criteria, {'score': {'$meta': 'textScore'}})
+            .sort([('score', {'$meta': 'textScore'})])
+            .skip(offset)
+            .limit(limit + 1)
+        )
+        terms = tokenize(query)
+        results = [self._result(document, document['score'], terms) for document in documents[:limit]]
+        return SearchPage(results=results, next_offset=offset + limit if len(documents) > limit else None)
+
+
+class InvertedIndex:
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_folders: Dict[str, str | None] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def add(self, doc_id: str, tokens: List[str], folder: str | None = None) -> None:
+        self.remove(doc_id)
+        counts: Dict[str, int] = defaultdict(int)
+        for token in tokens:
+            counts[token] += 1
+        for term, frequency in counts.items():
+            self.postings[term][doc_id] = frequency
+        self.doc_terms[doc_id] = dict(counts)
+        self.doc_folders[doc_id] = folder
+        self.doc_lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def remove(self, doc_id: str) -> None:
+        counts = self.doc_terms.pop(doc_id, None)
+        if counts is None:
+            return
+        self.doc_folders.pop(doc_id, None)
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+        for term in counts:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def search(self, terms: List[str], folder: str | None = None) -> List[Tuple[str, float]]:
+        count = len(self.doc_terms)
+        if not count:
+            return []
+        average_length = self.total_length / count
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(terms):
+            postings = self.postings.get(term, {})
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                if folder and self.doc_folders.get(doc_id) != folder:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+# The index lives in the worker process: meant for development, tests and single-process deployments.
+class BM25SearchBackend(SearchBackend):
+    TITLE_BOOST = 3
+
+    def __init__(self) -> None:
+        self.index = InvertedIndex()
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def _tokens(self, document: Dict[str, Any]) -> List[str]:
+        return tokenize(document.get('title')) * self.TITLE_BOOST + tokenize(load_text(document))
+
+    def _ensure_loaded(self) -> None:
+        with self.lock:
+            if self.loaded:
+                return
+            projection = {'title': 1, 'folder': 1, **{field: 1 for field in TEXT_STORAGE_FIELDS}}
+            for document in get_collection().find({}, projection):
+                self.index.add(str(document['_id']), self._tokens(document), document.get('folder'))
+            self.loaded = True
+
+    def index_document(self, document: Dict[str, Any]) -> None:
+        if not self.loaded:
+            return
+        with self.lock:
+            self.index.add(str(document['_id']), self._tokens(document), document.get('folder'))
+
+    def remove_document(self, document_id: str) -> None:
+        with self.lock:
+            self.index.remove(document_id)
+
+    def search(self, query: str, limit: int, offset: int = 0, folder: str | None = None) -> SearchPage:
+        self._ensure_loaded()
+        terms = tokenize(query)
+        with self.lock:
+            ranked = self.index.search(terms, folder)
+        page = ranked[offset:offset + limit]
+        object_ids = [parse_object_id(doc_id) for doc_id, _ in page]
+        documents = {str(document['_id']): document for document in get_collection().find({'_id': {'$in': object_ids}})}
+        results = [
+            self._result(documents[doc_id], score, terms) for doc_id, score in page if doc_id in documents
+        ]
+        next_offset = offset + limit if len(ranked) > offset + limit else None
+        return SearchPage(results=results, next_offset=next_offset)
+
+
+SEARCH_BACKENDS = {
+    'mongo': MongoTextSearchBackend,
+    'bm25': BM25SearchBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def _backend(name: str) -> SearchBackend:
+    return SEARCH_BACKENDS[name]()
+
+
+def get_search_backend() -> SearchBackend:
+    return _backend(settings.TRANSCRIPTIONS_SEARCH_BACKEND)
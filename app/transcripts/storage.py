@@ -0,0 +1,82 @@
+import re
+import zlib
+from typing import Any, Dict
+
+import gridfs
+from bson import Binary
+from django.conf import settings
+
+from core.mongo import get_mongo_db
+
+
+TEXT_STORAGE_MODES = ('inline', 'zlib', 'gridfs')
+# Fields that may hold a transcription body depending on how it was stored.
+TEXT_STORAGE_FIELDS = ('text', 'text_z', 'text_ref', 'text_storage')
+GRIDFS_BUCKET = 'transcription_texts'
+# Plain-text stand-in for compressed or GridFS bodies so they stay in the `title_text` index.
+TEXT_SEARCH_FIELD = 'text_search'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def get_text_bucket() -> gridfs.GridFS:
+    return gridfs.GridFS(get_mongo_db(), collection=GRIDFS_BUCKET)
+
+
+def target_storage(text: str, mode: str | None = None) -> str:
+    mode = mode or settings.TRANSCRIPTIONS_TEXT_STORAGE
+    if mode not in TEXT_STORAGE_MODES:
+        raise ValueError(f'Unknown text storage mode: {mode}.')
+    if mode == 'inline' or len(text.encode()) < settings.TRANSCRIPTIONS_TEXT_THRESHOLD:
+        return 'inline'
+    return mode
+
+
+def search_terms(text: str) -> str:
+    # Distinct terms in order of appearance: repetition is what makes transcripts long,
+    # so this keeps most of the vocabulary within TRANSCRIPTIONS_TEXT_SEARCH_CHARS.
+    limit = settings.TRANSCRIPTIONS_TEXT_SEARCH_CHARS
+    terms = []
+    seen = set()
+    size = 0
+    for term in TOKEN_RE.findall(text.lower()):
+        if term in seen:
+            continue
+        if size + len(term) + 1 > limit:
+            break
+        seen.add(term)
+        terms.append(term)
+        size += len(term) + 1
+    return ' '.join(terms)
+
+
+def pack_text(text: str, mode: str | None = None) -> Dict[str, Any]:
+    mode = target_storage(text, mode)
+    if mode == 'inline':
+        return {'text': text}
+    raw = text.encode()
+    if mode == 'zlib':
+        packed = {'text_z': Binary(zlib.compress(raw, settings.TRANSCRIPTIONS_TEXT_ZLIB_LEVEL)), 'text_storage': 'zlib'}
+    else:
+        packed = {'text_ref': get_text_bucket().put(raw), 'text_storage': 'gridfs'}
+    packed[TEXT_SEARCH_FIELD] = search_terms(text)
+    return packed
+
+
+def text_update(text: str, mode: str | None = None) -> Dict[str, Dict[str, Any]]:
+    packed = pack_text(text, mode)
+    unset = {field: '' for field in (*TEXT_STORAGE_FIELDS, TEXT_SEARCH_FIELD) if field not in packed}
+    return {'$set': packed, '$unset': unset}
+
+
+def load_text(document: Dict[str, Any]) -> str | None:
+    storage = document.get('text_storage')
+    if storage == 'zlib':
+        return zlib.decompress(document['text_z']).decode()
+    if storage == 'gridfs':
+        return get_text_bucket().get(document['text_ref']).read().decode()
+    return document.get('text')
+
+
+def discard_text(document: Dict[str, Any]) -> None:
+    if document.get('text_storage') == 'gridfs':
+        get_text_bucket().delete(document['text_ref'])
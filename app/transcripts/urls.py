@@ -1,8 +1,31 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import TranscriptionDetailView, TranscriptionListCreateView
+from .views import (
+    OutboxLagView,
+    TranscriptionAutocompleteView,
+    TranscriptionBulkCreateView,
+    TranscriptionDetailView,
+    TranscriptionExportView,
+    TranscriptionFacetsView,
+    TranscriptionListCreateView,
+    TranscriptionSearchView,
+)
+
+if settings.TRANSCRIPTIONS_ASYNC_VIEWS:
+    from .async_views import AsyncTranscriptionDetailView as DetailView
+    from .async_views import AsyncTranscriptionListCreateView as ListCreateView
+else:
+    DetailView = TranscriptionDetailView
+    ListCreateView = TranscriptionListCreateView
 
 urlpatterns = [
-    path('', TranscriptionListCreateView.as_view(), name='transcription-list'),
-    path('<str:pk>', TranscriptionDetailView.as_view(), name='transcription-detail'),
+    path('', ListCreateView.as_view(), name='transcription-list'),
+    path('bulk', TranscriptionBulkCreateView.as_view(), name='transcription-bulk'),
+    path('export.<str:export_format>', TranscriptionExportView.as_view(), name='transcription-export'),
+    path('autocomplete', TranscriptionAutocompleteView.as_view(), name='transcription-autocomplete'),
+    path('facets', TranscriptionFacetsView.as_view(), name='transcription-facets'),
+    path('search', TranscriptionSearchView.as_view(), name='transcription-search'),
+    path('outbox/lag', OutboxLagView.as_view(), name='transcription-outbox-lag'),
+    path('<str:pk>', DetailView.as_view(), name='transcription-detail'),
 ]
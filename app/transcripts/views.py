@@ -1,74 +1,279 @@
+import json
 from datetime import datetime
-from typing import List
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 
-from asgiref.sync import async_to_sync
 from bson import ObjectId
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from pymongo.errors import BulkWriteError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from channels.layers import get_channel_layer
-
-from core.redis import get_redis_connection, publish
-from .mongo import get_collection, parse_object_id, serialize_transcription
+from core.mongo import mongo_transaction
+from core.redis import get_redis_connection
+from .autocomplete import AUTOCOMPLETE_KINDS, complete
+from .etags import (
+    bump_list_version,
+    document_etag,
+    etag_matches,
+    list_etag,
+    list_version,
+    precondition_criteria,
+)
+from .export import EXPORT_CONTENT_TYPES, accepts_gzip, astream_export, stream_export
+from .facets import facet_counts
+from .mongo import (
+    LIST_FIELDS,
+    LIST_SORT,
+    TRANSCRIPTION_FIELDS,
+    build_list_query,
+    build_projection,
+    decode_cursor,
+    detail_projection,
+    encode_cursor,
+    get_async_collection,
+    get_collection,
+    list_projection,
+    parse_fields,
+    parse_limit,
+    parse_object_id,
+    parse_topics,
+    serialize_transcription,
+)
+from .search import get_search_backend
+from .outbox import created_event, deleted_event, outbox_lag, record_event, updated_event
 from .serializers import TranscriptionSerializer, TranscriptionUpdateSerializer
+from .storage import discard_text, pack_text, text_update
 
 
 class TranscriptionListCreateView(APIView):
     def get(self, request):
-        folder = request.query_params.get('folder')
-        topics = request.query_params.getlist('topics') or request.query_params.get('topics')
-        query = {}
-        if folder:
-            query['folder'] = folder
-        if topics:
-            if isinstance(topics, str):
-                topics = [t.strip() for t in topics.split(',') if t.strip()]
-            query['topics'] = {'$in': topics}
-        documents = list(get_collection().find(query).sort('created_at', -1))
-        return Response([serialize_transcription(doc) for doc in documents])
+        try:
+            limit = parse_limit(request.query_params.get('limit'))
+            fields = parse_fields(request.query_params.get('fields'))
+            cursor = request.query_params.get('cursor')
+            query = build_list_query(
+                folder=request.query_params.get('folder'),
+                topics=parse_topics(request.query_params),
+                cursor=decode_cursor(cursor) if cursor else None,
+            )
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        etag = list_etag(list_version(get_redis_connection()), request.query_params)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return Response(status=304, headers={'ETag': etag})
+        documents = list(
+            get_collection().find(query, list_projection(fields)).sort(LIST_SORT).limit(limit + 1)
+        )
+        next_cursor = encode_cursor(documents[limit - 1]) if len(documents) > limit else None
+        return Response(
+            {
+                'results': [serialize_transcription(doc, fields or LIST_FIELDS) for doc in documents[:limit]],
+                'next_cursor': next_cursor,
+            },
+            headers={'ETag': etag},
+        )
 
     def post(self, request):
         serializer = TranscriptionSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         payload = serializer.validated_data
-        payload['created_at'] = datetime.utcnow()
-        result = get_collection().insert_one(payload)
-        document = get_collection().find_one({'_id': result.inserted_id})
+        payload.update(pack_text(payload.pop('text')))
+        payload['created_at'] = payload['updated_at'] = datetime.utcnow()
+        payload['version'] = 1
+        written = False
+        try:
+            with mongo_transaction() as session:
+                get_collection().insert_one(payload, session=session)
+                # Without a transaction the insert stands even if recording the event fails.
+                written = session is None
+                record_event(created_event([payload]), session=session)
+        except Exception:
+            if not written:
+                # A GridFS body written by pack_text would otherwise be orphaned.
+                discard_text(payload)
+            raise
+        document = get_collection().find_one({'_id': payload['_id']})
+        get_search_backend().index_document(document)
+        bump_list_version(get_redis_connection())
         serialized = serialize_transcription(document)
-        redis_client = get_redis_connection()
-        redis_client.incr('realtime:transcriptions_count', 1)
-        publish('events:transcriptions', serialized['id'])
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            'notifications',
-            {
-                'type': 'transcription_created',
-                'data': {
-                    'id': serialized['id'],
-                    'title': serialized['title'],
-                    'created_at': serialized['created_at'],
-                },
-            },
+        return Response(serialized, status=201, headers={'ETag': document_etag(document)})
+
+
+class TranscriptionBulkCreateView(APIView):
+    NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson')
+
+    def post(self, request):
+        if request.content_type.split(';')[0].strip() in self.NDJSON_CONTENT_TYPES:
+            items = self._iter_ndjson(request.stream or [])
+        else:
+            if not isinstance(request.data, list):
+                return Response({'detail': 'Expected a JSON array of transcriptions.'}, status=400)
+            items = enumerate(request.data)
+
+        inserted_ids: List[str] = []
+        errors: List[Dict[str, Any]] = []
+        for chunk in self._chunks(items, settings.TRANSCRIPTIONS_BULK_CHUNK_SIZE):
+            chunk_documents, chunk_errors = self._insert_chunk(chunk)
+            errors.extend(chunk_errors)
+            if chunk_documents:
+                inserted_ids.extend(str(document['_id']) for document in chunk_documents)
+                for document in chunk_documents:
+                    get_search_backend().index_document(document)
+                bump_list_version(get_redis_connection())
+
+        if errors and not inserted_ids:
+            status = 400
+        elif errors:
+            status = 207
+        else:
+            status = 201
+        return Response({'inserted': len(inserted_ids), 'ids': inserted_ids, 'errors': errors}, status=status)
+
+    @staticmethod
+    def _iter_ndjson(stream: Iterable[bytes]) -> Iterator[Tuple[int, Any]]:
+        index = 0
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError:
+                yield index, None
+            index += 1
+
+    @staticmethod
+    def _chunks(items: Iterable[Tuple[int, Any]], size: int) -> Iterator[List[Tuple[int, Any]]]:
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _insert_chunk(chunk: List[Tuple[int, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        documents = []
+        positions = []
+        errors = []
+        created_at = datetime.utcnow()
+        for index, item in chunk:
+            if not isinstance(item, dict):
+                errors.append({'index': index, 'errors': {'non_field_errors': ['Invalid JSON object.']}})
+                continue
+            serializer = TranscriptionSerializer(data=item)
+            if not serializer.is_valid():
+                errors.append({'index': index, 'errors': serializer.errors})
+                continue
+            data = dict(serializer.validated_data)
+            data.update(pack_text(data.pop('text')))
+            documents.append({**data, 'created_at': created_at, 'updated_at': created_at, 'version': 1})
+            positions.append(index)
+        if not documents:
+            return [], errors
+        failed: Dict[int, str] = {}
+        try:
+            with mongo_transaction() as session:
+                try:
+                    get_collection().insert_many(documents, ordered=False, session=session)
+                except BulkWriteError as exc:
+                    if session is not None:
+                        # A write error aborts the transaction, so the whole chunk is rolled back.
+                        raise
+                    failed = {error['index']: error['errmsg'] for error in exc.details.get('writeErrors', [])}
+                inserted = [document for offset, document in enumerate(documents) if offset not in failed]
+                if inserted:
+                    record_event(created_event(inserted), session=session)
+        except BulkWriteError as exc:
+            inserted = []
+            failed = {offset: str(exc) for offset in range(len(documents))}
+        for offset, message in failed.items():
+            discard_text(documents[offset])
+            errors.append({'index': positions[offset], 'errors': {'non_field_errors': [message]}})
+        errors.sort(key=lambda error: error['index'])
+        return inserted, errors
+
+
+class TranscriptionExportView(APIView):
+    def get(self, request, export_format: str):
+        if export_format not in EXPORT_CONTENT_TYPES:
+            return Response({'detail': 'Unsupported export format.'}, status=400)
+        try:
+            fields = parse_fields(request.query_params.get('fields')) or list(TRANSCRIPTION_FIELDS)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        query = build_list_query(
+            folder=request.query_params.get('folder'),
+            topics=parse_topics(request.query_params),
+        )
+        gzip = accepts_gzip(request.headers.get('Accept-Encoding'))
+        # Under Daphne a sync iterator would be collected into a list before the first byte
+        # goes out, so ASGI requests stream from an async cursor.
+        if isinstance(request._request, ASGIRequest):
+            documents = (
+                get_async_collection()
+                .find(query, build_projection(fields), batch_size=settings.TRANSCRIPTIONS_EXPORT_BATCH_SIZE)
+                .sort(LIST_SORT)
+            )
+            content = astream_export(documents, export_format, fields, gzip=gzip)
+        else:
+            documents = (
+                get_collection()
+                .find(query, build_projection(fields), batch_size=settings.TRANSCRIPTIONS_EXPORT_BATCH_SIZE)
+                .sort(LIST_SORT)
+            )
+            content = stream_export(documents, export_format, fields, gzip=gzip)
+        response = StreamingHttpResponse(content, content_type=EXPORT_CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = f'attachment; filename="transcriptions.{export_format}"'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+
+class TranscriptionSearchView(APIView):
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'detail': 'q is required.'}, status=400)
+        try:
+            limit = parse_limit(request.query_params.get('limit'))
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        offset = request.query_params.get('offset', '0')
+        if not offset.isdigit():
+            return Response({'detail': 'offset must be a non-negative integer.'}, status=400)
+        page = get_search_backend().search(
+            query, limit=limit, offset=int(offset), folder=request.query_params.get('folder')
         )
-        return Response(serialized, status=201)
+        return Response({'results': page.results, 'next_offset': page.next_offset})
 
 
 class TranscriptionDetailView(APIView):
-    def get_object(self, pk: str):
+    def get_object(self, pk: str, projection=None):
         try:
             object_id = parse_object_id(pk)
         except ValueError:
             return None
-        document = get_collection().find_one({'_id': object_id})
-        if not document:
-            return None
-        return document
+        return get_collection().find_one({'_id': object_id}, projection)
 
     def get(self, request, pk: str):
-        document = self.get_object(pk)
+        try:
+            fields = parse_fields(request.query_params.get('fields'))
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        document = self.get_object(pk, detail_projection(fields))
         if not document:
             return Response({'detail': 'Not found.'}, status=404)
-        return Response(serialize_transcription(document))
+        etag = document_etag(document, ','.join(fields or []))
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return Response(status=304, headers={'ETag': etag})
+        return Response(serialize_transcription(document, fields), headers={'ETag': etag})
 
     def put(self, request, pk: str):
         document = self.get_object(pk)
@@ -76,13 +281,74 @@ class TranscriptionDetailView(APIView):
             return Response({'detail': 'Not found.'}, status=404)
         serializer = TranscriptionUpdateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        get_collection().update_one({'_id': document['_id']}, {'$set': serializer.validated_data})
+        criteria = precondition_criteria(request.headers.get('If-Match'), document)
+        if criteria is None:
+            return Response({'detail': 'Precondition failed.'}, status=412)
+        data = dict(serializer.validated_data)
+        update = text_update(data.pop('text'))
+        update['$set'].update(data, updated_at=datetime.utcnow())
+        update['$inc'] = {'version': 1}
+        written = False
+        try:
+            with mongo_transaction() as session:
+                result = get_collection().update_one(criteria, update, session=session)
+                written = session is None and bool(result.matched_count)
+                if result.matched_count:
+                    record_event(updated_event(document, data), session=session)
+        except Exception:
+            if not written:
+                discard_text(update['$set'])
+            raise
+        if not result.matched_count:
+            discard_text(update['$set'])
+            return Response({'detail': 'Precondition failed.'}, status=412)
+        discard_text(document)
+        bump_list_version(get_redis_connection())
         updated = get_collection().find_one({'_id': document['_id']})
-        return Response(serialize_transcription(updated))
+        get_search_backend().index_document(updated)
+        return Response(serialize_transcription(updated), headers={'ETag': document_etag(updated)})
 
     def delete(self, request, pk: str):
         document = self.get_object(pk)
         if not document:
             return Response({'detail': 'Not found.'}, status=404)
-        get_collection().delete_one({'_id': document['_id']})
+        criteria = precondition_criteria(request.headers.get('If-Match'), document)
+        if criteria is None:
+            return Response({'detail': 'Precondition failed.'}, status=412)
+        with mongo_transaction() as session:
+            result = get_collection().delete_one(criteria, session=session)
+            if result.deleted_count:
+                record_event(deleted_event(document), session=session)
+        if not result.deleted_count:
+            return Response({'detail': 'Precondition failed.'}, status=412)
+        discard_text(document)
+        bump_list_version(get_redis_connection())
+        get_search_backend().remove_document(str(document['_id']))
         return Response(status=204)
+
+
+class TranscriptionFacetsView(APIView):
+    def get(self, request):
+        return Response(facet_counts(get_redis_connection()))
+
+
+class TranscriptionAutocompleteView(APIView):
+    def get(self, request):
+        prefix = request.query_params.get('q', '').strip()
+        if not prefix:
+            return Response({'detail': 'q is required.'}, status=400)
+        kind = request.query_params.get('kind')
+        if kind and kind not in AUTOCOMPLETE_KINDS:
+            return Response({'detail': f"kind must be one of: {', '.join(AUTOCOMPLETE_KINDS)}."}, status=400)
+        limit = request.query_params.get('limit')
+        try:
+            limit = min(parse_limit(limit), settings.TRANSCRIPTIONS_AUTOCOMPLETE_MAX_LIMIT) if limit else 10
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        kinds = [kind] if kind else AUTOCOMPLETE_KINDS
+        return Response(complete(get_redis_connection(), prefix, kinds, limit))
+
+
+class OutboxLagView(APIView):
+    def get(self, request):
+        return Response(outbox_lag())
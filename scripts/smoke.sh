@@ -3,7 +3,7 @@ set -e
 
 sleep 5
 
-curl -s http://web:8000/transcriptions/ | jq '. | length'
+curl -s http://web:8000/transcriptions/ | jq '.results | length'
 
 curl -s -X POST http://web:8000/transcriptions/ \
   -H 'Content-Type: application/json' \